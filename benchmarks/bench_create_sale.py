@@ -0,0 +1,112 @@
+"""
+Benchmark for BillingSystem.create_sale.
+
+Compares the old checkout path (fresh connection, CREATE TABLE IF NOT EXISTS
+on every sale) with the current DDL-free path on a throwaway database.
+
+Usage: python -m benchmarks.bench_create_sale [sales] [items_per_sale]
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.db_connection import DatabaseConnection, close_all_pools
+from database.migrations import migrate
+from database.lots import backfill_lots
+from database.ledger import backfill_opening_balances
+from logic.billing import BillingSystem
+
+MEDICINE_COUNT = 2000
+
+
+def seed_database(db_path):
+    db = DatabaseConnection(db_path)
+    migrate(db, progress=lambda *args: None)
+    conn = db.connect()
+    conn.executemany('''
+        INSERT INTO medicines (name, price, quantity, expiry_date, manufacturer, barcode)
+        VALUES (?, ?, ?, '2030-01-01', 'Bench Pharma', ?)
+    ''', [(f"Medicine {i}", round(random.uniform(1, 200), 2), 10 ** 7, f"BC{i:08d}")
+          for i in range(MEDICINE_COUNT)])
+    # Stock inserted after the migrations still needs its lots and opening balances
+    cursor = conn.cursor()
+    backfill_lots(cursor, progress=lambda *args: None)
+    backfill_opening_balances(cursor, progress=lambda *args: None)
+    conn.commit()
+    db.close()
+
+
+def legacy_create_sale(db_path, items, vat_rate=0.15):
+    """The checkout path before the fast path: new connection and DDL per sale."""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    try:
+        subtotal = 0
+        for item in items:
+            cursor.execute('SELECT price, quantity FROM medicines WHERE id = ?', (item['medicine_id'],))
+            price, _ = cursor.fetchone()
+            subtotal += price * item['quantity']
+
+        cursor.execute("CREATE TABLE IF NOT EXISTS sales (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                       "sale_date DATETIME NOT NULL, total REAL DEFAULT 0)")
+        cursor.execute("CREATE TABLE IF NOT EXISTS sale_items (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                       "sale_id INTEGER NOT NULL, medicine_id INTEGER NOT NULL, quantity INTEGER NOT NULL)")
+        cursor.execute("INSERT INTO sales (sale_date, total) VALUES (datetime('now'), ?)",
+                       (subtotal * (1 + vat_rate),))
+        sale_id = cursor.lastrowid
+
+        for item in items:
+            cursor.execute('SELECT price FROM medicines WHERE id = ?', (item['medicine_id'],))
+            price = cursor.fetchone()[0]
+            cursor.execute('''
+                INSERT INTO sale_items (sale_id, medicine_id, quantity, unit_price, total_price)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (sale_id, item['medicine_id'], item['quantity'], price, price * item['quantity']))
+            cursor.execute('UPDATE medicines SET quantity = quantity - ? WHERE id = ?',
+                           (item['quantity'], item['medicine_id']))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def random_cart(items_per_sale):
+    ids = random.sample(range(1, MEDICINE_COUNT + 1), items_per_sale)
+    return [{'medicine_id': medicine_id, 'quantity': random.randint(1, 3)} for medicine_id in ids]
+
+
+def run(sale_count=500, items_per_sale=5):
+    random.seed(42)
+    work_dir = tempfile.mkdtemp(prefix='pharmacy_bench_')
+    db_path = os.path.join(work_dir, 'bench.db')
+    seed_database(db_path)
+    carts = [random_cart(items_per_sale) for _ in range(sale_count)]
+
+    start = time.perf_counter()
+    for cart in carts:
+        legacy_create_sale(db_path, cart)
+    legacy_elapsed = time.perf_counter() - start
+
+    billing = BillingSystem(None)
+    billing.db = DatabaseConnection(db_path)
+    start = time.perf_counter()
+    for cart in carts:
+        success, _ = billing.create_sale(cart)
+        if not success:
+            raise RuntimeError("create_sale failed during benchmark")
+    fast_elapsed = time.perf_counter() - start
+
+    close_all_pools()
+    print(f"{sale_count} sales x {items_per_sale} items")
+    print(f"  before (legacy path): {sale_count / legacy_elapsed:10.1f} sales/s")
+    print(f"  after  (fast path):   {sale_count / fast_elapsed:10.1f} sales/s")
+    return sale_count / legacy_elapsed, sale_count / fast_elapsed
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    run(*args)
@@ -0,0 +1,78 @@
+"""
+Benchmark for the medicine search used by the POS and the medicines window.
+
+Seeds a throwaway catalog and times search_medicines() for short, medium
+and long prefixes, next to the old LIKE '%term%' query.
+
+Usage: python -m benchmarks.bench_medicine_search [catalog_size]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.db_connection import DatabaseConnection, close_all_pools
+from database.migrations import migrate
+from database.search import search_medicines
+
+SYLLABLES = ['pa', 'ra', 'ce', 'ta', 'mol', 'ibu', 'pro', 'fen', 'amo', 'xi', 'cil', 'lin',
+             'met', 'for', 'min', 'ator', 'va', 'sta', 'tin', 'lo', 'sar', 'tan', 'ome', 'zole']
+CATEGORIES = ['Analgesic', 'Antibiotic', 'Vitamin', 'Cardiology', 'Dermatology', 'Respiratory']
+TERMS = ['p', 'pa', 'para', 'paracemol', 'ibupro 500', 'vita', '6200000123']
+RUNS = 20
+
+
+def random_word():
+    return ''.join(random.choice(SYLLABLES) for _ in range(random.randint(2, 4))).capitalize()
+
+
+def seed_catalog(db_path, size):
+    db = DatabaseConnection(db_path)
+    migrate(db, progress=lambda *args: None)
+    conn = db.connect()
+    conn.executemany('''
+        INSERT INTO medicines (name, price, quantity, expiry_date, manufacturer, category, barcode)
+        VALUES (?, ?, ?, '2030-01-01', ?, ?, ?)
+    ''', ((f"{random_word()} {random.choice([5, 10, 50, 100, 250, 500])}mg",
+           round(random.uniform(1, 200), 2), random.randint(0, 100),
+           f"{random_word()} Pharma", random.choice(CATEGORIES), f"62{i:011d}")
+          for i in range(size)))
+    conn.commit()
+    db.close()
+
+
+def time_query(func, runs=RUNS):
+    func()
+    start = time.perf_counter()
+    for _ in range(runs):
+        rows = func()
+    return (time.perf_counter() - start) / runs * 1000, len(rows)
+
+
+def run(catalog_size=200000):
+    random.seed(42)
+    work_dir = tempfile.mkdtemp(prefix='pharmacy_bench_')
+    db_path = os.path.join(work_dir, 'bench.db')
+    seed_catalog(db_path, catalog_size)
+
+    db = DatabaseConnection(db_path)
+    cursor = db.connect().cursor()
+    print(f"{catalog_size} medicines, POS search (in stock, 10 results)")
+    for term in TERMS:
+        fts_ms, count = time_query(lambda: search_medicines(
+            cursor, term, columns="m.id, m.name, m.price, m.quantity", in_stock_only=True, limit=10))
+        like_ms, _ = time_query(lambda: cursor.execute('''
+            SELECT id, name, price, quantity FROM medicines
+            WHERE name LIKE ? AND quantity > 0 ORDER BY name LIMIT 10
+        ''', (f"%{term}%",)).fetchall(), runs=3)
+        print(f"  {term!r:14} fts {fts_ms:8.2f} ms   like {like_ms:8.2f} ms   ({count} rows)")
+    db.close()
+    close_all_pools()
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:2]]
+    run(*args)
@@ -0,0 +1,147 @@
+"""
+Benchmark for the sales analytics behind ReportManager.generate_sales_report.
+
+Seeds a throwaway database with a year of sales and computes the same
+aggregates (daily, hourly, category and manufacturer totals, top products,
+7-day moving average and invoice percentiles) the old way, fetching rows
+and summing them in Python loops, then with SalesAnalytics loaded from
+SQLite and from a Parquet extract.
+
+Usage: python -m benchmarks.bench_sales_analytics [sales] [days]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.db_connection import DatabaseConnection, close_all_pools
+from database.migrations import migrate
+from logic.sales_analytics import SalesAnalytics
+from utils.columnar_export import export_columnar
+from utils.helpers import sale_date_range
+
+MEDICINE_COUNT = 3000
+CATEGORIES = ['Analgesic', 'Antibiotic', 'Vitamin', 'Cardiology', 'Dermatology', 'Respiratory']
+MANUFACTURERS = [f"Pharma {i}" for i in range(40)]
+START_DATE = datetime(2025, 1, 1)
+
+
+def seed_database(db_path, sale_count, days):
+    db = DatabaseConnection(db_path)
+    migrate(db, progress=lambda *args: None)
+    conn = db.connect()
+    conn.executemany('''
+        INSERT INTO medicines (name, price, quantity, expiry_date, manufacturer, category)
+        VALUES (?, ?, 1000, '2030-01-01', ?, ?)
+    ''', [(f"Medicine {i}", round(random.uniform(1, 200), 2), random.choice(MANUFACTURERS),
+           random.choice(CATEGORIES)) for i in range(MEDICINE_COUNT)])
+
+    for sale_id in range(1, sale_count + 1):
+        sale_date = START_DATE + timedelta(seconds=random.randint(0, days * 86400 - 1))
+        lines = [(sale_id, random.randint(1, MEDICINE_COUNT), random.randint(1, 3), round(random.uniform(1, 200), 2))
+                 for _ in range(random.randint(1, 5))]
+        subtotal = sum(quantity * price for _, _, quantity, price in lines)
+        conn.execute('''
+            INSERT INTO sales (id, sale_date, subtotal, vat_amount, total, status)
+            VALUES (?, ?, ?, ?, ?, 'completed')
+        ''', (sale_id, sale_date.strftime('%Y-%m-%d %H:%M:%S'), subtotal, subtotal * 0.14, subtotal * 1.14))
+        conn.executemany('''
+            INSERT INTO sale_items (sale_id, medicine_id, quantity, unit_price, total_price)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(s, m, q, p, q * p) for s, m, q, p in lines])
+    conn.commit()
+    db.close()
+
+
+def loop_report(cursor, start, end):
+    """The SQL-plus-loop path: fetch every row and aggregate in Python."""
+    cursor.execute("SELECT id, sale_date, total FROM sales WHERE sale_date >= ? AND sale_date < ?",
+                   sale_date_range(start, end))
+    daily = defaultdict(lambda: [0, 0.0])
+    hourly = defaultdict(lambda: [0, 0.0])
+    totals = []
+    for _, sale_date, total in cursor.fetchall():
+        moment = datetime.strptime(sale_date, '%Y-%m-%d %H:%M:%S')
+        daily[moment.date()][0] += 1
+        daily[moment.date()][1] += total
+        hourly[moment.hour][0] += 1
+        hourly[moment.hour][1] += total
+        totals.append(total)
+
+    cursor.execute('''
+        SELECT si.medicine_id, si.quantity, si.total_price, m.category, m.manufacturer
+        FROM sales s
+        JOIN sale_items si ON si.sale_id = s.id
+        JOIN medicines m ON m.id = si.medicine_id
+        WHERE s.sale_date >= ? AND s.sale_date < ?
+    ''', sale_date_range(start, end))
+    categories = defaultdict(float)
+    manufacturers = defaultdict(float)
+    products = defaultdict(lambda: [0, 0.0])
+    for medicine_id, quantity, total_price, category, manufacturer in cursor.fetchall():
+        categories[category] += total_price
+        manufacturers[manufacturer] += total_price
+        products[medicine_id][0] += quantity
+        products[medicine_id][1] += total_price
+    top = sorted(products.items(), key=lambda item: item[1][0], reverse=True)[:5]
+
+    day = datetime.strptime(start, '%Y-%m-%d').date()
+    last = datetime.strptime(end, '%Y-%m-%d').date()
+    series = []
+    while day <= last:
+        series.append(daily[day][1] if day in daily else 0.0)
+        day += timedelta(days=1)
+    moving = [sum(series[max(0, i - 6):i + 1]) / len(series[max(0, i - 6):i + 1]) for i in range(len(series))]
+
+    totals.sort()
+    percentiles = [totals[min(len(totals) - 1, int(p * len(totals)))] for p in (0.5, 0.9, 0.95, 0.99)] if totals else []
+    return daily, hourly, categories, manufacturers, top, moving, percentiles
+
+
+def vectorized_report(analytics):
+    return (analytics.daily_totals(), analytics.hourly_totals(), analytics.category_totals(),
+            analytics.manufacturer_totals(), analytics.top_products(5), analytics.moving_average(),
+            analytics.sale_percentiles())
+
+
+def run(sale_count=100000, days=365):
+    random.seed(42)
+    work_dir = tempfile.mkdtemp(prefix='pharmacy_bench_')
+    db_path = os.path.join(work_dir, 'bench.db')
+    seed_database(db_path, sale_count, days)
+    start = START_DATE.strftime('%Y-%m-%d')
+    end = (START_DATE + timedelta(days=days - 1)).strftime('%Y-%m-%d')
+
+    db = DatabaseConnection(db_path)
+    cursor = db.connect().cursor()
+    began = time.perf_counter()
+    loop_report(cursor, start, end)
+    loop_elapsed = time.perf_counter() - began
+    db.close()
+
+    began = time.perf_counter()
+    vectorized_report(SalesAnalytics.from_database(start, end, db))
+    vectorized_elapsed = time.perf_counter() - began
+
+    export_dir = os.path.join(work_dir, 'extract')
+    export_columnar(export_dir, db=db, progress=lambda *args: None)
+    began = time.perf_counter()
+    vectorized_report(SalesAnalytics.from_extract(export_dir, start, end))
+    extract_elapsed = time.perf_counter() - began
+
+    close_all_pools()
+    print(f"{sale_count} sales over {days} days")
+    print(f"  SQL + Python loops:      {loop_elapsed * 1000:10.1f} ms")
+    print(f"  vectorized from SQLite:  {vectorized_elapsed * 1000:10.1f} ms")
+    print(f"  vectorized from Parquet: {extract_elapsed * 1000:10.1f} ms")
+    return loop_elapsed, vectorized_elapsed, extract_elapsed
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    run(*args)
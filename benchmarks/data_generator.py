@@ -0,0 +1,228 @@
+"""
+Deterministic synthetic pharmacy data for benchmarks.
+
+Fills a database migrated to the current schema with medicines (each with
+one to three lots), customers and years of sales with their sale items
+and customer purchases, then brings the derived tables up to date: the
+daily rollups, the stock ledger's opening balances and the planner
+statistics. The same seed and sizes always produce the same rows.
+
+Rows are generated lazily and written with executemany in batches inside
+a single transaction, so a few hundred thousand sales take seconds.
+
+Usage: python -m benchmarks.data_generator db_path [--medicines N] [--customers N]
+       [--years N] [--sales-per-day N] [--seed N]
+"""
+import os
+import sys
+import random
+import argparse
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.db_connection import DatabaseConnection
+from database.migrations import migrate
+from database.rollups import rebuild_rollups
+from database.ledger import backfill_opening_balances
+
+SYLLABLES = ['pa', 'ra', 'ce', 'ta', 'mol', 'ibu', 'pro', 'fen', 'amo', 'xi', 'cil', 'lin',
+             'met', 'for', 'min', 'ator', 'va', 'sta', 'tin', 'lo', 'sar', 'tan', 'ome', 'zole']
+CATEGORIES = ['Analgesic', 'Antibiotic', 'Vitamin', 'Cardiology', 'Dermatology', 'Respiratory',
+              'Diabetes', 'Gastro']
+STRENGTHS = [5, 10, 20, 50, 100, 250, 500, 1000]
+FIRST_NAMES = ['Ahmed', 'Mohamed', 'Mahmoud', 'Omar', 'Youssef', 'Fatma', 'Mona', 'Sara', 'Nour', 'Hana']
+LAST_NAMES = ['Hassan', 'Ali', 'Ibrahim', 'Mostafa', 'Said', 'Kamel', 'Fathy', 'Nabil']
+MANUFACTURER_COUNT = 60
+VAT_RATE = 0.15
+
+# Sales dates run from here, so a dataset never depends on the day it was made
+START_DATE = date(2024, 1, 1)
+
+# Rows handed to each executemany call
+INSERT_BATCH_SIZE = 20000
+
+# Share of sales made by a registered customer
+CUSTOMER_SALE_RATE = 0.3
+
+
+def batched(rows, size=INSERT_BATCH_SIZE):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def random_word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def medicine_rows(rng, count):
+    manufacturers = [f"{random_word(rng)} Pharma" for _ in range(MANUFACTURER_COUNT)]
+    for medicine_id in range(1, count + 1):
+        yield (medicine_id, f"{random_word(rng)} {rng.choice(STRENGTHS)}mg", None,
+               round(rng.uniform(1, 300), 2), rng.choice(manufacturers), f"62{medicine_id:011d}",
+               rng.choice(CATEGORIES), rng.choice([5, 10, 20]), f"R{rng.randint(1, 40)}-S{rng.randint(1, 8)}")
+
+
+def lot_rows(rng, medicine_count, years):
+    """(medicine_id, lot_number, expiry_date, quantity) for one to three lots per medicine."""
+    horizon = (years + 2) * 365
+    for medicine_id in range(1, medicine_count + 1):
+        for lot in range(rng.randint(1, 3)):
+            expiry = START_DATE + timedelta(days=rng.randint(180, horizon))
+            yield (medicine_id, f"L{medicine_id:06d}-{lot + 1}", expiry.isoformat(), rng.randint(200, 3000))
+
+
+def customer_rows(rng, count):
+    for customer_id in range(1, count + 1):
+        yield (customer_id, f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {customer_id}",
+               f"01{rng.randint(0, 2)}{rng.randint(10 ** 7, 10 ** 8 - 1)}",
+               f"customer{customer_id}@example.com", rng.randint(0, 500))
+
+
+def sale_rows(rng, prices, customers, days, sales_per_day):
+    """
+    Yield (sale, items, purchase) per sale in date order; sale ids count up from 1.
+
+    Daily volume varies around sales_per_day, and a few medicines sell far
+    more often than the rest, as they do at a real counter.
+    """
+    medicine_count = len(prices)
+    popular = max(1, medicine_count // 20)
+    sale_id = 0
+    for day in range(days):
+        day_start = datetime.combine(START_DATE + timedelta(days=day), datetime.min.time())
+        count = rng.randint(sales_per_day // 2, sales_per_day * 3 // 2)
+        # Opening hours 08:00-23:00
+        seconds = sorted(rng.randint(8 * 3600, 23 * 3600 - 1) for _ in range(count))
+        for second in seconds:
+            sale_id += 1
+            lines = {}
+            for _ in range(rng.randint(1, 5)):
+                if rng.random() < 0.5:
+                    medicine_id = rng.randint(1, popular)
+                else:
+                    medicine_id = rng.randint(1, medicine_count)
+                lines[medicine_id] = lines.get(medicine_id, 0) + rng.randint(1, 3)
+            items = [(sale_id, medicine_id, quantity, prices[medicine_id - 1], prices[medicine_id - 1] * quantity)
+                     for medicine_id, quantity in lines.items()]
+            subtotal = sum(item[4] for item in items)
+            discount_percentage = rng.choice([0, 0, 0, 0, 5, 10])
+            discount_amount = subtotal * discount_percentage / 100
+            vat_amount = (subtotal - discount_amount) * VAT_RATE
+            sale_date = (day_start + timedelta(seconds=second)).strftime('%Y-%m-%d %H:%M:%S')
+            sale = (sale_id, sale_date, subtotal, discount_percentage, discount_amount, VAT_RATE,
+                    vat_amount, subtotal - discount_amount + vat_amount)
+            purchase = None
+            if customers and rng.random() < CUSTOMER_SALE_RATE:
+                purchase = (rng.randint(1, customers), sale_id, int(sale[-1] // 10))
+            yield sale, items, purchase
+
+
+def generate(db_path, medicines=5000, customers=2000, years=2, sales_per_day=300, seed=42, progress=print):
+    """
+    Create and fill db_path. Returns a summary dict of the sizes and the date range.
+
+    db_path must not exist yet: the generator writes ids from 1.
+    """
+    if os.path.exists(db_path):
+        raise FileExistsError(f"{db_path} already exists")
+    rng = random.Random(seed)
+    db = DatabaseConnection(db_path)
+    migrate(db, progress=lambda *args: None)
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+
+        progress(f"Generating {medicines} medicines")
+        medicine_list = list(medicine_rows(rng, medicines))
+        lots = list(lot_rows(rng, medicines, years))
+        totals, earliest = {}, {}
+        for medicine_id, _, expiry, quantity in lots:
+            totals[medicine_id] = totals.get(medicine_id, 0) + quantity
+            earliest[medicine_id] = min(earliest.get(medicine_id, expiry), expiry)
+        cursor.executemany('''
+            INSERT INTO medicines (id, name, description, price, quantity, expiry_date, manufacturer,
+                                   barcode, category, min_stock_level, location)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (row[:4] + (totals[row[0]], earliest[row[0]]) + row[4:] for row in medicine_list))
+        cursor.executemany('''
+            INSERT INTO medicine_lots (medicine_id, lot_number, expiry_date, quantity, received_date)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (lot + (START_DATE.isoformat(),) for lot in lots))
+
+        progress(f"Generating {customers} customers")
+        cursor.executemany('''
+            INSERT INTO customers (id, name, phone, email, loyalty_points) VALUES (?, ?, ?, ?, ?)
+        ''', customer_rows(rng, customers))
+
+        days = years * 365
+        prices = [row[3] for row in medicine_list]
+        sale_count = item_count = 0
+        progress(f"Generating {days} days of sales")
+        for batch in batched(sale_rows(rng, prices, customers, days, sales_per_day)):
+            cursor.executemany('''
+                INSERT INTO sales (id, sale_date, subtotal, discount_percentage, discount_amount,
+                                   vat_rate, vat_amount, total, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'completed')
+            ''', [sale for sale, _, _ in batch])
+            items = [item for _, sale_items, _ in batch for item in sale_items]
+            cursor.executemany('''
+                INSERT INTO sale_items (sale_id, medicine_id, quantity, unit_price, total_price)
+                VALUES (?, ?, ?, ?, ?)
+            ''', items)
+            cursor.executemany('''
+                INSERT INTO customer_purchases (customer_id, sale_id, points_earned) VALUES (?, ?, ?)
+            ''', [purchase for _, _, purchase in batch if purchase is not None])
+            sale_count += len(batch)
+            item_count += len(items)
+            progress("Generated sales", sale_count, None)
+
+        rebuild_rollups(cursor, progress)
+        backfill_opening_balances(cursor, progress)
+        conn.commit()
+        progress("Analyzing")
+        conn.execute("ANALYZE")
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        db.close()
+
+    return {
+        'seed': seed,
+        'medicines': medicines,
+        'lots': len(lots),
+        'customers': customers,
+        'sales': sale_count,
+        'sale_items': item_count,
+        'start_date': START_DATE.isoformat(),
+        'end_date': (START_DATE + timedelta(days=days - 1)).isoformat(),
+    }
+
+
+def print_progress(message, done=None, total=None):
+    if done is None:
+        print(message)
+    elif done % (INSERT_BATCH_SIZE * 10) == 0:
+        print(f"{message}: {done}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill a new database with synthetic pharmacy data")
+    parser.add_argument('db_path')
+    parser.add_argument('--medicines', type=int, default=5000)
+    parser.add_argument('--customers', type=int, default=2000)
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--sales-per-day', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    summary = generate(os.path.abspath(args.db_path), args.medicines, args.customers, args.years,
+                       args.sales_per_day, args.seed, print_progress)
+    print(summary)
@@ -0,0 +1,306 @@
+"""
+Load harness for checkout, search, reports and the dashboard.
+
+Each workload runs for a fixed time at 1, 4 and 16 concurrent lanes. A
+lane is a thread with its own BillingSystem, InventoryManager or report
+object, sharing the connection pool the way the counter and the
+background report workers do in the application. Every call is timed;
+the results give throughput and latency percentiles per workload and
+lane count.
+
+The connection pool is sized to the largest lane count, so lanes compete
+for the database rather than for a pooled connection; --pool-size sets it
+explicitly. Time spent waiting for a pooled connection is still reported
+on its own (pool_waits, pool_wait_ms) next to the latencies.
+
+Results are written as JSON (the dataset summary, the environment and
+one entry per workload and lane count) so runs can be compared; pass a
+previous results file with --compare to print the change.
+
+Without --db a dataset is generated into a temporary directory first.
+Checkout runs last because it adds sales.
+
+Usage: python -m benchmarks.harness [--db path] [--lanes 1,4,16] [--seconds 5]
+       [--workloads name,...] [--pool-size N] [--output results.json] [--compare previous.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import platform
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.db_connection import DatabaseConnection, get_pool, close_all_pools, DB_POOL_SIZE
+from logic.billing import BillingSystem
+from logic.inventory import InventoryManager
+from logic.reports import ReportGenerator
+from logic.report_manager import ReportManager
+from logic.catalog import MedicineCatalog
+from logic.dashboard_stats import DashboardStats
+from benchmarks.data_generator import generate, print_progress, SYLLABLES
+
+LANES = (1, 4, 16)
+SECONDS = 5.0
+PERCENTILES = (50, 90, 95, 99)
+SEED = 42
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+
+class Dataset:
+    """What the workloads need to know about the database they run against."""
+    def __init__(self, db_path, summary=None):
+        self.db_path = db_path
+        with sqlite3.connect(db_path) as conn:
+            self.medicine_ids = [row[0] for row in conn.execute(
+                "SELECT id FROM medicines WHERE is_active = 1 AND quantity > 0")]
+            sales, first, last = conn.execute(
+                "SELECT COUNT(*), MIN(date(sale_date)), MAX(date(sale_date)) FROM sales").fetchone()
+        self.first_day = date.fromisoformat(first) if first else date.today()
+        self.last_day = date.fromisoformat(last) if last else date.today()
+        self.summary = summary or {'medicines': len(self.medicine_ids), 'sales': sales,
+                                   'start_date': first, 'end_date': last}
+
+    def month(self, rng):
+        """A random 30-day (start, end) inside the sales history, as YYYY-MM-DD."""
+        span = max(0, (self.last_day - self.first_day).days - 29)
+        start = self.first_day + timedelta(days=rng.randint(0, span))
+        return start.isoformat(), (start + timedelta(days=29)).isoformat()
+
+
+# Workloads: each takes the dataset and returns a factory that builds one
+# lane's operation, op(rng), which raises or returns False on failure.
+
+def checkout(dataset):
+    def lane():
+        billing = BillingSystem(None, dataset.db_path)
+
+        def op(rng):
+            cart = [{'medicine_id': medicine_id, 'quantity': rng.randint(1, 2)}
+                    for medicine_id in rng.sample(dataset.medicine_ids, rng.randint(1, 5))]
+            return billing.create_sale(cart)[0]
+        return op
+    return lane
+
+
+def medicine_search(dataset):
+    def lane():
+        inventory = InventoryManager(None)
+        inventory.db = DatabaseConnection(dataset.db_path)
+
+        def op(rng):
+            inventory.search_medicine(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 2))))
+        return op
+    return lane
+
+
+def sales_report(dataset):
+    def lane():
+        reports = ReportGenerator(None)
+        reports.db = DatabaseConnection(dataset.db_path)
+
+        def op(rng):
+            reports.generate_sales_report(*dataset.month(rng))
+        return op
+    return lane
+
+
+def inventory_report(dataset):
+    def lane():
+        reports = ReportGenerator(None)
+        reports.db = DatabaseConnection(dataset.db_path)
+        return lambda rng: reports.generate_inventory_report()
+    return lane
+
+
+def expiry_report(dataset):
+    def lane():
+        reports = ReportGenerator(None)
+        reports.db = DatabaseConnection(dataset.db_path)
+        return lambda rng: reports.generate_expiry_alert_report(90)
+    return lane
+
+
+def sales_analytics(dataset):
+    catalog = MedicineCatalog(dataset.db_path)
+    catalog.load()
+
+    def lane():
+        manager = ReportManager(DatabaseConnection(dataset.db_path), catalog)
+        return lambda rng: manager.generate_sales_report(*dataset.month(rng))
+    return lane
+
+
+def dashboard(dataset):
+    def lane():
+        # No cache: every call reads the database
+        stats = DashboardStats(ttl=0, db_name=dataset.db_path)
+        return lambda rng: stats.get(force=True)
+    return lane
+
+
+WORKLOADS = {
+    'medicine_search': medicine_search,
+    'dashboard_stats': dashboard,
+    'inventory_report': inventory_report,
+    'expiry_report': expiry_report,
+    'sales_report': sales_report,
+    'sales_analytics': sales_analytics,
+    'create_sale': checkout,
+}
+
+
+def run_lanes(make_op, lanes, seconds, seed=SEED, pool=None):
+    """Run `lanes` threads for `seconds`. Returns the result dict for this cell."""
+    ops = [make_op() for _ in range(lanes)]
+    pool_waits = {}
+    latencies = [[] for _ in range(lanes)]
+    errors = [0] * lanes
+    clock = {}
+
+    def start_clock():
+        clock['began'] = time.perf_counter()
+        clock['deadline'] = clock['began'] + seconds
+        if pool is not None:
+            pool_waits['before'] = (pool.waits, pool.wait_time)
+
+    # Every lane is warmed up before the clock starts
+    barrier = threading.Barrier(lanes, action=start_clock)
+
+    def work(index):
+        rng = random.Random(seed + index)
+        op = ops[index]
+        op(rng)  # warm up the lane's connection and caches
+        barrier.wait()
+        timings = latencies[index]
+        while time.perf_counter() < clock['deadline']:
+            began = time.perf_counter()
+            try:
+                ok = op(rng)
+            except Exception as e:
+                print(f"Error in benchmark lane {index}: {e}")
+                ok = False
+            timings.append(time.perf_counter() - began)
+            if ok is False:
+                errors[index] += 1
+
+    threads = [threading.Thread(target=work, args=(index,), daemon=True) for index in range(lanes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - clock['began']
+    if pool is not None:
+        # Includes the last calls' checkouts, which finish after the deadline
+        waits, wait_time = pool.waits, pool.wait_time
+        pool_waits['waits'] = waits - pool_waits['before'][0]
+        pool_waits['wait_time'] = wait_time - pool_waits['before'][1]
+
+    ordered = sorted(timing for lane in latencies for timing in lane)
+    result = {
+        'lanes': lanes,
+        'ops': len(ordered),
+        'errors': sum(errors),
+        'seconds': round(elapsed, 3),
+        'throughput': round(len(ordered) / elapsed, 2) if elapsed else None,
+        'latency_ms': {f"p{p}": round(percentile(ordered, p) * 1000, 3) if ordered else None
+                       for p in PERCENTILES},
+    }
+    result['latency_ms']['max'] = round(ordered[-1] * 1000, 3) if ordered else None
+    if pool is not None:
+        result['pool_size'] = pool.max_size
+        result['pool_waits'] = pool_waits['waits']
+        result['pool_wait_ms'] = round(pool_waits['wait_time'] * 1000, 3)
+    return result
+
+
+def run(db_path=None, lanes=LANES, seconds=SECONDS, workloads=None, output=None, compare=None,
+        pool_size=None):
+    summary = None
+    if db_path is None:
+        work_dir = tempfile.mkdtemp(prefix='pharmacy_bench_')
+        db_path = os.path.join(work_dir, 'bench.db')
+        summary = generate(db_path, progress=print_progress)
+    dataset = Dataset(os.path.abspath(db_path), summary)
+
+    # One pooled connection per lane, unless asked otherwise. The pool left
+    # by generating the dataset is closed so this one is opened at that size,
+    # and it is closed again afterwards so later pools get DB_POOL_SIZE.
+    close_all_pools()
+    pool = get_pool(dataset.db_path, pool_size or max(DB_POOL_SIZE, max(lanes)))
+
+    results = []
+    try:
+        for name in workloads or WORKLOADS:
+            make_op = WORKLOADS[name](dataset)
+            for lane_count in lanes:
+                cell = run_lanes(make_op, lane_count, seconds, pool=pool)
+                cell['workload'] = name
+                results.append(cell)
+                latency = cell['latency_ms']
+                print(f"{name:17} {lane_count:3} lanes  {cell['throughput'] or 0:10.1f} ops/s  "
+                      f"p50 {latency['p50'] or 0:9.2f} ms  p95 {latency['p95'] or 0:9.2f} ms  "
+                      f"p99 {latency['p99'] or 0:9.2f} ms  pool wait {cell['pool_wait_ms']:9.1f} ms  "
+                      f"errors {cell['errors']}")
+    finally:
+        close_all_pools()
+
+    report = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'seconds_per_run': seconds,
+        'pool_size': pool.max_size,
+        'dataset': dataset.summary,
+        'results': results,
+    }
+    output = output or f"bench-results-{datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if compare:
+        compare_results(compare, report)
+    return report
+
+
+def compare_results(previous_path, current):
+    """Print throughput and p95 changes against an earlier results file."""
+    with open(previous_path, encoding='utf-8') as f:
+        previous = {(cell['workload'], cell['lanes']): cell for cell in json.load(f)['results']}
+    print(f"Compared with {previous_path}")
+    for cell in current['results']:
+        before = previous.get((cell['workload'], cell['lanes']))
+        if before is None or not before['throughput'] or not before['latency_ms']['p95']:
+            continue
+        throughput = (cell['throughput'] / before['throughput'] - 1) * 100
+        p95 = (cell['latency_ms']['p95'] / before['latency_ms']['p95'] - 1) * 100
+        print(f"{cell['workload']:17} {cell['lanes']:3} lanes  throughput {throughput:+7.1f}%  p95 {p95:+7.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure throughput and latency at several concurrent lanes")
+    parser.add_argument('--db', help="existing database to run against (it gains the benchmark's sales)")
+    parser.add_argument('--lanes', default=','.join(map(str, LANES)))
+    parser.add_argument('--seconds', type=float, default=SECONDS)
+    parser.add_argument('--workloads', help=f"comma-separated subset of {', '.join(WORKLOADS)}")
+    parser.add_argument('--pool-size', type=int, help="pooled connections (default: the largest lane count)")
+    parser.add_argument('--output')
+    parser.add_argument('--compare', help="earlier results file to compare with")
+    args = parser.parse_args()
+    run(args.db, [int(lanes) for lanes in args.lanes.split(',')], args.seconds,
+        args.workloads.split(',') if args.workloads else None, args.output, args.compare, args.pool_size)
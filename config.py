@@ -10,6 +10,14 @@ COMPANY_EMAIL = "contact@yourpharmacy.com"
 DATABASE_URL = "sqlite:///./pharmacy.db"
 BACKUP_DIRECTORY = "./backups"
 BACKUP_FREQUENCY = 24  # hours
+DB_POOL_SIZE = 8  # maximum open connections per database file
+DB_POOL_TIMEOUT = 5.0  # seconds to wait for a free connection
+DB_POOL_HEALTH_CHECK_INTERVAL = 30.0  # seconds idle before a connection is re-checked
+DB_PRAGMA_PROFILE = "performance"  # "performance", "durable" or "default"
+SALES_QUEUE_RETRY_MAX = 5.0  # seconds between attempts to record a queued sale while the database is busy
+SALES_QUEUE_COMPACT_BYTES = 1024 * 1024  # sales queue journal size that is compacted once the queue is empty
+QUERY_INSTRUMENTATION = True  # time every statement run on a pooled connection
+SLOW_QUERY_MS = 200  # statements slower than this are logged with their query plan; 0 turns the log off
 
 # User interface settings
 WINDOW_WIDTH = 1200
@@ -17,6 +25,8 @@ WINDOW_HEIGHT = 800
 FONT_FAMILY = "Arial"
 FONT_SIZE = 10
 THEME = "light"  # or "dark"
+SEARCH_DEBOUNCE_MS = 250  # pause in typing before a search runs
+DASHBOARD_CACHE_TTL = 30  # seconds dashboard statistics are reused
 
 # Business settings
 CURRENCY = "EGP"
@@ -42,6 +52,8 @@ DEFAULT_SUPPLIER_TERMS = 30  # days
 # Report settings
 REPORT_DIRECTORY = "./reports"
 DEFAULT_REPORT_FORMAT = "xlsx"
+REPORT_WORKERS = 2  # report queries and exports running at once in the background
+REPORT_HISTORY_SIZE = 50  # finished report jobs kept in the job history
 REPORT_TYPES = {
     "sales": ["daily", "weekly", "monthly", "annual"],
     "inventory": ["current", "low_stock", "expiring"],
@@ -1,36 +1,353 @@
 import sqlite3
 import os
+import threading
+import time
+import atexit
+from contextlib import contextmanager
 from pathlib import Path
+from database.instrumentation import InstrumentedConnection
+
+try:
+    from config import (DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_HEALTH_CHECK_INTERVAL,
+                        DB_PRAGMA_PROFILE, QUERY_INSTRUMENTATION)
+except ImportError:
+    # Fallback if config is not available
+    DB_POOL_SIZE = 8
+    DB_POOL_TIMEOUT = 5.0
+    DB_POOL_HEALTH_CHECK_INTERVAL = 30.0
+    DB_PRAGMA_PROFILE = "performance"
+    QUERY_INSTRUMENTATION = True
+
+# Named PRAGMA profiles applied to every pooled connection when it is opened.
+# WAL lets report readers run while the checkout counter commits sales.
+PRAGMA_PROFILES = {
+    # SQLite defaults: rollback journal, fully synchronous
+    "default": {},
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64000,  # negative means KiB, i.e. ~64 MB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    # WAL concurrency but every commit is flushed to disk
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -16000,
+        "temp_store": "MEMORY",
+        "busy_timeout": 10000,
+    },
+}
+
+# How PRAGMA values read back from SQLite for the named settings
+_PRAGMA_READBACK = {
+    "synchronous": {"OFF": 0, "NORMAL": 1, "FULL": 2, "EXTRA": 3},
+    "temp_store": {"DEFAULT": 0, "FILE": 1, "MEMORY": 2},
+}
+
+
+def apply_pragma_profile(conn, profile=DB_PRAGMA_PROFILE):
+    """Apply a named PRAGMA profile to a connection."""
+    if profile not in PRAGMA_PROFILES:
+        raise ValueError(f"Unknown database profile: {profile}")
+    for name, value in PRAGMA_PROFILES[profile].items():
+        conn.execute(f"PRAGMA {name} = {value}").fetchall()
+
+
+def verify_pragma_profile(conn, profile=DB_PRAGMA_PROFILE):
+    """Return a list of settings on the connection that differ from the profile."""
+    problems = []
+    for name, expected in PRAGMA_PROFILES.get(profile, {}).items():
+        actual = conn.execute(f"PRAGMA {name}").fetchone()[0]
+        wanted = _PRAGMA_READBACK.get(name, {}).get(expected, expected)
+        if isinstance(wanted, str):
+            matches = str(actual).lower() == wanted.lower()
+        elif name == "mmap_size":
+            # Builds may cap mmap below the requested size; only 0 means disabled
+            matches = actual > 0 or wanted == 0
+        else:
+            matches = actual == wanted
+        if not matches:
+            problems.append(f"PRAGMA {name} is {actual}, expected {expected}")
+    return problems
+
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes available in time."""
+
+
+class ConnectionPool:
+    """
+    A pool of long-lived SQLite connections for a single database file.
+
+    A thread keeps the same connection for nested checkouts, so code that
+    opens a DatabaseConnection inside another one shares the transaction.
+    Idle connections are kept open and handed to the next thread that asks.
+    """
+    def __init__(self, db_path, max_size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT,
+                 health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL,
+                 profile=DB_PRAGMA_PROFILE):
+        self.db_path = str(db_path)
+        self.profile = profile
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._local = threading.local()
+        self._condition = threading.Condition()
+        self._idle = []  # list of (connection, last_used)
+        self._owners = {}  # checked-out connection -> thread ident
+        self._size = 0
+        self._closed = False
+
+        # Checkouts that found the pool full, and the seconds they waited
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def _open(self):
+        """Open a new physical connection to the database."""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        if QUERY_INSTRUMENTATION:
+            # Statement timings and the slow-query log, see database.instrumentation
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, factory=InstrumentedConnection)
+            conn.db_path = str(self.db_path)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        try:
+            apply_pragma_profile(conn, self.profile)
+        except Exception:
+            conn.close()
+            raise
+        print(f"Successfully connected to database: {self.db_path}")
+        return conn
+
+    def _is_healthy(self, conn, last_used):
+        """Check that an idle connection can still be used."""
+        try:
+            if time.monotonic() - last_used > self.health_check_interval:
+                conn.execute("SELECT 1").fetchone()
+            else:
+                # Raises ProgrammingError if someone closed the connection
+                conn.total_changes
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._condition:
+            self._owners.pop(conn, None)
+            self._size -= 1
+            self._condition.notify()
+
+    def acquire(self):
+        """Check out a connection for the calling thread."""
+        held = getattr(self._local, 'connection', None)
+        if held is not None:
+            if self._is_healthy(held, time.monotonic()):
+                self._local.depth += 1
+                return held
+            # The caller closed the pooled connection itself; forget it
+            self._local.connection = None
+            self._discard(held)
+
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            with self._condition:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Connection pool is closed")
+                if not self._idle and self._size >= self.max_size:
+                    began = time.monotonic()
+                    try:
+                        while not self._idle and self._size >= self.max_size:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                raise PoolTimeoutError(
+                                    f"No database connection available after {self.timeout} seconds")
+                            self._condition.wait(remaining)
+                    finally:
+                        self.waits += 1
+                        self.wait_time += time.monotonic() - began
+
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._condition:
+                        self._size -= 1
+                        self._condition.notify()
+                    raise
+                break
+            if self._is_healthy(conn, last_used):
+                break
+            self._discard(conn)
+
+        with self._condition:
+            self._owners[conn] = threading.get_ident()
+        self._local.connection = conn
+        self._local.depth = 1
+        return conn
+
+    def release(self, conn):
+        """Return a connection checked out with acquire() on this thread."""
+        if getattr(self._local, 'connection', None) is not conn:
+            with self._condition:
+                owner = self._owners.get(conn)
+            if owner is not None and owner != threading.get_ident():
+                raise sqlite3.ProgrammingError(
+                    "A pooled connection was released by a thread that did not check it out")
+            # Already released, or discarded after the caller closed it
+            return
+        self._local.depth -= 1
+        if self._local.depth > 0:
+            return
+        self._local.connection = None
+
+        try:
+            # Uncommitted work is discarded, as it was when connections were closed
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+
+        with self._condition:
+            self._owners.pop(conn, None)
+            if self._closed:
+                conn.close()
+                self._size -= 1
+                return
+            self._idle.append((conn, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and back in."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """Close every idle connection and refuse new checkouts."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def verify_profile(self):
+        """Check the configured PRAGMA profile on a pooled connection."""
+        with self.connection() as conn:
+            return verify_pragma_profile(conn, self.profile)
+
+    def stats(self):
+        """Return a snapshot of the pool occupancy."""
+        with self._condition:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path, max_size=None):
+    """
+    Return the shared connection pool for a database file.
+
+    max_size (default DB_POOL_SIZE) applies when this call creates the
+    pool; asking an open pool for a different size is an error.
+    """
+    key = str(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._closed:
+            pool = ConnectionPool(key, max_size if max_size is not None else DB_POOL_SIZE)
+            _pools[key] = pool
+        elif max_size is not None and max_size != pool.max_size:
+            raise ValueError(f"The pool for {key} is already open with {pool.max_size} connections")
+        return pool
+
+
+def close_all_pools():
+    """Close all shared pools, e.g. before deleting the database file."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
+
+
+atexit.register(close_all_pools)
+
 
 class DatabaseConnection:
     """
     A class to handle database connections and operations.
+    Connections are borrowed from a shared pool and returned on close().
+    The checked-out connection is kept per thread, so an object shared
+    between threads never hands one thread's connection to another.
     """
     def __init__(self, db_name='pharmacy.db'):
         # Use Path for cross-platform compatibility
         self.db_path = Path(os.path.dirname(os.path.abspath(__file__))) / db_name
-        self.connection = None
-    
+        self._local = threading.local()
+        self.pool = get_pool(self.db_path)
+
+    @property
+    def connection(self):
+        """The connection this thread checked out with connect(), or None."""
+        return getattr(self._local, 'connection', None)
+
+    @connection.setter
+    def connection(self, conn):
+        self._local.connection = conn
+
     def connect(self):
-        """Connect to the database and return the connection object."""
+        """Check out a pooled connection and return it."""
+        if self.connection is not None:
+            return self.connection
         try:
-            # Ensure directory exists
-            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-            
-            # Connect to database
-            self.connection = sqlite3.connect(str(self.db_path))
-            print(f"Successfully connected to database: {self.db_path}")
+            self.connection = self.pool.acquire()
             return self.connection
         except sqlite3.Error as e:
             print(f"Database connection error: {e}")
             raise
-    
+
     def close(self):
-        """Close the database connection if it exists."""
+        """Return the connection to the pool if one is checked out."""
         if self.connection:
-            self.connection.close()
+            self.pool.release(self.connection)
             self.connection = None
 
+    @contextmanager
+    def checkout(self):
+        """Context manager yielding a pooled connection without touching self.connection."""
+        with self.pool.connection() as conn:
+            yield conn
+
     def execute_query(self, query, parameters=None):
         try:
             cursor = self.connection.cursor()
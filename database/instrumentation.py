@@ -0,0 +1,368 @@
+"""
+Query instrumentation for pooled connections.
+
+The pool opens its connections as InstrumentedConnection, so every
+cursor it hands out - conn.cursor(), conn.execute(), pandas reading
+through the connection - is an InstrumentedCursor. Each statement is
+recorded under its normalized SQL (literals and IN/VALUES lists folded)
+and the function that ran it, with the number of bound parameters, the
+rows it returned or changed and its wall time. Time spent fetching rows
+counts towards the statement, since SQLite does most of a SELECT's work
+while the rows are stepped through.
+
+get_query_stats().top() lists the statements that took the most time in
+this process. A statement slower than SLOW_QUERY_MS is written with its
+EXPLAIN QUERY PLAN to slow_queries.log under LOG_DIRECTORY, rotated every
+LOG_ROTATION. The plan is taken on a logger thread with its own
+connection, so a slow checkout is not made slower by logging it.
+"""
+import os
+import re
+import sys
+import queue
+import sqlite3
+import logging
+import threading
+from functools import lru_cache
+from logging.handlers import TimedRotatingFileHandler
+from time import perf_counter
+
+try:
+    from config import LOG_DIRECTORY, LOG_FORMAT, LOG_ROTATION, SLOW_QUERY_MS
+except ImportError:
+    # Fallback if config is not available
+    LOG_DIRECTORY = "./logs"
+    LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    LOG_ROTATION = "1 week"
+    SLOW_QUERY_MS = 200
+
+SLOW_QUERY_LOG = "slow_queries.log"
+
+_THIS_FILE = os.path.normcase(os.path.abspath(__file__))
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_ROW_LIST = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(sql):
+    """One-line SQL with literals replaced by ? and placeholder lists folded to (...)."""
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    return _ROW_LIST.sub('(...)', sql)
+
+
+def _caller():
+    """module.function:line of the first frame outside this module."""
+    frame = sys._getframe(2)
+    while frame is not None and os.path.normcase(frame.f_code.co_filename) == _THIS_FILE:
+        frame = frame.f_back
+    if frame is None:
+        return '?'
+    module = frame.f_globals.get('__name__', '?')
+    return f"{module}.{frame.f_code.co_name}:{frame.f_lineno}"
+
+
+def _parameter_count(parameters):
+    return len(parameters) if hasattr(parameters, '__len__') else 0
+
+
+class _CountingParameters:
+    """Wraps executemany's parameter sets to count the values bound, even from a generator."""
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.count = 0
+        self.first = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = next(self.rows)
+        if self.first is None:
+            self.first = row
+        self.count += _parameter_count(row)
+        return row
+
+
+class QueryStats:
+    """Per-statement totals for this process, keyed by (normalized SQL, caller)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def record(self, sql, caller, seconds, rows, parameters):
+        key = (normalize_sql(sql), caller)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = [1, seconds, seconds, rows, parameters]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+                entry[3] += rows
+                entry[4] += parameters
+
+    def top(self, limit=20):
+        """
+        The statements with the most total time, as dicts with sql, caller,
+        calls, total_ms, avg_ms, max_ms, rows and parameters.
+        """
+        with self._lock:
+            entries = [(key, list(entry)) for key, entry in self._entries.items()]
+        entries.sort(key=lambda item: item[1][1], reverse=True)
+        return [{
+            'sql': sql,
+            'caller': caller,
+            'calls': calls,
+            'total_ms': total * 1000,
+            'avg_ms': total / calls * 1000,
+            'max_ms': longest * 1000,
+            'rows': rows,
+            'parameters': parameters,
+        } for (sql, caller), (calls, total, longest, rows, parameters) in entries[:limit]]
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+
+    def format_top(self, limit=20):
+        """The top statements as a plain-text table."""
+        lines = [f"{'total ms':>10} {'calls':>7} {'avg ms':>9} {'max ms':>9} {'rows':>9}  caller / sql"]
+        for entry in self.top(limit):
+            lines.append(f"{entry['total_ms']:10.1f} {entry['calls']:7} {entry['avg_ms']:9.2f} "
+                         f"{entry['max_ms']:9.2f} {entry['rows']:9}  {entry['caller']}")
+            lines.append(f"{'':48}{entry['sql'][:200]}")
+        return '\n'.join(lines)
+
+
+_query_stats = QueryStats()
+
+
+def get_query_stats():
+    """The process-wide statement statistics."""
+    return _query_stats
+
+
+def _rotation(spec):
+    """TimedRotatingFileHandler (when, interval) for a LOG_ROTATION such as '1 week'."""
+    try:
+        count, unit = spec.split()
+        count = int(count)
+    except (AttributeError, ValueError):
+        return 'D', 7
+    unit = unit.lower().rstrip('s')
+    if unit == 'week':
+        return 'D', 7 * count
+    return {'minute': 'M', 'hour': 'H', 'day': 'D'}.get(unit, 'D'), count
+
+
+class SlowQueryLog:
+    """
+    Writes slow statements and their query plans from a background thread.
+
+    The plan comes from a separate read-only connection with every
+    parameter bound to NULL, which gives the same plan for the statements
+    this application runs.
+    """
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, directory=LOG_DIRECTORY):
+        self.threshold = threshold_ms / 1000 if threshold_ms else None
+        self.directory = directory
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._logger = None
+
+    def submit(self, db_path, sql, parameters, count, rows, seconds, caller):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="slow-query-log", daemon=True)
+                self._thread.start()
+        self._queue.put((db_path, sql, parameters, count, rows, seconds, caller))
+
+    def _open_logger(self):
+        os.makedirs(self.directory, exist_ok=True)
+        logger = logging.getLogger('pharmacy.slow_queries')
+        logger.setLevel(logging.WARNING)
+        logger.propagate = False
+        when, interval = _rotation(LOG_ROTATION)
+        handler = TimedRotatingFileHandler(os.path.join(self.directory, SLOW_QUERY_LOG), when=when,
+                                           interval=interval, backupCount=8, encoding='utf-8')
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger.addHandler(handler)
+        return logger
+
+    def _plan(self, connections, db_path, sql, parameters):
+        first_word = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+        if db_path is None or first_word in ('BEGIN', 'COMMIT', 'ROLLBACK', 'PRAGMA', 'ANALYZE', 'VACUUM'):
+            return "(no plan)"
+        conn = connections.get(db_path)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+            connections[db_path] = conn
+        if isinstance(parameters, dict):
+            bound = dict.fromkeys(parameters)
+        else:
+            # An executemany that ran no rows has no parameter set to go by
+            bound = [None] * (_parameter_count(parameters) or sql.count('?'))
+        try:
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", bound).fetchall()
+        except sqlite3.Error as e:
+            return f"(no plan: {e})"
+        return '\n'.join(f"    {'  ' * self._depth(rows, row)}{row[-1]}" for row in rows)
+
+    @staticmethod
+    def _depth(rows, row):
+        parents = {r[0]: r[1] for r in rows}
+        depth, parent = 0, row[1]
+        while parent in parents:
+            depth, parent = depth + 1, parents[parent]
+        return depth
+
+    def _work(self):
+        connections = {}
+        while True:
+            db_path, sql, parameters, count, rows, seconds, caller = self._queue.get()
+            try:
+                if self._logger is None:
+                    self._logger = self._open_logger()
+                plan = self._plan(connections, db_path, sql, parameters)
+                self._logger.warning(
+                    f"Slow query: {seconds * 1000:.1f} ms, {rows} rows, "
+                    f"{count} parameters, from {caller}\n"
+                    f"    {normalize_sql(sql)}\n{plan}")
+            except Exception as e:
+                print(f"Error writing slow query log: {e}")
+
+
+_slow_query_log = SlowQueryLog()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """A cursor that times its statements and reports them to the query stats."""
+    _statement = None
+
+    def _finish(self):
+        statement = self._statement
+        if statement is None:
+            return
+        self._statement = None
+        sql, caller, seconds, rows, parameters, count = statement
+        _query_stats.record(sql, caller, seconds, rows, count)
+        if _slow_query_log.threshold is not None and seconds >= _slow_query_log.threshold:
+            _slow_query_log.submit(getattr(self.connection, 'db_path', None), sql, parameters, count,
+                                   rows, seconds, caller)
+
+    def _start(self, sql, parameters, seconds, caller, failed=False):
+        self._statement = [sql, caller, seconds, 0, parameters, _parameter_count(parameters)]
+        if failed or self.description is None:
+            # Nothing to fetch: a write, DDL or PRAGMA without results
+            self._statement[3] = max(self.rowcount, 0)
+            self._finish()
+
+    def _fetched(self, seconds, rows, done):
+        statement = self._statement
+        if statement is not None:
+            statement[2] += seconds
+            statement[3] += rows
+            if done:
+                self._finish()
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        caller = _caller()
+        began = perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except Exception:
+            self._start(sql, parameters, perf_counter() - began, caller, failed=True)
+            raise
+        self._start(sql, parameters, perf_counter() - began, caller)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        caller = _caller()
+        counted = _CountingParameters(seq_of_parameters)
+        began = perf_counter()
+        try:
+            super().executemany(sql, counted)
+        finally:
+            # The first parameter set stands in for all of them in the plan
+            self._statement = [sql, caller, perf_counter() - began, max(self.rowcount, 0),
+                               counted.first if counted.first is not None else (), counted.count]
+            self._finish()
+        return self
+
+    def executescript(self, sql_script):
+        self._finish()
+        caller = _caller()
+        began = perf_counter()
+        try:
+            super().executescript(sql_script)
+        finally:
+            self._statement = [sql_script, caller, perf_counter() - began, 0, (), 0]
+            self._finish()
+        return self
+
+    def fetchone(self):
+        began = perf_counter()
+        row = super().fetchone()
+        self._fetched(perf_counter() - began, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        began = perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(perf_counter() - began, len(rows), not rows)
+        return rows
+
+    def fetchall(self):
+        began = perf_counter()
+        rows = super().fetchall()
+        self._fetched(perf_counter() - began, len(rows), True)
+        return rows
+
+    def __next__(self):
+        began = perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(perf_counter() - began, 0, True)
+            raise
+        self._fetched(perf_counter() - began, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Cursors are often dropped after a single fetchone()
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """A connection whose cursors, including those of execute(), are instrumented."""
+    db_path = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
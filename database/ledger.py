@@ -0,0 +1,277 @@
+"""
+Append-only stock ledger.
+
+stock_ledger has one row per stock movement: a sale, a receipt, a manual
+adjustment, an expiry write-off, plus the opening balances migration 10
+took from the existing stock. quantity is signed, so a medicine's stock
+is the sum of its rows. Rows are never updated or deleted.
+
+Movements are written through a LedgerWriter, which buffers rows and
+inserts them with one executemany per batch inside the caller's
+transaction: a sale of twenty lines is one statement, and a rolled back
+sale leaves no ledger rows behind. The lot functions in database.lots
+record their own movements, so every path that changes stock is covered.
+
+stock_ledger_balances folds the ledger into per-medicine totals up to a
+checkpoint. verify_stock() compares medicines.quantity with the balance
+plus the rows written since, so it reads the medicines and the ledger
+tail rather than the whole history. rebuild_stock() puts
+medicines.quantity and the lot quantities back from the ledger.
+
+Run `python -m database.ledger` to verify, or with --rebuild to repair.
+"""
+import sys
+from contextlib import nullcontext
+from database.db_connection import DatabaseConnection
+
+MOVEMENT_OPENING = 'opening'
+MOVEMENT_SALE = 'sale'
+MOVEMENT_RECEIPT = 'receipt'
+MOVEMENT_ADJUSTMENT = 'adjustment'
+MOVEMENT_EXPIRY = 'expiry'
+
+STOCK_LEDGER_SQL = '''
+    CREATE TABLE IF NOT EXISTS stock_ledger (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        medicine_id INTEGER NOT NULL,
+        lot_id INTEGER,
+        movement TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        reference INTEGER,
+        username TEXT,
+        reason TEXT,
+        created_at TEXT NOT NULL DEFAULT (datetime('now')),
+        FOREIGN KEY (medicine_id) REFERENCES medicines (id),
+        FOREIGN KEY (lot_id) REFERENCES medicine_lots (id)
+    )
+'''
+
+STOCK_LEDGER_BALANCES_SQL = '''
+    CREATE TABLE IF NOT EXISTS stock_ledger_balances (
+        medicine_id INTEGER PRIMARY KEY,
+        quantity INTEGER NOT NULL,
+        through_id INTEGER NOT NULL
+    ) WITHOUT ROWID
+'''
+
+INSERT_MOVEMENT_SQL = '''
+    INSERT INTO stock_ledger (medicine_id, lot_id, movement, quantity, reference, username, reason)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Movements buffered before they are written; a flush is one executemany
+LEDGER_BATCH_SIZE = 500
+
+
+def create_ledger_tables(cursor):
+    cursor.execute(STOCK_LEDGER_SQL)
+    cursor.execute(STOCK_LEDGER_BALANCES_SQL)
+    # Covering: per-medicine sums never touch the table rows
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_stock_ledger_medicine ON stock_ledger (medicine_id, quantity)")
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_stock_ledger_lot
+        ON stock_ledger (lot_id, quantity) WHERE lot_id IS NOT NULL
+    ''')
+
+
+class LedgerWriter:
+    """
+    Buffers stock movements and writes them in batches on the given cursor.
+
+    Nothing is committed here; the rows become durable with the caller's
+    transaction. Use it as a context manager, or call flush() before
+    committing. username, reason and reference are defaults for every
+    movement recorded through this writer.
+    """
+    def __init__(self, cursor, username=None, reason=None, reference=None, batch_size=LEDGER_BATCH_SIZE):
+        self.cursor = cursor
+        self.username = username
+        self.reason = reason
+        self.reference = reference
+        self.batch_size = batch_size
+        self._pending = []
+
+    def record(self, medicine_id, movement, quantity, lot_id=None, reference=None, reason=None):
+        """Add a movement of quantity units (negative when stock leaves)."""
+        if not quantity:
+            return
+        self._pending.append((medicine_id, lot_id, movement, quantity,
+                              reference if reference is not None else self.reference,
+                              self.username, reason if reason is not None else self.reason))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.cursor.executemany(INSERT_MOVEMENT_SQL, self._pending)
+            self._pending = []
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # On an error the caller rolls back; drop what was never written
+        if exc_type is None:
+            self.flush()
+        else:
+            self._pending = []
+
+
+def ledger_for(cursor, ledger=None):
+    """
+    The caller's writer, left for the caller to flush, or a new writer that
+    flushes when the with block ends.
+    """
+    return nullcontext(ledger) if ledger is not None else LedgerWriter(cursor)
+
+
+def backfill_opening_balances(cursor, progress=print):
+    """Record the current stock as opening movements: one per lot, plus stock the lots don't hold."""
+    progress("Recording opening stock balances")
+    cursor.execute('''
+        INSERT INTO stock_ledger (medicine_id, lot_id, movement, quantity, reason)
+        SELECT medicine_id, id, ?, quantity, 'رصيد افتتاحي'
+        FROM medicine_lots
+        WHERE quantity > 0
+        ORDER BY medicine_id, id
+    ''', (MOVEMENT_OPENING,))
+    cursor.execute('''
+        INSERT INTO stock_ledger (medicine_id, lot_id, movement, quantity, reason)
+        SELECT m.id, NULL, ?, m.quantity - COALESCE(l.quantity, 0), 'رصيد افتتاحي'
+        FROM medicines m
+        LEFT JOIN (
+            SELECT medicine_id, SUM(quantity) AS quantity
+            FROM medicine_lots
+            GROUP BY medicine_id
+        ) l ON l.medicine_id = m.id
+        WHERE m.quantity != COALESCE(l.quantity, 0)
+    ''', (MOVEMENT_OPENING,))
+    checkpoint_ledger(cursor)
+
+
+def _checkpoint_id(cursor):
+    cursor.execute("SELECT COALESCE(MAX(through_id), 0) FROM stock_ledger_balances")
+    return cursor.fetchone()[0]
+
+
+def checkpoint_ledger(cursor):
+    """Fold the rows written since the last checkpoint into stock_ledger_balances."""
+    cursor.execute("SELECT MAX(id) FROM stock_ledger")
+    through_id = cursor.fetchone()[0]
+    if through_id is None:
+        return
+    cursor.execute('''
+        INSERT INTO stock_ledger_balances (medicine_id, quantity, through_id)
+        SELECT medicine_id, SUM(quantity), ?
+        FROM stock_ledger
+        WHERE id > ? AND id <= ?
+        GROUP BY medicine_id
+        ON CONFLICT (medicine_id) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            through_id = excluded.through_id
+    ''', (through_id, _checkpoint_id(cursor), through_id))
+    cursor.execute("UPDATE stock_ledger_balances SET through_id = ?", (through_id,))
+
+
+def verify_stock(cursor):
+    """
+    Medicines whose quantity disagrees with their ledger.
+
+    Returns [(medicine_id, quantity, ledger_quantity), ...], empty when the
+    two agree. Reads the checkpointed balances and the rows written since.
+    """
+    cursor.execute('''
+        WITH recent AS (
+            SELECT medicine_id, SUM(quantity) AS quantity
+            FROM stock_ledger
+            WHERE id > (SELECT COALESCE(MAX(through_id), 0) FROM stock_ledger_balances)
+            GROUP BY medicine_id
+        )
+        SELECT m.id, m.quantity, COALESCE(b.quantity, 0) + COALESCE(r.quantity, 0) AS ledger_quantity
+        FROM medicines m
+        LEFT JOIN stock_ledger_balances b ON b.medicine_id = m.id
+        LEFT JOIN recent r ON r.medicine_id = m.id
+        WHERE m.quantity != COALESCE(b.quantity, 0) + COALESCE(r.quantity, 0)
+        ORDER BY m.id
+    ''')
+    return cursor.fetchall()
+
+
+def rebuild_stock(cursor, progress=print):
+    """
+    Set medicines.quantity and every lot's quantity to the sums of their
+    ledger rows, then refresh the earliest expiries. Returns the ids of
+    medicines whose quantity changed.
+    """
+    # database.lots records its movements through this module
+    from database.lots import sync_medicines
+
+    mismatched = [row[0] for row in verify_stock(cursor)]
+    progress("Rebuilding lot stock from the ledger")
+    cursor.execute('''
+        UPDATE medicine_lots SET quantity = (
+            SELECT COALESCE(SUM(quantity), 0) FROM stock_ledger WHERE lot_id = medicine_lots.id
+        )
+        WHERE EXISTS (SELECT 1 FROM stock_ledger WHERE lot_id = medicine_lots.id)
+    ''')
+    progress("Rebuilding medicine stock from the ledger")
+    cursor.execute('''
+        UPDATE medicines SET quantity = (
+            SELECT COALESCE(SUM(quantity), 0) FROM stock_ledger WHERE medicine_id = medicines.id
+        )
+    ''')
+    cursor.execute("SELECT id FROM medicines")
+    sync_medicines(cursor, [row[0] for row in cursor.fetchall()], quantity=False)
+
+    cursor.execute("DELETE FROM stock_ledger_balances")
+    checkpoint_ledger(cursor)
+    return mismatched
+
+
+def stock_movements(cursor, medicine_id, limit=100):
+    """A medicine's latest movements as (created_at, movement, quantity, lot_id, reference, username, reason)."""
+    cursor.execute('''
+        SELECT created_at, movement, quantity, lot_id, reference, username, reason
+        FROM stock_ledger
+        WHERE medicine_id = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (medicine_id, limit))
+    return cursor.fetchall()
+
+
+def check(db=None, rebuild=False, progress=print):
+    """Verify (and optionally rebuild) stock against the ledger in one transaction. Returns (success, message)."""
+    db = db or DatabaseConnection()
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        if conn.in_transaction:
+            conn.commit()
+        cursor.execute("BEGIN IMMEDIATE")
+        if rebuild:
+            mismatched = rebuild_stock(cursor, progress)
+            conn.commit()
+            return True, f"تم إعادة بناء المخزون من سجل الحركات ({len(mismatched)} دواء تم تصحيحه)"
+        checkpoint_ledger(cursor)
+        mismatched = verify_stock(cursor)
+        conn.commit()
+        for medicine_id, quantity, ledger_quantity in mismatched:
+            progress(f"Medicine {medicine_id}: stock {quantity}, ledger {ledger_quantity}")
+        if mismatched:
+            return False, f"المخزون لا يطابق سجل الحركات في {len(mismatched)} دواء"
+        return True, "المخزون مطابق لسجل الحركات"
+    except Exception as e:
+        if conn.in_transaction:
+            conn.rollback()
+        print(f"Error checking stock ledger: {e}")
+        return False, f"حدث خطأ أثناء مراجعة سجل حركات المخزون: {str(e)}"
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print(check(rebuild='--rebuild' in sys.argv[1:])[1])
@@ -0,0 +1,275 @@
+"""
+Lot (batch) level stock.
+
+medicine_lots keeps each received batch with its own quantity and expiry
+date, so a new shipment no longer overwrites the expiry of stock that is
+still on the shelf. medicines.quantity stays the total over a medicine's
+lots and medicines.expiry_date the earliest expiry among lots with stock;
+listings, the catalog and the alerts keep working per medicine, and every
+function here that changes lots brings those two columns back in step in
+the caller's transaction.
+
+Checkout allocates first-expiry-first-out over idx_medicine_lots_fefo, a
+partial index on (medicine_id, expiry_date, quantity) WHERE quantity > 0.
+Empty lots drop out of the index, so finding the next lot is one seek
+however many lots a medicine has had. sale_item_lots records which lots
+each sale took from.
+
+Every function here that moves stock records the movement in the stock
+ledger (database.ledger). Pass a LedgerWriter as ledger= to batch the
+movements of several calls and say who made them; without one, each call
+writes its own movements before returning.
+"""
+from database.ledger import (ledger_for, MOVEMENT_SALE, MOVEMENT_RECEIPT, MOVEMENT_ADJUSTMENT,
+                             MOVEMENT_EXPIRY)
+
+MEDICINE_LOTS_SQL = '''
+    CREATE TABLE IF NOT EXISTS medicine_lots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        medicine_id INTEGER NOT NULL,
+        lot_number TEXT,
+        expiry_date DATE NOT NULL,
+        quantity INTEGER NOT NULL CHECK (quantity >= 0),
+        received_date TEXT NOT NULL DEFAULT (datetime('now')),
+        FOREIGN KEY (medicine_id) REFERENCES medicines (id)
+    )
+'''
+
+SALE_ITEM_LOTS_SQL = '''
+    CREATE TABLE IF NOT EXISTS sale_item_lots (
+        sale_id INTEGER NOT NULL,
+        medicine_id INTEGER NOT NULL,
+        lot_id INTEGER,
+        quantity INTEGER NOT NULL,
+        FOREIGN KEY (sale_id) REFERENCES sales (id),
+        FOREIGN KEY (lot_id) REFERENCES medicine_lots (id)
+    )
+'''
+
+# Lots a medicine still has stock in, earliest expiry first. Lots expiring the
+# same day go smallest first, which is also the index order, so no sort is needed
+FEFO_LOTS_SQL = '''
+    SELECT id, quantity
+    FROM medicine_lots
+    WHERE medicine_id = ? AND quantity > 0
+    ORDER BY expiry_date, quantity, id
+'''
+
+# Lots read per round trip while allocating; most lines are filled by the first lot
+ALLOCATION_BATCH = 8
+
+
+def create_lot_tables(cursor):
+    cursor.execute(MEDICINE_LOTS_SQL)
+    cursor.execute(SALE_ITEM_LOTS_SQL)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_medicine_lots_fefo
+        ON medicine_lots (medicine_id, expiry_date, quantity) WHERE quantity > 0
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_medicine_lots_expiry ON medicine_lots (expiry_date) WHERE quantity > 0")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sale_item_lots_sale_id ON sale_item_lots (sale_id)")
+
+
+def backfill_lots(cursor, progress=print):
+    """Give every medicine with stock and no lots one lot holding its current stock."""
+    progress("Creating opening lots from medicine stock")
+    cursor.execute('''
+        INSERT INTO medicine_lots (medicine_id, lot_number, expiry_date, quantity)
+        SELECT id, NULL, expiry_date, quantity
+        FROM medicines
+        WHERE quantity > 0
+        AND NOT EXISTS (SELECT 1 FROM medicine_lots l WHERE l.medicine_id = medicines.id)
+    ''')
+
+
+def _placeholders(values):
+    return ', '.join('?' * len(values))
+
+
+def sync_medicines(cursor, medicine_ids, quantity=True):
+    """
+    Recompute medicines.quantity and expiry_date from their lots.
+
+    With quantity=False only the expiry is refreshed, for callers that
+    already adjusted the total. Returns {medicine_id: (quantity, expiry_date)}.
+    """
+    medicine_ids = list(medicine_ids)
+    if not medicine_ids:
+        return {}
+    quantity_sql = '''quantity = (
+            SELECT COALESCE(SUM(quantity), 0) FROM medicine_lots
+            WHERE medicine_id = medicines.id AND quantity > 0
+        ),''' if quantity else ''
+    # With no stock left, keep the last known expiry rather than NULL
+    cursor.execute(f'''
+        UPDATE medicines SET
+            {quantity_sql}
+            expiry_date = COALESCE((
+                SELECT MIN(expiry_date) FROM medicine_lots
+                WHERE medicine_id = medicines.id AND quantity > 0
+            ), expiry_date)
+        WHERE id IN ({_placeholders(medicine_ids)})
+    ''', medicine_ids)
+    cursor.execute(f"SELECT id, quantity, expiry_date FROM medicines WHERE id IN ({_placeholders(medicine_ids)})",
+                   medicine_ids)
+    return {medicine_id: (total, expiry) for medicine_id, total, expiry in cursor.fetchall()}
+
+
+def receive_lot(cursor, medicine_id, quantity, expiry_date, lot_number=None, sync=True,
+                ledger=None, movement=MOVEMENT_RECEIPT):
+    """
+    Add a received batch. Returns the new lot id.
+
+    With sync the medicine's total and earliest expiry are updated too;
+    pass sync=False when the caller already counted the quantity.
+    """
+    cursor.execute('''
+        INSERT INTO medicine_lots (medicine_id, lot_number, expiry_date, quantity)
+        VALUES (?, ?, ?, ?)
+    ''', (medicine_id, lot_number, expiry_date, quantity))
+    lot_id = cursor.lastrowid
+    with ledger_for(cursor, ledger) as ledger:
+        ledger.record(medicine_id, movement, quantity, lot_id)
+    if sync:
+        cursor.execute("UPDATE medicines SET quantity = quantity + ? WHERE id = ?", (quantity, medicine_id))
+        sync_medicines(cursor, [medicine_id], quantity=False)
+    return lot_id
+
+
+def allocate_fefo(cursor, medicine_id, quantity, ledger=None, movement=MOVEMENT_SALE, reference=None):
+    """
+    Take quantity from a medicine's lots, earliest expiry first.
+
+    Returns [(lot_id, quantity), ...]. Stock the lots can't cover (written
+    to medicines.quantity outside this module) comes back as (None, rest)
+    rather than failing the sale; medicines.quantity is the stock check.
+    """
+    allocations = []
+    remaining = quantity
+    reader = cursor.connection.cursor()
+    reader.execute(FEFO_LOTS_SQL, (medicine_id,))
+    while remaining > 0:
+        lots = reader.fetchmany(ALLOCATION_BATCH)
+        if not lots:
+            break
+        for lot_id, available in lots:
+            take = min(available, remaining)
+            allocations.append((lot_id, take))
+            remaining -= take
+            if not remaining:
+                break
+    reader.close()
+
+    # Update after the read cursor is done: emptied lots leave the index it walks
+    cursor.executemany("UPDATE medicine_lots SET quantity = quantity - ? WHERE id = ?",
+                       [(take, lot_id) for lot_id, take in allocations])
+    if remaining:
+        print(f"Lots of medicine {medicine_id} are {remaining} short of its stock; sale recorded without a lot")
+        allocations.append((None, remaining))
+    with ledger_for(cursor, ledger) as ledger:
+        for lot_id, take in allocations:
+            ledger.record(medicine_id, movement, -take, lot_id, reference)
+    return allocations
+
+
+def allocate_sale(cursor, sale_id, lines, ledger=None):
+    """
+    Allocate every cart line ({medicine_id: quantity}) to lots and record it.
+
+    Runs in the sale's transaction after medicines.quantity was reserved.
+    Returns ({medicine_id: expiry_date}, {lot_id: quantity}): each medicine's
+    new earliest expiry, and what was taken from each lot.
+    """
+    rows = []
+    # One ledger batch for the whole cart
+    with ledger_for(cursor, ledger) as ledger:
+        for medicine_id, quantity in lines.items():
+            rows.extend((sale_id, medicine_id, lot_id, taken)
+                        for lot_id, taken in allocate_fefo(cursor, medicine_id, quantity, ledger,
+                                                           MOVEMENT_SALE, sale_id))
+    cursor.executemany('''
+        INSERT INTO sale_item_lots (sale_id, medicine_id, lot_id, quantity) VALUES (?, ?, ?, ?)
+    ''', rows)
+    synced = sync_medicines(cursor, lines, quantity=False)
+    taken = {}
+    for _, _, lot_id, quantity in rows:
+        if lot_id is not None:
+            taken[lot_id] = taken.get(lot_id, 0) + quantity
+    return {medicine_id: expiry for medicine_id, (_, expiry) in synced.items()}, taken
+
+
+def set_stock(cursor, medicine_id, new_quantity, ledger=None):
+    """
+    Set a medicine's stock to new_quantity for a manual stock count.
+
+    A shortfall is written off the lots first-expiry-first-out. Extra stock
+    goes into a lot with the medicine's current expiry; use receive_lot()
+    for shipments with their own expiry. Returns the medicine's (quantity, expiry_date).
+    """
+    cursor.execute("SELECT quantity, expiry_date FROM medicines WHERE id = ?", (medicine_id,))
+    row = cursor.fetchone()
+    if row is None:
+        raise ValueError(f"Medicine {medicine_id} does not exist")
+    old_quantity, expiry_date = row
+    delta = new_quantity - old_quantity
+    if delta < 0:
+        allocate_fefo(cursor, medicine_id, -delta, ledger, MOVEMENT_ADJUSTMENT)
+    elif delta > 0:
+        receive_lot(cursor, medicine_id, delta, expiry_date, sync=False, ledger=ledger, movement=MOVEMENT_ADJUSTMENT)
+    # The ledger moved by delta, so the total does too, whatever the lots held
+    cursor.execute("UPDATE medicines SET quantity = ? WHERE id = ?", (new_quantity, medicine_id))
+    return sync_medicines(cursor, [medicine_id], quantity=False)[medicine_id]
+
+
+def write_off_expired(cursor, medicine_ids=None, ledger=None, today=None):
+    """
+    Empty the lots that expired before today (YYYY-MM-DD, default the
+    current date), optionally only those of medicine_ids.
+
+    Returns {medicine_id: (quantity, expiry_date)} for the medicines touched.
+    """
+    condition, params = "quantity > 0 AND expiry_date < COALESCE(?, date('now'))", [today]
+    if medicine_ids is not None:
+        medicine_ids = list(medicine_ids)
+        condition += f" AND medicine_id IN ({_placeholders(medicine_ids)})"
+        params.extend(medicine_ids)
+    cursor.execute(f"SELECT id, medicine_id, quantity FROM medicine_lots WHERE {condition}", params)
+    lots = cursor.fetchall()
+    if not lots:
+        return {}
+
+    written_off = {}
+    with ledger_for(cursor, ledger) as ledger:
+        for lot_id, medicine_id, quantity in lots:
+            ledger.record(medicine_id, MOVEMENT_EXPIRY, -quantity, lot_id)
+            written_off[medicine_id] = written_off.get(medicine_id, 0) + quantity
+    cursor.executemany("UPDATE medicine_lots SET quantity = 0 WHERE id = ?", [(lot_id,) for lot_id, _, _ in lots])
+    cursor.executemany("UPDATE medicines SET quantity = quantity - ? WHERE id = ?",
+                       [(quantity, medicine_id) for medicine_id, quantity in written_off.items()])
+    return sync_medicines(cursor, written_off, quantity=False)
+
+
+def correct_expiry(cursor, medicine_id, expiry_date):
+    """
+    Apply an edit of medicines.expiry_date to the lots it was showing.
+
+    Lots with stock that carry the medicine's current (earliest) expiry
+    get the new date; call before updating medicines and sync after.
+    """
+    cursor.execute('''
+        UPDATE medicine_lots SET expiry_date = ?
+        WHERE medicine_id = ? AND quantity > 0
+        AND expiry_date = (SELECT expiry_date FROM medicines WHERE id = ?)
+    ''', (expiry_date, medicine_id, medicine_id))
+
+
+def medicine_lots(cursor, medicine_id, in_stock_only=True):
+    """A medicine's lots as (id, lot_number, expiry_date, quantity, received_date), FEFO order."""
+    condition = " AND quantity > 0" if in_stock_only else ""
+    cursor.execute(f'''
+        SELECT id, lot_number, expiry_date, quantity, received_date
+        FROM medicine_lots
+        WHERE medicine_id = ?{condition}
+        ORDER BY expiry_date, id
+    ''', (medicine_id,))
+    return cursor.fetchall()
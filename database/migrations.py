@@ -0,0 +1,288 @@
+"""
+Versioned schema migrations keyed on SQLite's PRAGMA user_version.
+
+Each migration runs once, in order, inside its own transaction and then
+bumps user_version. A database that is already current costs a single
+PRAGMA read, so migrate() can be called on every startup.
+"""
+from database.db_connection import DatabaseConnection
+from database.models import create_base_tables, SALES_TABLE_SQL, SALE_ITEMS_TABLE_SQL
+from database.rollups import rebuild_rollups
+from database.lots import create_lot_tables, backfill_lots
+from database.ledger import create_ledger_tables, backfill_opening_balances
+
+# Rows copied per statement when a large table has to be rebuilt
+MIGRATION_BATCH_SIZE = 5000
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register a migration function for the given schema version."""
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return func
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def get_schema_version(conn):
+    """Read the schema version stored in the database header."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def print_progress(message, done=None, total=None):
+    """Default progress callback for migrations."""
+    if total:
+        print(f"{message}: {done}/{total}")
+    else:
+        print(message)
+
+
+def table_columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [column[1] for column in cursor.fetchall()]
+
+
+def table_exists(cursor, table):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,))
+    return cursor.fetchone() is not None
+
+
+def rebuild_table(cursor, table, create_sql, column_exprs, progress):
+    """
+    Recreate a table with a new definition, copying rows in id batches.
+
+    column_exprs maps each target column to the SQL expression that reads it
+    from the old table, so missing columns can be filled from estimates.
+    """
+    new_table = f"{table}_new"
+    cursor.execute(f"DROP TABLE IF EXISTS {new_table}")
+    cursor.execute(create_sql.format(name=new_table))
+
+    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+    total = cursor.fetchone()[0]
+    targets = ', '.join(column_exprs)
+    sources = ', '.join(column_exprs.values())
+
+    last_id = 0
+    copied = 0
+    while True:
+        cursor.execute(f'''
+            INSERT INTO {new_table} ({targets})
+            SELECT {sources} FROM {table}
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (last_id, MIGRATION_BATCH_SIZE))
+        if cursor.rowcount <= 0:
+            break
+        copied += cursor.rowcount
+        cursor.execute(f"SELECT MAX(id) FROM {new_table}")
+        last_id = cursor.fetchone()[0]
+        progress(f"Rebuilding {table}", copied, total)
+
+    cursor.execute(f"DROP TABLE {table}")
+    cursor.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+
+
+@migration(1, "Baseline tables and medicine columns")
+def _baseline(cursor, progress):
+    create_base_tables(cursor)
+
+    # Databases created before these columns existed
+    med_columns = table_columns(cursor, 'medicines')
+    for column, definition in [
+        ('barcode', 'TEXT'),
+        ('category', 'TEXT'),
+        ('min_stock_level', 'INTEGER DEFAULT 10'),
+        ('location', 'TEXT'),
+        ('is_active', 'BOOLEAN DEFAULT 1'),
+    ]:
+        if column not in med_columns:
+            cursor.execute(f"ALTER TABLE medicines ADD COLUMN {column} {definition}")
+            progress(f"Added medicines.{column}")
+
+
+@migration(2, "Rebuild sales and sale_items with the full column set")
+def _sales_columns(cursor, progress):
+    sales_columns = table_columns(cursor, 'sales')
+    required = ['subtotal', 'discount_percentage', 'discount_amount',
+                'vat_rate', 'vat_amount', 'total', 'status']
+    if any(column not in sales_columns for column in required):
+        total = 'COALESCE(total, 0)' if 'total' in sales_columns else '0'
+        # Old rows only kept the total; estimate the pre-VAT amounts from it
+        subtotal = 'subtotal' if 'subtotal' in sales_columns else f'{total} / 1.15'
+        exprs = {'id': 'id', 'sale_date': 'sale_date', 'subtotal': subtotal, 'total': total}
+        exprs['vat_amount'] = ('vat_amount' if 'vat_amount' in sales_columns
+                               else f'{total} - {total} / 1.15')
+        for column in ['discount_percentage', 'discount_amount', 'vat_rate', 'status']:
+            if column in sales_columns:
+                exprs[column] = column
+        # Tables from before sales had a status only held finished sales
+        exprs.setdefault('status', "'completed'")
+        rebuild_table(cursor, 'sales', SALES_TABLE_SQL, exprs, progress)
+
+    item_columns = table_columns(cursor, 'sale_items')
+    if 'unit_price' not in item_columns or 'total_price' not in item_columns:
+        unit_price = ('unit_price' if 'unit_price' in item_columns else
+                      '(SELECT COALESCE(m.price, 0) FROM medicines m WHERE m.id = medicine_id)')
+        total_price = ('total_price' if 'total_price' in item_columns
+                       else f'COALESCE({unit_price}, 0) * quantity')
+        exprs = {
+            'id': 'id',
+            'sale_id': 'sale_id',
+            'medicine_id': 'medicine_id',
+            'quantity': 'quantity',
+            'unit_price': f'COALESCE({unit_price}, 0)',
+            'total_price': total_price,
+        }
+        rebuild_table(cursor, 'sale_items', SALE_ITEMS_TABLE_SQL, exprs, progress)
+
+
+@migration(3, "Stock update audit table (superseded by the stock ledger)")
+def _stock_updates(cursor, progress):
+    # stock_ledger (migration 10) records every stock change now, so new
+    # databases don't get stock_updates; existing ones keep theirs as history
+    pass
+
+
+@migration(4, "Indexes for sales date-range queries and sale item joins")
+def _sales_indexes(cursor, progress):
+    # Covers the date range filter and the SUM(total) of the dashboard and reports
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sales_sale_date ON sales (sale_date, total)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sale_items_sale_id ON sale_items (sale_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sale_items_medicine_id ON sale_items (medicine_id)")
+
+
+@migration(5, "Full-text search index over medicines")
+def _medicines_fts(cursor, progress):
+    # External-content FTS5 table: it stores only the index and reads rows from medicines
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS medicines_fts USING fts5(
+            name, manufacturer, category, barcode,
+            content='medicines', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='1 2 3'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS medicines_fts_insert AFTER INSERT ON medicines BEGIN
+            INSERT INTO medicines_fts (rowid, name, manufacturer, category, barcode)
+            VALUES (new.id, new.name, new.manufacturer, new.category, new.barcode);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS medicines_fts_delete AFTER DELETE ON medicines BEGIN
+            INSERT INTO medicines_fts (medicines_fts, rowid, name, manufacturer, category, barcode)
+            VALUES ('delete', old.id, old.name, old.manufacturer, old.category, old.barcode);
+        END
+    ''')
+    # Stock and price updates do not touch the indexed columns, so skip them
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS medicines_fts_update
+        AFTER UPDATE OF name, manufacturer, category, barcode ON medicines BEGIN
+            INSERT INTO medicines_fts (medicines_fts, rowid, name, manufacturer, category, barcode)
+            VALUES ('delete', old.id, old.name, old.manufacturer, old.category, old.barcode);
+            INSERT INTO medicines_fts (rowid, name, manufacturer, category, barcode)
+            VALUES (new.id, new.name, new.manufacturer, new.category, new.barcode);
+        END
+    ''')
+    # Name matches rank above barcode, category and manufacturer matches
+    cursor.execute("INSERT INTO medicines_fts (medicines_fts, rank) VALUES ('rank', 'bm25(10.0, 2.0, 2.0, 5.0)')")
+    progress("Indexing medicines for search")
+    cursor.execute("INSERT INTO medicines_fts (medicines_fts) VALUES ('rebuild')")
+
+
+@migration(6, "Name indexes for paged medicine and customer lists")
+def _list_indexes(cursor, progress):
+    # Keyset pages are ordered by (name, id); the rowid rides along in the index
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_medicines_name ON medicines (name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_customers_name ON customers (name)")
+
+
+@migration(7, "Daily sales rollup tables")
+def _daily_rollups(cursor, progress):
+    # Backfills from the existing sales; the billing layer keeps them current
+    rebuild_rollups(cursor, progress)
+
+
+@migration(8, "Expiry date index for expiry reports")
+def _expiry_index(cursor, progress):
+    # Expiry queries compare the stored YYYY-MM-DD text directly so they can use it
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_medicines_expiry_date ON medicines (expiry_date)")
+
+
+@migration(9, "Medicine lots for first-expiry-first-out stock")
+def _medicine_lots(cursor, progress):
+    create_lot_tables(cursor)
+    backfill_lots(cursor, progress)
+
+
+@migration(10, "Stock movement ledger")
+def _stock_ledger(cursor, progress):
+    create_ledger_tables(cursor)
+    backfill_opening_balances(cursor, progress)
+
+
+@migration(11, "Idempotency keys for queued sales")
+def _sale_idempotency_keys(cursor, progress):
+    if 'idempotency_key' not in table_columns(cursor, 'sales'):
+        cursor.execute("ALTER TABLE sales ADD COLUMN idempotency_key TEXT")
+    # Sales made at the counter directly have no key
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_sales_idempotency_key
+        ON sales (idempotency_key) WHERE idempotency_key IS NOT NULL
+    ''')
+
+
+def migrate(db=None, progress=print_progress):
+    """
+    Apply all pending migrations.
+
+    Returns (success, message) like the old update_database_schema().
+    """
+    db = db or DatabaseConnection()
+    conn = db.connect()
+
+    try:
+        current = get_schema_version(conn)
+        target = latest_version()
+        if current >= target:
+            return True, "قاعدة البيانات محدثة"
+
+        cursor = conn.cursor()
+        for version, description, func in MIGRATIONS:
+            if version <= current:
+                continue
+
+            if conn.in_transaction:
+                conn.commit()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have migrated while we waited for the lock
+                if get_schema_version(conn) >= version:
+                    conn.commit()
+                    continue
+                progress(f"Applying schema migration {version}: {description}")
+                func(cursor, progress)
+                cursor.execute(f"PRAGMA user_version = {int(version)}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        return True, "تم تحديث قاعدة البيانات بنجاح"
+    except Exception as e:
+        print(f"Error migrating database: {e}")
+        return False, f"حدث خطأ أثناء تحديث قاعدة البيانات: {str(e)}"
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print(migrate()[1])
@@ -1,10 +1,41 @@
 from database.db_connection import DatabaseConnection
 
+# Sales table definitions shared with the migration engine, which also uses
+# them to rebuild old tables under a temporary name.
+SALES_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sale_date DATETIME NOT NULL,
+        subtotal REAL NOT NULL DEFAULT 0,
+        discount_percentage REAL DEFAULT 0,
+        discount_amount REAL DEFAULT 0,
+        vat_rate REAL DEFAULT 0.15,
+        vat_amount REAL DEFAULT 0,
+        total REAL NOT NULL DEFAULT 0,
+        status TEXT NOT NULL DEFAULT 'pending'
+    )
+'''
+
+SALE_ITEMS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sale_id INTEGER NOT NULL,
+        medicine_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        unit_price REAL NOT NULL,
+        total_price REAL NOT NULL,
+        FOREIGN KEY (sale_id) REFERENCES sales (id),
+        FOREIGN KEY (medicine_id) REFERENCES medicines (id)
+    )
+'''
+
 def create_tables():
-    db = DatabaseConnection()
-    conn = db.connect()
-    cursor = conn.cursor()
+    """Create or upgrade all tables by running the pending schema migrations."""
+    from database.migrations import migrate
+    return migrate()
 
+def create_base_tables(cursor):
+    """Create the baseline tables; used by the first schema migration."""
     # Create Users table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -14,7 +45,9 @@ def create_tables():
             role TEXT NOT NULL,
             is_active BOOLEAN DEFAULT 1
         )
-    ''')    # Create Medicines table with extended features    # Create Medicines table with all required columns
+    ''')
+
+    # Create Medicines table with all required columns
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS medicines (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -30,34 +63,13 @@ def create_tables():
             location TEXT,
             is_active BOOLEAN DEFAULT 1
         )
-    ''')# Create Sales table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sales (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            sale_date DATETIME NOT NULL,
-            subtotal REAL NOT NULL DEFAULT 0,
-            discount_percentage REAL DEFAULT 0,
-            discount_amount REAL DEFAULT 0,
-            vat_rate REAL DEFAULT 0.15,
-            vat_amount REAL DEFAULT 0,
-            total REAL NOT NULL DEFAULT 0,
-            status TEXT NOT NULL DEFAULT 'pending'
-        )
     ''')
-    
+
+    # Create Sales table
+    cursor.execute(SALES_TABLE_SQL.format(name='sales'))
+
     # Create Sale Items table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sale_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            sale_id INTEGER NOT NULL,
-            medicine_id INTEGER NOT NULL,
-            quantity INTEGER NOT NULL,
-            unit_price REAL NOT NULL,
-            total_price REAL NOT NULL,
-            FOREIGN KEY (sale_id) REFERENCES sales (id),
-            FOREIGN KEY (medicine_id) REFERENCES medicines (id)
-        )
-    ''')
+    cursor.execute(SALE_ITEMS_TABLE_SQL.format(name='sale_items'))
 
     # Create Suppliers table
     cursor.execute('''
@@ -107,8 +119,5 @@ def create_tables():
         )
     ''')
 
-    conn.commit()
-    db.close()
-
 if __name__ == "__main__":
     create_tables()
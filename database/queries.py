@@ -0,0 +1,121 @@
+"""
+Shared SQL for the sales date-range queries used by reports and dashboards.
+
+Every query filters sale_date with a half-open range
+(sale_date >= start AND sale_date < end) so SQLite can search
+idx_sales_sale_date instead of scanning the table. Dates are passed as
+YYYY-MM-DD strings; see utils.helpers.sale_date_range().
+
+Run `python -m database.queries` to check that none of them falls back to
+a full table scan.
+"""
+import re
+import sys
+
+# One row per sale in the range, with its item count. The count is a
+# correlated subquery: GROUP BY s.id would make SQLite walk sales by rowid.
+SALES_IN_RANGE_SQL = '''
+    SELECT s.id, s.sale_date, s.subtotal, s.discount_amount,
+           s.vat_amount, s.total,
+           (SELECT COUNT(*) FROM sale_items si WHERE si.sale_id = s.id) as item_count
+    FROM sales s
+    WHERE s.sale_date >= ? AND s.sale_date < ?
+    ORDER BY s.sale_date DESC
+'''
+
+# Invoice count and total per day in the range, from the daily rollup
+# (database/rollups.py) rather than the raw sales
+DAILY_TOTALS_SQL = '''
+    SELECT day, sales_count, total as total_amount
+    FROM daily_sales_summary
+    WHERE day >= ? AND day < ?
+    ORDER BY day
+'''
+
+# Total takings in the range
+SALES_TOTAL_SQL = '''
+    SELECT SUM(total)
+    FROM sales
+    WHERE sale_date >= ? AND sale_date < ?
+'''
+
+# Sale lines with medicine names in the range
+SALE_LINES_SQL = '''
+    SELECT s.id, s.sale_date, s.subtotal, s.discount_amount, s.vat_amount,
+           s.total, s.status, si.medicine_id, si.quantity, si.unit_price,
+           si.total_price, m.name as medicine_name
+    FROM sales s
+    JOIN sale_items si ON s.id = si.sale_id
+    JOIN medicines m ON si.medicine_id = m.id
+    WHERE s.sale_date >= ? AND s.sale_date < ?
+    ORDER BY s.sale_date DESC
+'''
+
+# Dashboard tile: today's invoice count and total
+TODAY_SALES_SQL = '''
+    SELECT COUNT(*) as sales_count, COALESCE(SUM(total), 0) as sales_total
+    FROM sales
+    WHERE sale_date >= date('now') AND sale_date < date('now', '+1 day')
+'''
+
+# Most recent sales for the dashboard
+RECENT_SALES_SQL = '''
+    SELECT s.id, s.total, s.sale_date
+    FROM sales s
+    ORDER BY s.sale_date DESC
+    LIMIT ?
+'''
+
+# Queries checked by find_full_scans(), with sample parameters
+CHECKED_QUERIES = {
+    'sales_in_range': (SALES_IN_RANGE_SQL, ('2024-01-01', '2024-01-02')),
+    'daily_totals': (DAILY_TOTALS_SQL, ('2024-01-01', '2024-02-01')),
+    'sales_total': (SALES_TOTAL_SQL, ('2024-01-01', '2024-02-01')),
+    'sale_lines': (SALE_LINES_SQL, ('2024-01-01', '2024-01-02')),
+    'today_sales': (TODAY_SALES_SQL, ()),
+    'recent_sales': (RECENT_SALES_SQL, (5,)),
+}
+
+_FULL_SCAN = re.compile(r'^SCAN (\w+)')
+
+
+def find_full_scans(conn, queries=None):
+    """
+    Return {query_name: [plan detail, ...]} for queries that scan a whole table.
+
+    A plan step counts as a full scan when it reads a table without an
+    index ("SCAN s" rather than "SEARCH s USING INDEX ..." or
+    "SCAN s USING INDEX ..." for an index-ordered LIMIT).
+    """
+    problems = {}
+    for name, (sql, params) in (queries or CHECKED_QUERIES).items():
+        plan = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        scans = [row[-1] for row in plan
+                 if _FULL_SCAN.match(row[-1]) and 'INDEX' not in row[-1]
+                 and 'CONSTANT ROW' not in row[-1]]
+        if scans:
+            problems[name] = scans
+    return problems
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+    from database.db_connection import DatabaseConnection
+    from database.migrations import migrate
+
+    # Check against the given database, or a freshly migrated empty one
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(tempfile.mkdtemp(), 'plans.db')
+    db = DatabaseConnection(os.path.abspath(db_path))
+    migrate(db, progress=lambda *args: None)
+    conn = db.connect()
+    try:
+        problems = find_full_scans(conn)
+    finally:
+        db.close()
+
+    for name, scans in problems.items():
+        print(f"FULL SCAN in {name}: {'; '.join(scans)}")
+    if problems:
+        sys.exit(1)
+    print(f"All {len(CHECKED_QUERIES)} sales queries use an index")
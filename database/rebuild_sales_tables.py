@@ -15,7 +15,13 @@ def rebuild_database():
     if db_path.exists():
         print(f"حذف قاعدة البيانات الموجودة: {db_path}")
         try:
-            os.remove(db_path)
+            # إغلاق الاتصالات المفتوحة وحذف ملفات WAL المرافقة
+            from database.db_connection import close_all_pools
+            close_all_pools()
+            for suffix in ('', '-wal', '-shm'):
+                path = Path(str(db_path) + suffix)
+                if path.exists():
+                    os.remove(path)
             print("تم حذف قاعدة البيانات بنجاح")
         except Exception as e:
             print(f"حدث خطأ أثناء محاولة حذف قاعدة البيانات: {str(e)}")
@@ -26,7 +32,10 @@ def rebuild_database():
     
     try:
         print("جاري إنشاء قاعدة البيانات والجداول...")
-        create_tables()
+        success, message = create_tables()
+        if not success:
+            print(message)
+            return False
         print("تم إنشاء قاعدة البيانات والجداول بنجاح")
         
         # إنشاء مستخدم الإدارة الافتراضي
@@ -0,0 +1,116 @@
+"""
+Daily sales rollups.
+
+daily_sales_summary keeps one row per day with the invoice count and
+money totals; daily_medicine_sales keeps quantity and revenue per day and
+medicine. The billing layer adds every new sale inside its transaction,
+so multi-month reports read a few hundred rows instead of every sale.
+Days are date(sale_date), i.e. the same calendar as the sales queries.
+
+Run `python -m database.rollups` to rebuild both tables from the raw
+sales, e.g. after importing sales from outside the application.
+"""
+from database.db_connection import DatabaseConnection
+
+DAILY_SALES_SUMMARY_SQL = '''
+    CREATE TABLE IF NOT EXISTS daily_sales_summary (
+        day TEXT PRIMARY KEY,
+        sales_count INTEGER NOT NULL DEFAULT 0,
+        subtotal REAL NOT NULL DEFAULT 0,
+        discount_amount REAL NOT NULL DEFAULT 0,
+        vat_amount REAL NOT NULL DEFAULT 0,
+        total REAL NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+'''
+
+DAILY_MEDICINE_SALES_SQL = '''
+    CREATE TABLE IF NOT EXISTS daily_medicine_sales (
+        day TEXT NOT NULL,
+        medicine_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        total REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, medicine_id)
+    ) WITHOUT ROWID
+'''
+
+
+def create_rollup_tables(cursor):
+    cursor.execute(DAILY_SALES_SUMMARY_SQL)
+    cursor.execute(DAILY_MEDICINE_SALES_SQL)
+
+
+def add_sale_to_rollups(cursor, sale_id):
+    """Add one sale and its items to the daily rollups; runs in the caller's transaction."""
+    cursor.execute('''
+        INSERT INTO daily_sales_summary (day, sales_count, subtotal, discount_amount, vat_amount, total)
+        SELECT date(sale_date), 1, subtotal, discount_amount, vat_amount, total
+        FROM sales
+        WHERE id = ?
+        ON CONFLICT (day) DO UPDATE SET
+            sales_count = sales_count + 1,
+            subtotal = subtotal + excluded.subtotal,
+            discount_amount = discount_amount + excluded.discount_amount,
+            vat_amount = vat_amount + excluded.vat_amount,
+            total = total + excluded.total
+    ''', (sale_id,))
+    cursor.execute('''
+        INSERT INTO daily_medicine_sales (day, medicine_id, quantity, total)
+        SELECT date(s.sale_date), si.medicine_id, SUM(si.quantity), SUM(si.total_price)
+        FROM sale_items si
+        JOIN sales s ON s.id = si.sale_id
+        WHERE si.sale_id = ?
+        GROUP BY si.medicine_id
+        ON CONFLICT (day, medicine_id) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            total = total + excluded.total
+    ''', (sale_id,))
+
+
+def rebuild_rollups(cursor, progress=print):
+    """Recompute both rollup tables from sales and sale_items."""
+    create_rollup_tables(cursor)
+    cursor.execute("DELETE FROM daily_sales_summary")
+    cursor.execute("DELETE FROM daily_medicine_sales")
+
+    progress("Rebuilding daily_sales_summary")
+    cursor.execute('''
+        INSERT INTO daily_sales_summary (day, sales_count, subtotal, discount_amount, vat_amount, total)
+        SELECT date(sale_date), COUNT(*), COALESCE(SUM(subtotal), 0), COALESCE(SUM(discount_amount), 0),
+               COALESCE(SUM(vat_amount), 0), COALESCE(SUM(total), 0)
+        FROM sales
+        GROUP BY date(sale_date)
+    ''')
+    progress("Rebuilding daily_medicine_sales")
+    cursor.execute('''
+        INSERT INTO daily_medicine_sales (day, medicine_id, quantity, total)
+        SELECT date(s.sale_date), si.medicine_id, SUM(si.quantity), COALESCE(SUM(si.total_price), 0)
+        FROM sale_items si
+        JOIN sales s ON s.id = si.sale_id
+        GROUP BY date(s.sale_date), si.medicine_id
+    ''')
+
+
+def rebuild(db=None, progress=print):
+    """Rebuild the rollups in one transaction. Returns (success, message)."""
+    db = db or DatabaseConnection()
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        if conn.in_transaction:
+            conn.commit()
+        cursor.execute("BEGIN IMMEDIATE")
+        rebuild_rollups(cursor, progress)
+        conn.commit()
+        cursor.execute("SELECT COUNT(*) FROM daily_sales_summary")
+        return True, f"تم إعادة بناء ملخص المبيعات اليومية ({cursor.fetchone()[0]} يوم)"
+    except Exception as e:
+        if conn.in_transaction:
+            conn.rollback()
+        print(f"Error rebuilding sales rollups: {e}")
+        return False, f"حدث خطأ أثناء إعادة بناء ملخص المبيعات: {str(e)}"
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print(rebuild()[1])
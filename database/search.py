@@ -0,0 +1,82 @@
+"""
+Medicine search backed by the medicines_fts full-text index.
+
+Each word the user types becomes a prefix query ("para 50" matches
+"Paracetamol 500mg"), every word has to match, and results are ordered by
+bm25 rank with name matches weighted highest. The index is kept in sync
+with the medicines table by triggers (schema migration 5).
+
+Ranking has to score every match, which is slow for a one- or two-letter
+prefix over a large catalog. Searches matching more than
+SEARCH_RANK_LIMIT rows are returned in catalog order instead; the user
+is still typing and the next keystroke narrows the list.
+"""
+import re
+
+SEARCH_RANK_LIMIT = 500
+
+# Words as unicode61 tokenizes them: runs of letters and digits
+_WORD = re.compile(r'[^\W_]+')
+
+
+def build_match_query(term):
+    """Turn free text into an FTS5 prefix query, or None if it has no words."""
+    words = _WORD.findall(term or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def match_condition(term, key='id'):
+    """
+    Return (sql, params) restricting a medicines listing to search matches.
+
+    For listings that keep their own sort order instead of the rank.
+    """
+    match = build_match_query(term)
+    if match is None:
+        return "0", ()
+    return f"{key} IN (SELECT rowid FROM medicines_fts WHERE medicines_fts MATCH ?)", (match,)
+
+
+def count_matches(cursor, match, cap):
+    """Count index matches for an FTS5 query, stopping at cap."""
+    cursor.execute('''
+        SELECT COUNT(*) FROM (
+            SELECT rowid FROM medicines_fts WHERE medicines_fts MATCH ? LIMIT ?
+        )
+    ''', (match, cap))
+    return cursor.fetchone()[0]
+
+
+def search_medicines(cursor, term, columns='m.*', active_only=True, in_stock_only=False, limit=None):
+    """
+    Run a ranked search over medicines and return the fetched rows.
+
+    columns is the select list over the medicines table aliased as m.
+    """
+    match = build_match_query(term)
+    if match is None:
+        return []
+
+    conditions = ["medicines_fts MATCH ?"]
+    if active_only:
+        conditions.append("m.is_active = 1")
+    if in_stock_only:
+        conditions.append("m.quantity > 0")
+
+    query = f'''
+        SELECT {columns}
+        FROM medicines_fts
+        JOIN medicines m ON m.id = medicines_fts.rowid
+        WHERE {' AND '.join(conditions)}
+    '''
+    if count_matches(cursor, match, SEARCH_RANK_LIMIT + 1) <= SEARCH_RANK_LIMIT:
+        query += " ORDER BY medicines_fts.rank"
+    params = [match]
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    cursor.execute(query, params)
+    return cursor.fetchall()
@@ -0,0 +1,190 @@
+import queue
+import sqlite3
+import threading
+from tkinter import messagebox
+from database.db_connection import DatabaseConnection
+
+try:
+    from config import SEARCH_DEBOUNCE_MS
+except ImportError:
+    # Fallback if config is not available
+    SEARCH_DEBOUNCE_MS = 250
+
+# How often the Tk thread checks for finished searches while one is running
+RESULT_POLL_MS = 20
+
+
+class AsyncSearch:
+    """
+    Run a search-as-you-type query off the Tk main thread.
+
+    Typing into the watched variable is debounced; once it settles the
+    search runs on a worker thread with its own pooled connection. A newer
+    search interrupts the running query and older results are dropped, so
+    only the latest term ever reaches the widget. Results are handed back
+    on the Tk thread through after().
+
+    search(cursor, term) runs on the worker and returns the rows.
+    on_results(term, rows) and on_error(term, error) run on the Tk thread.
+    """
+    def __init__(self, widget, variable, search, on_results, on_error=None,
+                 delay=SEARCH_DEBOUNCE_MS, db_name='pharmacy.db'):
+        self.widget = widget
+        self.variable = variable
+        self.search = search
+        self.on_results = on_results
+        self.on_error = on_error or self._show_error
+        self.delay = delay
+        self.db_name = db_name
+
+        self._lock = threading.Condition()
+        self._generation = 0
+        self._pending = None  # (generation, term) waiting for the worker
+        self._running_conn = None
+        self._closed = False
+        self._results = queue.Queue()
+        self._debounce_id = None
+        self._poll_id = None
+
+        self._worker = threading.Thread(target=self._run, name="async-search", daemon=True)
+        self._worker.start()
+
+        self._trace_id = variable.trace_add('write', self._on_change)
+        widget.bind('<Destroy>', self._on_destroy, add='+')
+
+    def _on_change(self, *args):
+        if self._debounce_id is not None:
+            self.widget.after_cancel(self._debounce_id)
+        self._debounce_id = self.widget.after(self.delay, self.submit)
+
+    def submit(self, term=None):
+        """Start a search now for term, or for the variable's current text."""
+        self._debounce_id = None
+        if term is None:
+            term = self.variable.get().strip()
+        with self._lock:
+            if self._closed:
+                return
+            self._generation += 1
+            self._pending = (self._generation, term)
+            self._interrupt()
+            self._lock.notify()
+        if self._poll_id is None:
+            self._poll_id = self.widget.after(RESULT_POLL_MS, self._poll)
+
+    def cancel(self):
+        """Drop any pending or running search without delivering results."""
+        if self._debounce_id is not None:
+            self.widget.after_cancel(self._debounce_id)
+            self._debounce_id = None
+        if self._poll_id is not None:
+            self.widget.after_cancel(self._poll_id)
+            self._poll_id = None
+        with self._lock:
+            self._generation += 1
+            self._pending = None
+            self._interrupt()
+
+    def close(self):
+        """Stop the worker thread and detach from the variable."""
+        self.cancel()
+        with self._lock:
+            self._closed = True
+            self._lock.notify()
+        try:
+            self.variable.trace_remove('write', self._trace_id)
+        except Exception:
+            pass
+
+    def _interrupt(self):
+        # Called with the lock held; aborts the query of a stale search
+        if self._running_conn is not None:
+            self._running_conn.interrupt()
+
+    def _run(self):
+        """Worker loop: run the most recent pending search."""
+        db = DatabaseConnection(self.db_name)
+        while True:
+            with self._lock:
+                while self._pending is None and not self._closed:
+                    self._lock.wait()
+                if self._closed:
+                    break
+                generation, term = self._pending
+                self._pending = None
+
+            try:
+                conn = db.connect()
+                with self._lock:
+                    self._running_conn = conn
+                rows = self.search(conn.cursor(), term)
+                self._results.put((generation, term, rows, None))
+            except Exception as e:
+                self._results.put((generation, term, None, e))
+            finally:
+                with self._lock:
+                    self._running_conn = None
+                db.close()
+
+    def _poll(self):
+        """Deliver the latest finished search on the Tk thread."""
+        self._poll_id = None
+        latest = None
+        while True:
+            try:
+                result = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if result[0] == self._generation:
+                latest = result
+
+        if latest is not None:
+            _, term, rows, error = latest
+            if error is None:
+                self.on_results(term, rows)
+            elif not (isinstance(error, sqlite3.OperationalError) and 'interrupted' in str(error)):
+                self.on_error(term, error)
+            return
+
+        # The current search is still running
+        self._poll_id = self.widget.after(RESULT_POLL_MS, self._poll)
+
+    def _on_destroy(self, event):
+        if event.widget is self.widget:
+            self.close()
+
+    def _show_error(self, term, error):
+        messagebox.showerror("خطأ", f"حدث خطأ أثناء البحث: {str(error)}")
+
+
+def run_in_background(widget, func, on_done, on_error=None):
+    """
+    Run func() on a worker thread and pass its result to on_done on the Tk thread.
+
+    Errors go to on_error(error) instead. Nothing is delivered once the
+    widget has been destroyed.
+    """
+    results = queue.Queue()
+
+    def work():
+        try:
+            results.put((func(), None))
+        except Exception as e:
+            results.put((None, e))
+
+    def poll():
+        try:
+            result, error = results.get_nowait()
+        except queue.Empty:
+            if widget.winfo_exists():
+                widget.after(RESULT_POLL_MS, poll)
+            return
+        if not widget.winfo_exists():
+            return
+        if error is None:
+            on_done(result)
+        elif on_error is not None:
+            on_error(error)
+
+    threading.Thread(target=work, name="background-load", daemon=True).start()
+    widget.after(RESULT_POLL_MS, poll)
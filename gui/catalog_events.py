@@ -0,0 +1,47 @@
+import queue
+from logic.catalog import get_catalog
+
+# How often queued catalog changes are delivered to the window
+CATALOG_POLL_MS = 200
+
+
+def watch_catalog(widget, on_change, source=None):
+    """
+    Deliver catalog changes to on_change(kinds, medicine_ids) on the Tk thread.
+
+    Changes published from any thread are queued and handed over in
+    batches: kinds is the set of change kinds and medicine_ids the set of
+    ids touched since the last call. The subscription ends when the widget
+    is destroyed.
+
+    source defaults to the shared catalog; anything with the same
+    subscribe(callback) -> unsubscribe, such as the low-stock tracker,
+    works too.
+    """
+    source = source if source is not None else get_catalog()
+    changes = queue.Queue()
+    unsubscribe = source.subscribe(lambda kind, ids: changes.put((kind, ids)))
+
+    def poll():
+        if not widget.winfo_exists():
+            unsubscribe()
+            return
+        kinds, ids = set(), set()
+        while True:
+            try:
+                kind, changed = changes.get_nowait()
+            except queue.Empty:
+                break
+            kinds.add(kind)
+            ids.update(changed)
+        if kinds:
+            on_change(kinds, ids)
+        widget.after(CATALOG_POLL_MS, poll)
+
+    def on_destroy(event):
+        if event.widget is widget:
+            unsubscribe()
+
+    widget.bind('<Destroy>', on_destroy, add='+')
+    widget.after(CATALOG_POLL_MS, poll)
+    return unsubscribe
@@ -1,6 +1,9 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from database.db_connection import DatabaseConnection
+from gui.async_search import AsyncSearch
+from gui.virtual_tree import VirtualTreeview, PagedQuery
+from logic.dashboard_stats import invalidate_dashboard_stats
 
 class CustomersWindow:
     def __init__(self, parent):
@@ -26,11 +29,10 @@ class CustomersWindow:
         
         ttk.Label(self.search_frame, text="بحث:").pack(side=tk.RIGHT, padx=5)
         self.search_var = tk.StringVar()
-        self.search_var.trace('w', self.search_customers)
         ttk.Entry(self.search_frame, textvariable=self.search_var).pack(side=tk.RIGHT, fill=tk.X, expand=True)
         
         # Create treeview
-        self.tree = ttk.Treeview(self.main_frame, columns=("id", "name", "phone", "email", "points"), show="headings")
+        self.tree = VirtualTreeview(self.main_frame, columns=("id", "name", "phone", "email", "points"), show="headings")
         self.tree.heading("id", text="الرقم")
         self.tree.heading("name", text="الاسم")
         self.tree.heading("phone", text="الهاتف")
@@ -48,63 +50,48 @@ class CustomersWindow:
         # Add scrollbar
         scrollbar = ttk.Scrollbar(self.tree, orient=tk.VERTICAL, command=self.tree.yview)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.set_scrollbar(scrollbar)
+        
+        # Sort in the database when a heading is clicked
+        self.tree.enable_sorting({
+            "id": "id", "name": "name", "phone": "IFNULL(phone, '')",
+            "email": "IFNULL(email, '')", "points": "IFNULL(loyalty_points, 0)",
+        })
         
         # Bind double click event
         self.tree.bind("<Double-1>", self.edit_customer)
         
+        # Search runs in the background as the user types
+        self.search = AsyncSearch(self.window, self.search_var, self.fetch_customers, self.show_customers)
+        
         # Load initial data
         self.refresh_customers()
     
     def refresh_customers(self):
-        # Clear existing items
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # Load customers from database
-        db = DatabaseConnection()
-        conn = db.connect()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute("SELECT id, name, phone, email, loyalty_points FROM customers ORDER BY name")
-            for customer in cursor.fetchall():
-                self.tree.insert("", tk.END, values=customer)
+            self.tree.show(self.customers_query(self.search_var.get().strip()))
         except Exception as e:
             messagebox.showerror("خطأ", f"حدث خطأ أثناء تحميل بيانات العملاء: {str(e)}")
-        finally:
-            db.close()
     
-    def search_customers(self, *args):
-        search_term = self.search_var.get().strip()
-        
-        # Clear existing items
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        if not search_term:
-            self.refresh_customers()
-            return
-        
-        # Search in database
-        db = DatabaseConnection()
-        conn = db.connect()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute("""
-                SELECT id, name, phone, email, loyalty_points 
-                FROM customers 
-                WHERE name LIKE ? OR phone LIKE ? OR email LIKE ?
-                ORDER BY name
-            """, (f"%{search_term}%", f"%{search_term}%", f"%{search_term}%"))
-            
-            for customer in cursor.fetchall():
-                self.tree.insert("", tk.END, values=customer)
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ أثناء البحث: {str(e)}")
-        finally:
-            db.close()
+    def customers_query(self, search_term):
+        """Build the paged customer listing, filtered by search_term."""
+        where, params = '', ()
+        if search_term:
+            where = "name LIKE ? OR phone LIKE ? OR email LIKE ?"
+            params = (f"%{search_term}%", f"%{search_term}%", f"%{search_term}%")
+        query = PagedQuery("id, name, phone, email, loyalty_points", "customers", where, params)
+        # Keep the sort order the user picked
+        if self.tree.query is not None:
+            query = query.with_order(self.tree.query.order_by, self.tree.query.descending)
+        return query
+    
+    def fetch_customers(self, cursor, search_term):
+        """Count and read the first page of the listing; runs on the search thread."""
+        query = self.customers_query(search_term)
+        return query, query.count(cursor), query.fetch_after(cursor, None, self.tree.page_size)
+    
+    def show_customers(self, search_term, result):
+        self.tree.show(*result)
     
     def add_customer(self):
         # Create add customer dialog
@@ -145,6 +132,7 @@ class CustomersWindow:
                     VALUES (?, ?, ?, ?)
                 """, (name, phone_var.get().strip(), email_var.get().strip(), address_var.get().strip()))
                 conn.commit()
+                invalidate_dashboard_stats()
                 messagebox.showinfo("نجاح", "تم إضافة العميل بنجاح")
                 dialog.destroy()
                 self.refresh_customers()
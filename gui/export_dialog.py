@@ -0,0 +1,79 @@
+import tkinter as tk
+from tkinter import ttk, messagebox
+from gui.report_jobs import watch_job
+from logic.report_jobs import get_report_runner, PRIORITY_EXPORT
+from utils.csv_export import stream_csv
+
+
+class ExportDialog:
+    """
+    Progress dialog for a CSV export running as a background report job.
+
+    The export streams straight from the job's pooled connection to the
+    file; the dialog only shows the row count and offers a cancel button.
+    Closing the dialog leaves the export running in the job history;
+    closing the window that started it cancels it.
+    """
+    def __init__(self, parent, filepath, header, query, params=(), format_row=None, footer=None,
+                 count_query=None, count_params=(), done_message="تم تصدير التقرير بنجاح",
+                 name=None):
+        self.filepath = filepath
+        self.done_message = done_message
+        self.parent = parent
+
+        def export(cursor, job):
+            total = None
+            if count_query:
+                cursor.execute(count_query, count_params)
+                total = cursor.fetchone()[0]
+                job.report_progress(0, total)
+            return stream_csv(cursor, filepath, header, query, params,
+                              format_row=format_row, footer=footer, total=total,
+                              progress=job.report_progress, cancel_event=job.cancel_event)
+
+        self.job = get_report_runner().submit(name or f"تصدير {filepath}", export, PRIORITY_EXPORT)
+
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("تصدير التقرير")
+        self.dialog.geometry("400x150")
+        self.dialog.transient(parent)
+
+        ttk.Label(self.dialog, text="جاري تصدير التقرير...").pack(pady=(15, 5))
+        self.progress_bar = ttk.Progressbar(self.dialog, mode='indeterminate', length=350)
+        self.progress_bar.pack(padx=20, pady=5)
+        self.progress_bar.start(10)
+        self.status_var = tk.StringVar(value="0 سجل")
+        ttk.Label(self.dialog, textvariable=self.status_var).pack()
+        ttk.Button(self.dialog, text="إلغاء", command=self.job.cancel).pack(pady=10)
+
+        # Results go to the parent so they still arrive if the dialog is closed
+        watch_job(parent, self.job, self._on_done, self._show_progress, self._on_error, self._on_cancel)
+
+    def _close(self):
+        if self.dialog.winfo_exists():
+            self.progress_bar.stop()
+            self.dialog.destroy()
+
+    def _on_done(self, written):
+        self._close()
+        messagebox.showinfo("تصدير التقرير", f"{self.done_message} ({written} سجل) إلى:\n{self.filepath}")
+
+    def _on_error(self, error):
+        self._close()
+        messagebox.showerror("خطأ", f"حدث خطأ أثناء تصدير التقرير: {str(error)}")
+
+    def _on_cancel(self):
+        self._close()
+        messagebox.showinfo("تصدير التقرير", "تم إلغاء التصدير")
+
+    def _show_progress(self, done, total):
+        if not self.dialog.winfo_exists():
+            return
+        if total:
+            if str(self.progress_bar.cget('mode')) != 'determinate':
+                self.progress_bar.stop()
+                self.progress_bar.configure(mode='determinate', maximum=total)
+            self.progress_bar['value'] = min(done, total)
+            self.status_var.set(f"{done} / {total} سجل")
+        else:
+            self.status_var.set(f"{done} سجل")
@@ -4,10 +4,19 @@ from gui.customers_window import CustomersWindow
 from gui.medicines_window import MedicinesWindow
 from gui.sales_window import SalesWindow
 from gui.reports_window import ReportsWindow
-from database.db_connection import DatabaseConnection
+from gui.async_search import run_in_background
+from logic.dashboard_stats import get_dashboard_stats
+from logic.catalog import get_catalog
+from logic.stock_alerts import get_low_stock_tracker
+from logic.sales_queue import get_sales_queue
+from gui.catalog_events import watch_catalog
+from database.instrumentation import get_query_stats
 from gui.custom_theme import create_sidebar, create_stat_box, create_header, BACKGROUND_COLOR
 
 class MainWindow:
+    STAT_TITLES = ["إجمالي العملاء", "إجمالي الأدوية", "أدوية منخفضة المخزون", "مبيعات اليوم"]
+    LOW_STOCK_TILE = 2
+
     def __init__(self, parent, user_data):
         self.window = parent
         self.window.title("نظام إدارة الصيدلية")
@@ -52,8 +61,19 @@ class MainWindow:
         self.dashboard_frame.pack(fill=tk.BOTH, expand=True, pady=10)
 
         # Add dashboard widgets
+        self._dashboard_load = 0
         self.create_dashboard()
 
+        # Load the medicine catalog (POS search and barcode scans) without holding up startup
+        run_in_background(self.window, get_catalog().load, lambda count: None,
+                          lambda e: print(f"Error loading medicine catalog: {e}"))
+
+        # Record sales still queued from the last session
+        get_sales_queue().start()
+
+        # Keep the low-stock tile current as medicines cross their minimum level
+        watch_catalog(self.window, self.on_low_stock_change, get_low_stock_tracker())
+
     def create_menu(self):
         menubar = tk.Menu(self.window)
 
@@ -87,6 +107,8 @@ class MainWindow:
         reports_menu.add_command(label="تقرير المبيعات", command=self.sales_report)
         reports_menu.add_command(label="تقرير المخزون", command=self.inventory_report)
         reports_menu.add_command(label="تقرير العملاء", command=self.customers_report)
+        reports_menu.add_separator()
+        reports_menu.add_command(label="أبطأ الاستعلامات", command=self.show_query_stats)
         menubar.add_cascade(label="التقارير", menu=reports_menu)
 
         self.window.config(menu=menubar)
@@ -110,49 +132,62 @@ class MainWindow:
         for i in range(4):
             stats_frame.columnconfigure(i, weight=1)
 
-        # Get statistics from database
-        db = DatabaseConnection()
-        conn = db.connect()
-        cursor = conn.cursor()
+        # Placeholders until the statistics arrive from the background load
+        self.stats_frame = stats_frame
+        for index, title in enumerate(self.STAT_TITLES):
+            self.create_stat_box(stats_frame, title, "...", index)
+
+        # Add recent activity section
+        self.create_recent_activity()
+
+        self._dashboard_load += 1
+        load = self._dashboard_load
+        run_in_background(
+            self.dashboard_frame, get_dashboard_stats,
+            lambda stats: self.show_dashboard_stats(stats) if load == self._dashboard_load else None,
+            lambda e: messagebox.showerror("خطأ", f"حدث خطأ أثناء تحميل الإحصائيات: {str(e)}"))
+
+    def show_dashboard_stats(self, stats):
+        """Fill the stat boxes and recent sales once the statistics are loaded"""
+        from utils.helpers import format_currency_with_name
+        for widget in self.stats_frame.winfo_children():
+            widget.destroy()
 
-        try:
-            # Get total customers
-            cursor.execute("SELECT COUNT(*) FROM customers")
-            total_customers = cursor.fetchone()[0]
-
-            # Get total medicines
-            cursor.execute("SELECT COUNT(*) FROM medicines")
-            total_medicines = cursor.fetchone()[0]
-
-            # Get low stock medicines
-            cursor.execute("""
-                SELECT COUNT(*) FROM medicines
-                WHERE quantity <= min_stock_level
-            """)
-            low_stock = cursor.fetchone()[0]
-
-            # Get today's sales
-            cursor.execute("""
-                SELECT COUNT(*), COALESCE(SUM(total), 0)
-                FROM sales
-                WHERE date(sale_date) = date('now')
-            """)
-            today_sales = cursor.fetchone()
-
-            # Create stat boxes with icons
-            from utils.helpers import format_currency_with_name
-            self.create_stat_box(stats_frame, "إجمالي العملاء", total_customers, 0)
-            self.create_stat_box(stats_frame, "إجمالي الأدوية", total_medicines, 1)
-            self.create_stat_box(stats_frame, "أدوية منخفضة المخزون", low_stock, 2)
-            self.create_stat_box(stats_frame, "مبيعات اليوم", f"{today_sales[0]} ({format_currency_with_name(today_sales[1])})", 3)
-
-            # Add recent activity section
-            self.create_recent_activity()
-
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ أثناء تحميل الإحصائيات: {str(e)}")
-        finally:
-            db.close()
+        # Create stat boxes with icons
+        values = [
+            stats['total_customers'],
+            stats['total_medicines'],
+            stats['low_stock'],
+            f"{stats['today_sales_count']} ({format_currency_with_name(stats['today_sales_total'])})",
+        ]
+        self.stat_boxes = [self.create_stat_box(self.stats_frame, title, value, index)
+                           for index, (title, value) in enumerate(zip(self.STAT_TITLES, values))]
+
+        for widget in self.recent_sales_frame.winfo_children()[1:]:
+            widget.destroy()
+
+        # sales has no customer column, so list recent invoices by number
+        if stats['recent_sales']:
+            for sale_id, total, _ in stats['recent_sales']:
+                customer = f"فاتورة #{sale_id}"
+
+                sale_frame = ttk.Frame(self.recent_sales_frame)
+                sale_frame.pack(fill=tk.X, pady=2)
+
+                ttk.Label(sale_frame, text=f"{customer}", font=("Arial", 10, "bold")).pack(side=tk.RIGHT)
+                ttk.Label(sale_frame, text=format_currency_with_name(total)).pack(side=tk.LEFT)
+        else:
+            ttk.Label(self.recent_sales_frame, text="لا توجد مبيعات حديثة").pack(pady=10)
+
+    def on_low_stock_change(self, kinds, medicine_ids):
+        """Redraw the low-stock tile from the tracker's count"""
+        boxes = getattr(self, 'stat_boxes', None)
+        if not boxes or not boxes[self.LOW_STOCK_TILE].winfo_exists():
+            return
+        boxes[self.LOW_STOCK_TILE].destroy()
+        boxes[self.LOW_STOCK_TILE] = self.create_stat_box(
+            self.stats_frame, self.STAT_TITLES[self.LOW_STOCK_TILE], get_low_stock_tracker().count(),
+            self.LOW_STOCK_TILE)
 
     def create_recent_activity(self):
         """Create a section for recent activities"""
@@ -173,42 +208,8 @@ class MainWindow:
         sales_frame.grid(row=0, column=0, sticky="nsew", padx=10)
 
         ttk.Label(sales_frame, text="آخر المبيعات", font=("Arial", 12, "bold")).pack(anchor='e', pady=(0, 10))
-
-        # Get recent sales
-        db = DatabaseConnection()
-        conn = db.connect()
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute("""
-                SELECT s.id, c.name, s.total, s.sale_date
-                FROM sales s
-                LEFT JOIN customers c ON s.customer_id = c.id
-                ORDER BY s.sale_date DESC
-                LIMIT 5
-            """)
-
-            sales = cursor.fetchall()
-
-            if sales:
-                for sale in sales:
-                    _, customer, total, _ = sale  # Unpacking values, ignoring unused ones
-                    if not customer:
-                        customer = "عميل نقدي"
-
-                    sale_frame = ttk.Frame(sales_frame)
-                    sale_frame.pack(fill=tk.X, pady=2)
-
-                    from utils.helpers import format_currency_with_name
-                    ttk.Label(sale_frame, text=f"{customer}", font=("Arial", 10, "bold")).pack(side=tk.RIGHT)
-                    ttk.Label(sale_frame, text=format_currency_with_name(total)).pack(side=tk.LEFT)
-            else:
-                ttk.Label(sales_frame, text="لا توجد مبيعات حديثة").pack(pady=10)
-
-        except Exception as e:
-            ttk.Label(sales_frame, text=f"خطأ: {str(e)}").pack(pady=10)
-        finally:
-            db.close()
+        ttk.Label(sales_frame, text="جاري التحميل...").pack(pady=10)
+        self.recent_sales_frame = sales_frame
 
     def create_stat_box(self, parent, title, value, column):
         return create_stat_box(parent, title, value, column)
@@ -274,6 +275,37 @@ class MainWindow:
         # Since we don't have a customers report tab yet, open the main reports window
         ReportsWindow(self.window)
 
+    def show_query_stats(self):
+        """عرض الاستعلامات الأكثر استهلاكاً للوقت منذ تشغيل البرنامج"""
+        window = tk.Toplevel(self.window)
+        window.title("أبطأ الاستعلامات")
+        window.geometry("1000x500")
+
+        columns = ('total_ms', 'calls', 'avg_ms', 'max_ms', 'rows', 'caller', 'sql')
+        headings = ("الوقت الكلي (ms)", "المرات", "المتوسط (ms)", "الأقصى (ms)", "الصفوف", "المصدر", "الاستعلام")
+        tree = ttk.Treeview(window, columns=columns, show='headings')
+        for column, heading in zip(columns, headings):
+            tree.heading(column, text=heading)
+            tree.column(column, width=80 if column not in ('caller', 'sql') else 250)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        def refresh():
+            tree.delete(*tree.get_children())
+            for entry in get_query_stats().top(50):
+                tree.insert('', tk.END, values=(
+                    f"{entry['total_ms']:.1f}", entry['calls'], f"{entry['avg_ms']:.2f}",
+                    f"{entry['max_ms']:.2f}", entry['rows'], entry['caller'], entry['sql']))
+
+        def reset():
+            get_query_stats().reset()
+            refresh()
+
+        buttons = ttk.Frame(window)
+        buttons.pack(fill=tk.X, padx=10, pady=(0, 10))
+        ttk.Button(buttons, text="تحديث", command=refresh).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(buttons, text="تصفير", command=reset).pack(side=tk.RIGHT, padx=5)
+        refresh()
+
     def logout(self):
         if messagebox.askyesno("تأكيد", "هل تريد تسجيل الخروج؟"):
             self.window.destroy()
\ No newline at end of file
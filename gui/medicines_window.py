@@ -1,9 +1,18 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from database.db_connection import DatabaseConnection
+from database.search import match_condition
+from database.lots import receive_lot
+from database.ledger import LedgerWriter
+from gui.async_search import AsyncSearch
+from gui.virtual_tree import VirtualTreeview, PagedQuery
+from logic.dashboard_stats import invalidate_dashboard_stats
+from logic.catalog import (refresh_catalog, get_catalog, CATALOG_LOADED, STOCK_CHANGED,
+                           MEDICINE_UPDATED)
+from gui.catalog_events import watch_catalog
 from utils.helpers import (
     format_date_arabic, validate_price, validate_quantity, 
-    parse_date, log_stock_update
+    parse_date
 )
 
 class MedicinesWindow:
@@ -28,10 +37,9 @@ class MedicinesWindow:
         
         ttk.Label(self.search_frame, text="بحث:").pack(side=tk.RIGHT, padx=5)
         self.search_var = tk.StringVar()
-        self.search_var.trace('w', self.search_medicines)
         ttk.Entry(self.search_frame, textvariable=self.search_var).pack(side=tk.RIGHT, fill=tk.X, expand=True)
         
-        self.tree = ttk.Treeview(self.main_frame, 
+        self.tree = VirtualTreeview(self.main_frame, format_row=self.format_medicine,
                                  columns=("id", "name", "price", "quantity", "expiry_date", "manufacturer", "category", "location"),
                                 show="headings")
         
@@ -52,10 +60,24 @@ class MedicinesWindow:
         
         scrollbar = ttk.Scrollbar(self.tree, orient=tk.VERTICAL, command=self.tree.yview)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.set_scrollbar(scrollbar)
+        self.tree.tag_configure('low_stock', background='#ffcccc')
+        
+        # Clicking a heading sorts in the database; nullable columns sort as ''
+        self.tree.enable_sorting({
+            "id": "id", "name": "name", "price": "price", "quantity": "quantity",
+            "expiry_date": "expiry_date", "manufacturer": "IFNULL(manufacturer, '')",
+            "category": "IFNULL(category, '')", "location": "IFNULL(location, '')",
+        })
         
         self.tree.bind("<Double-1>", self.edit_medicine)
         
+        # Search runs in the background as the user types
+        self.search = AsyncSearch(self.window, self.search_var, self.fetch_medicines, self.show_medicines)
+        
+        # Changes made anywhere in the application show up without pressing refresh
+        watch_catalog(self.window, self.on_catalog_change)
+        
         self.refresh_medicines()
         self.check_alerts()
     
@@ -63,75 +85,52 @@ class MedicinesWindow:
         self.user_data = user_data
 
     def refresh_medicines(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        db = DatabaseConnection()
-        conn = db.connect()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute("""
-                SELECT id, name, price, quantity, expiry_date, 
-                       manufacturer, category, location, min_stock_level
-                FROM medicines 
-                WHERE is_active = 1 
-                ORDER BY name
-            """)
-            for medicine in cursor.fetchall():
-                expiry_date = format_date_arabic(medicine[4])
-                price = f"{medicine[2]:.2f}"
-                values = (medicine[0], medicine[1], price, medicine[3], 
-                         expiry_date, medicine[5], medicine[6], medicine[7])
-                
-                if medicine[3] <= medicine[8]:
-                    self.tree.insert("", tk.END, values=values, tags=('low_stock',))
-                else:
-                    self.tree.insert("", tk.END, values=values)
-            
-            self.tree.tag_configure('low_stock', background='#ffcccc')
+            self.tree.show(self.medicines_query(self.search_var.get().strip()))
         except Exception as e:
             messagebox.showerror("خطأ", f"حدث خطأ أثناء تحميل بيانات الأدوية: {str(e)}")
-        finally:
-            db.close()
     
-    def search_medicines(self, *args):
-        search_term = self.search_var.get().strip()
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        if not search_term:
-            self.refresh_medicines()
-            return
-        
-        db = DatabaseConnection()
-        conn = db.connect()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute("""
-                SELECT id, name, price, quantity, expiry_date, 
-                       manufacturer, category, location, min_stock_level
-                FROM medicines 
-                WHERE is_active = 1 
-                AND (name LIKE ? OR manufacturer LIKE ? OR category LIKE ? OR barcode LIKE ?)
-                ORDER BY name
-            """, (f"%{search_term}%", f"%{search_term}%", f"%{search_term}%", f"%{search_term}%"))
-            
-            for medicine in cursor.fetchall():
-                expiry_date = format_date_arabic(medicine[4])
-                price = f"{medicine[2]:.2f}"
-                values = (medicine[0], medicine[1], price, medicine[3], 
-                         expiry_date, medicine[5], medicine[6], medicine[7])
-                
-                if medicine[3] <= medicine[8]:
-                    self.tree.insert("", tk.END, values=values, tags=('low_stock',))
-                else:
-                    self.tree.insert("", tk.END, values=values)
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ أثناء البحث: {str(e)}")
-        finally:
-            db.close()
+    def medicines_query(self, search_term):
+        """Build the paged listing of active medicines, filtered by search_term."""
+        where, params = "is_active = 1", ()
+        if search_term:
+            condition, params = match_condition(search_term)
+            where += f" AND {condition}"
+        query = PagedQuery("""
+            id, name, price, quantity, expiry_date, 
+            manufacturer, category, location, min_stock_level
+        """, "medicines", where, params)
+        # Keep the sort order the user picked
+        if self.tree.query is not None:
+            query = query.with_order(self.tree.query.order_by, self.tree.query.descending)
+        return query
+    
+    def fetch_medicines(self, cursor, search_term):
+        """Count and read the first page of the listing; runs on the search thread."""
+        query = self.medicines_query(search_term)
+        return query, query.count(cursor), query.fetch_after(cursor, None, self.tree.page_size)
+    
+    def show_medicines(self, search_term, result):
+        self.tree.show(*result)
+    
+    def on_catalog_change(self, kinds, medicine_ids):
+        """Patch edited rows from the catalog; re-read the listing when rows come or go."""
+        catalog = get_catalog()
+        medicines = [catalog.get(medicine_id) for medicine_id in medicine_ids] if catalog.loaded else [None]
+        if kinds <= {STOCK_CHANGED, MEDICINE_UPDATED} and None not in medicines:
+            self.tree.update_rows({m.id: (m.id, m.name, m.price, m.quantity, m.expiry_date, m.manufacturer,
+                                          m.category, m.location, m.min_stock_level)
+                                   for m in medicines})
+        elif kinds - {CATALOG_LOADED}:
+            self.tree.reload()
+    
+    def format_medicine(self, medicine):
+        expiry_date = format_date_arabic(medicine[4])
+        price = f"{medicine[2]:.2f}"
+        values = (medicine[0], medicine[1], price, medicine[3], 
+                 expiry_date, medicine[5], medicine[6], medicine[7])
+        tags = ('low_stock',) if medicine[3] <= medicine[8] else ()
+        return values, tags
     
     def add_medicine(self):
         dialog = tk.Toplevel(self.window)
@@ -211,17 +210,17 @@ class MedicinesWindow:
                         ))
                     
                     medicine_id = cursor.lastrowid
-
-                    if self.user_data:
-                        log_stock_update(
-                            db, medicine_id, 0, quantity,
-                            self.user_data.get('username', 'unknown'), "إضافة دواء جديد"
-                        )
+                    if quantity:
+                        # الكمية الافتتاحية هي أول تشغيلة للدواء، وتسجل في سجل حركات المخزون
+                        username = self.user_data.get('username', 'unknown') if self.user_data else None
+                        with LedgerWriter(cursor, username, "إضافة دواء جديد") as ledger:
+                            receive_lot(cursor, medicine_id, quantity, expiry_date_db, sync=False, ledger=ledger)
 
                     conn.commit()
+                    invalidate_dashboard_stats()
+                    refresh_catalog(medicine_id)
                     messagebox.showinfo("نجاح", "تمت إضافة الدواء بنجاح")
                     dialog.destroy()
-                    self.refresh_medicines()
                 except Exception as e:
                     conn.rollback()
                     messagebox.showerror("خطأ", f"حدث خطأ أثناء الإضافة: {str(e)}")
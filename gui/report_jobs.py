@@ -0,0 +1,128 @@
+import tkinter as tk
+from datetime import datetime
+from tkinter import ttk, messagebox
+from logic.report_jobs import get_report_runner, DONE, FAILED, CANCELLED, STATUS_NAMES
+
+# How often job progress is picked up on the Tk thread
+JOB_POLL_MS = 100
+# How often the history panel refreshes while it is visible
+HISTORY_REFRESH_MS = 500
+
+
+def watch_job(widget, job, on_done, on_progress=None, on_error=None, on_cancel=None):
+    """
+    Deliver a ReportJob's progress and outcome on the Tk thread.
+
+    on_progress(done, total) is called while the job runs, then one of
+    on_done(result), on_error(error) or on_cancel(). Nothing is delivered
+    once the widget has been destroyed.
+    """
+    last = [None]
+
+    def poll():
+        if not widget.winfo_exists():
+            job.cancel()
+            return
+        progress = (job.done, job.total)
+        if on_progress is not None and progress != last[0]:
+            last[0] = progress
+            on_progress(*progress)
+        if not job.finished:
+            widget.after(JOB_POLL_MS, poll)
+        elif job.status == DONE:
+            on_done(job.result)
+        elif job.status == FAILED:
+            if on_error is not None:
+                on_error(job.error)
+            else:
+                messagebox.showerror("خطأ", f"حدث خطأ أثناء إعداد التقرير: {str(job.error)}")
+        elif on_cancel is not None:
+            on_cancel()
+
+    widget.after(JOB_POLL_MS, poll)
+
+
+class JobHistoryPanel(ttk.Frame):
+    """Running, queued and finished report jobs, with cancel and clear buttons."""
+    def __init__(self, parent, runner=None, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.runner = runner or get_report_runner()
+
+        columns = ("id", "name", "status", "progress", "started", "duration")
+        self.tree = ttk.Treeview(self, columns=columns, show="headings", height=12)
+        self.tree.heading("id", text="#")
+        self.tree.heading("name", text="التقرير")
+        self.tree.heading("status", text="الحالة")
+        self.tree.heading("progress", text="التقدم")
+        self.tree.heading("started", text="البدء")
+        self.tree.heading("duration", text="المدة")
+        self.tree.column("id", width=40)
+        self.tree.column("name", width=250)
+        self.tree.column("status", width=100)
+        self.tree.column("progress", width=120)
+        self.tree.column("started", width=100)
+        self.tree.column("duration", width=80)
+
+        scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+
+        buttons_frame = ttk.Frame(self)
+        buttons_frame.pack(fill=tk.X, pady=5)
+        ttk.Button(buttons_frame, text="إلغاء المهمة", command=self.cancel_selected).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(buttons_frame, text="مسح السجل", command=self.clear_history).pack(side=tk.RIGHT, padx=5)
+
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(fill=tk.BOTH, expand=True)
+
+        self.tree.tag_configure(FAILED, foreground="red")
+        self.tree.tag_configure(CANCELLED, foreground="gray")
+
+        self._refresh_id = None
+        self.bind('<Map>', lambda e: self.refresh())
+        self.bind('<Unmap>', lambda e: self._stop_refresh())
+        self.bind('<Destroy>', lambda e: self._stop_refresh() if e.widget is self else None)
+
+    def refresh(self):
+        """Redraw the job list; repeats while the panel is shown."""
+        self._stop_refresh()
+        selected = set(self.tree.selection())
+        self.tree.delete(*self.tree.get_children())
+
+        for job in self.runner.jobs():
+            if job.total:
+                progress = f"{job.done} / {job.total}"
+            else:
+                progress = str(job.done) if job.done else ""
+            started = datetime.fromtimestamp(job.started_at).strftime("%H:%M:%S") if job.started_at else ""
+            duration = job.duration()
+            iid = str(job.id)
+            self.tree.insert("", tk.END, iid=iid, tags=(job.status,), values=(
+                job.id,
+                job.name,
+                STATUS_NAMES[job.status],
+                progress,
+                started,
+                f"{duration:.1f} ث" if duration is not None else ""
+            ))
+            if iid in selected:
+                self.tree.selection_add(iid)
+
+        self._refresh_id = self.after(HISTORY_REFRESH_MS, self.refresh)
+
+    def _stop_refresh(self):
+        if self._refresh_id is not None:
+            self.after_cancel(self._refresh_id)
+            self._refresh_id = None
+
+    def cancel_selected(self):
+        selected = {int(iid) for iid in self.tree.selection()}
+        if not selected:
+            messagebox.showwarning("تنبيه", "الرجاء اختيار مهمة لإلغائها")
+            return
+        for job in self.runner.jobs():
+            if job.id in selected and not job.finished:
+                job.cancel()
+
+    def clear_history(self):
+        self.runner.clear_history()
+        self.refresh()
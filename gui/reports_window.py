@@ -2,10 +2,15 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from datetime import datetime, timedelta
 import os
-import csv
 import sqlite3
-from database.db_connection import DatabaseConnection
+from database.queries import SALES_IN_RANGE_SQL, DAILY_TOTALS_SQL
+from utils.helpers import sale_date_range, format_currency_with_name
 from gui.sales_window import SalesWindow
+from gui.virtual_tree import VirtualTreeview, PagedQuery
+from gui.export_dialog import ExportDialog
+from gui.report_jobs import JobHistoryPanel, watch_job
+from logic.report_jobs import get_report_runner
+from logic.expiry import get_expiry_tracker, expiry_ordinal
 
 class ReportsWindow:
     def __init__(self, parent):
@@ -30,6 +35,12 @@ class ReportsWindow:
         self.notebook.add(self.inventory_report_tab, text="تقارير المخزون")
         self.notebook.add(self.expiry_report_tab, text="تقارير الصلاحية")
 
+        # Reports run as background jobs so the rest of the application stays responsive
+        self.runner = get_report_runner()
+        self._jobs = {}  # report tab -> job currently loading it
+        self.jobs_tab = JobHistoryPanel(self.notebook, self.runner)
+        self.notebook.add(self.jobs_tab, text="المهام")
+
         # Setup sales report tab
         self.setup_sales_report_tab()
 
@@ -39,6 +50,28 @@ class ReportsWindow:
         # Setup expiry report tab
         self.setup_expiry_report_tab()
 
+    def run_report(self, slot, name, load, show, error_message):
+        """
+        Run load(cursor, job) as a report job and pass its result to show() on the Tk thread.
+
+        A newer report for the same slot cancels the one still loading.
+        """
+        previous = self._jobs.get(slot)
+        if previous is not None and not previous.finished:
+            previous.cancel()
+        job = self.runner.submit(name, load)
+        self._jobs[slot] = job
+
+        def on_done(result):
+            # A report that finished just as it was replaced is dropped
+            if self._jobs.get(slot) is job:
+                show(result)
+
+        def on_error(error):
+            messagebox.showerror("خطأ", f"{error_message}: {str(error)}")
+
+        watch_job(self.window, job, on_done, on_error=on_error)
+
     def setup_sales_report_tab(self):
         # Create frame for report options
         options_frame = ttk.LabelFrame(self.sales_report_tab, text="خيارات التقرير")
@@ -189,13 +222,14 @@ class ReportsWindow:
         self.inventory_report_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
         # Create treeview for report data
-        self.inventory_tree = ttk.Treeview(self.inventory_report_frame)
+        # Rows are paged from the database as the user scrolls
+        self.inventory_tree = VirtualTreeview(self.inventory_report_frame, format_row=self.format_inventory_row)
         self.inventory_tree.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
 
         # Add scrollbar
         scrollbar = ttk.Scrollbar(self.inventory_report_frame, orient=tk.VERTICAL, command=self.inventory_tree.yview)
         scrollbar.pack(fill=tk.Y, side=tk.RIGHT)
-        self.inventory_tree.configure(yscrollcommand=scrollbar.set)
+        self.inventory_tree.set_scrollbar(scrollbar)
 
         # Create frame for report summary
         self.inventory_summary_frame = ttk.LabelFrame(self.inventory_report_tab, text="ملخص التقرير")
@@ -363,30 +397,25 @@ class ReportsWindow:
             self.report_tree.column("sales_count", width=150)
             self.report_tree.column("total_amount", width=150)
 
-        # Get data from database
-        db = DatabaseConnection()
-        conn = db.connect()
-        cursor = conn.cursor()
+        if report_type == "daily":
+            query, params = SALES_IN_RANGE_SQL, sale_date_range(start_date)
+            name = f"تقرير المبيعات اليومي {start_date}"
+        else:
+            query, params = DAILY_TOTALS_SQL, sale_date_range(start_date, end_date)
+            name = f"تقرير المبيعات {start_date} - {end_date}"
 
-        try:
-            if report_type == "daily":
-                # Get daily sales
-                cursor.execute("""
-                    SELECT s.id, s.sale_date, s.subtotal, s.discount_amount,
-                           s.vat_amount, s.total, COUNT(si.id) as item_count
-                    FROM sales s
-                    LEFT JOIN sale_items si ON s.id = si.sale_id
-                    WHERE date(s.sale_date) = ?
-                    GROUP BY s.id
-                    ORDER BY s.sale_date DESC
-                """, (start_date,))
-
-                sales = cursor.fetchall()
+        def load(cursor, job):
+            cursor.execute(query, params)
+            return cursor.fetchall()
 
+        def show(rows):
+            self.report_tree.delete(*self.report_tree.get_children())
+            total_sales = 0
+            total_items = 0
+
+            if report_type == "daily":
                 # Add sales to treeview
-                total_sales = 0
-                total_items = 0
-                for sale in sales:
+                for sale in rows:
                     sale_id, sale_date, subtotal, discount, vat, total, item_count = sale
 
                     # Convert full datetime to just time
@@ -406,32 +435,9 @@ class ReportsWindow:
                     ))
                     total_sales += total
                     total_items += 1
-
-                # Update summary
-                from utils.helpers import format_currency_with_name
-                self.total_sales_var.set(format_currency_with_name(total_sales))
-                self.total_items_var.set(str(total_items))
-
-                # Calculate average sale value
-                avg_sale = total_sales / total_items if total_items > 0 else 0
-                self.avg_sale_var.set(format_currency_with_name(avg_sale))
-
-            elif report_type in ["monthly", "custom"]:
-                # Get daily totals
-                cursor.execute("""
-                    SELECT date(s.sale_date) as day, COUNT(s.id) as sales_count, SUM(s.total) as total_amount
-                    FROM sales s
-                    WHERE date(s.sale_date) BETWEEN ? AND ?
-                    GROUP BY day
-                    ORDER BY day
-                """, (start_date, end_date))
-
-                daily_totals = cursor.fetchall()
-
+            else:
                 # Add daily totals to treeview
-                total_sales = 0
-                total_items = 0
-                for daily in daily_totals:
+                for daily in rows:
                     day, sales_count, daily_total = daily
                     self.report_tree.insert("", tk.END, values=(
                         day,
@@ -441,19 +447,15 @@ class ReportsWindow:
                     total_sales += daily_total
                     total_items += sales_count
 
-                # Update summary
-                from utils.helpers import format_currency_with_name
-                self.total_sales_var.set(format_currency_with_name(total_sales))
-                self.total_items_var.set(str(total_items))
+            # Update summary
+            self.total_sales_var.set(format_currency_with_name(total_sales))
+            self.total_items_var.set(str(total_items))
 
-                # Calculate average sale value
-                avg_sale = total_sales / total_items if total_items > 0 else 0
-                self.avg_sale_var.set(format_currency_with_name(avg_sale))
+            # Calculate average sale value
+            avg_sale = total_sales / total_items if total_items > 0 else 0
+            self.avg_sale_var.set(format_currency_with_name(avg_sale))
 
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ أثناء تحميل بيانات المبيعات: {str(e)}")
-        finally:
-            db.close()
+        self.run_report("sales", name, load, show, "حدث خطأ أثناء تحميل بيانات المبيعات")
 
     def export_sales_report(self):
         """Export sales report to CSV file"""
@@ -518,97 +520,41 @@ class ReportsWindow:
         if not filepath:
             return
 
-        # Get data from database
-        db = DatabaseConnection()
-        conn = db.connect()
-        cursor = conn.cursor()
-
-        try:
-            with open(filepath, 'w', newline='', encoding='utf-8-sig') as csvfile:
-                writer = csv.writer(csvfile)
-
-                if report_type == "daily":
-                    # Write headers
-                    writer.writerow(['رقم الفاتورة', 'التاريخ', 'عدد الأصناف', 'المجموع الفرعي',
-                                    'الخصم', 'الضريبة', 'الإجمالي'])
-
-                    # Get daily sales
-                    cursor.execute("""
-                        SELECT s.id, s.sale_date, s.subtotal, s.discount_amount,
-                               s.vat_amount, s.total, COUNT(si.id) as item_count
-                        FROM sales s
-                        LEFT JOIN sale_items si ON s.id = si.sale_id
-                        WHERE date(s.sale_date) = ?
-                        GROUP BY s.id
-                        ORDER BY s.sale_date DESC
-                    """, (start_date,))
-
-                    sales = cursor.fetchall()
-
-                    # Write data
-                    total_sales = 0
-                    for sale in sales:
-                        sale_id, sale_date, subtotal, discount, vat, total, item_count = sale
-                        writer.writerow([
-                            sale_id,
-                            sale_date,
-                            item_count,
-                            f"{subtotal:.2f}",
-                            f"{discount:.2f}",
-                            f"{vat:.2f}",
-                            f"{total:.2f}"
-                        ])
-                        total_sales += total
-
-                    # Write summary
-                    writer.writerow([])
-                    writer.writerow(['الإجمالي', '', '', '', '', '', f"{total_sales:.2f}"])
-
-                elif report_type in ["monthly", "custom"]:
-                    # Write headers
-                    writer.writerow(['التاريخ', 'عدد الفواتير', 'إجمالي المبيعات'])
-
-                    # Get daily totals
-                    cursor.execute("""
-                        SELECT date(s.sale_date) as day, COUNT(s.id) as sales_count, SUM(s.total) as total_amount
-                        FROM sales s
-                        WHERE date(s.sale_date) BETWEEN ? AND ?
-                        GROUP BY day
-                        ORDER BY day
-                    """, (start_date, end_date))
-
-                    daily_totals = cursor.fetchall()
-
-                    # Write data
-                    total_sales = 0
-                    total_count = 0
-                    for daily in daily_totals:
-                        day, sales_count, daily_total = daily
-                        writer.writerow([
-                            day,
-                            sales_count,
-                            f"{daily_total:.2f}"
-                        ])
-                        total_sales += daily_total
-                        total_count += sales_count
-
-                    # Write summary
-                    writer.writerow([])
-                    writer.writerow(['الإجمالي', total_count, f"{total_sales:.2f}"])
-
-            messagebox.showinfo("تصدير التقرير", f"تم تصدير التقرير بنجاح إلى:\n{filepath}")
-
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ أثناء تصدير التقرير: {str(e)}")
-        finally:
-            db.close()
+        totals = {'count': 0, 'sales': 0}
+
+        if report_type == "daily":
+            header = ['رقم الفاتورة', 'التاريخ', 'عدد الأصناف', 'المجموع الفرعي',
+                      'الخصم', 'الضريبة', 'الإجمالي']
+            query, params = SALES_IN_RANGE_SQL, sale_date_range(start_date)
+            count_query = "SELECT COUNT(*) FROM sales WHERE sale_date >= ? AND sale_date < ?"
+
+            def format_row(sale):
+                sale_id, sale_date, subtotal, discount, vat, total, item_count = sale
+                totals['sales'] += total
+                return [sale_id, sale_date, item_count, f"{subtotal:.2f}",
+                        f"{discount:.2f}", f"{vat:.2f}", f"{total:.2f}"]
+
+            def footer():
+                return [[], ['الإجمالي', '', '', '', '', '', f"{totals['sales']:.2f}"]]
+        else:
+            header = ['التاريخ', 'عدد الفواتير', 'إجمالي المبيعات']
+            query, params = DAILY_TOTALS_SQL, sale_date_range(start_date, end_date)
+            count_query = "SELECT COUNT(*) FROM daily_sales_summary WHERE day >= ? AND day < ?"
+
+            def format_row(daily):
+                day, sales_count, daily_total = daily
+                totals['sales'] += daily_total
+                totals['count'] += sales_count
+                return [day, sales_count, f"{daily_total:.2f}"]
+
+            def footer():
+                return [[], ['الإجمالي', totals['count'], f"{totals['sales']:.2f}"]]
+
+        ExportDialog(self.window, filepath, header, query, params, format_row, footer,
+                     count_query=count_query, count_params=params)
 
     def display_inventory_report(self):
         """Display inventory report based on selected options"""
-        # Clear previous data
-        for item in self.inventory_tree.get_children():
-            self.inventory_tree.delete(item)
-
         report_type = self.inventory_report_type.get()
 
         # Configure treeview columns
@@ -629,86 +575,64 @@ class ReportsWindow:
         self.inventory_tree.column("min_level", width=80)
         self.inventory_tree.column("status", width=100)
 
-        # Get data from database
-        db = DatabaseConnection()
-        conn = db.connect()
-        cursor = conn.cursor()
-
-        try:
-            # Build query based on report type
-            query = """
-                SELECT id, name, quantity, price, min_stock_level
+        # Server-side sorting on heading click
+        self.inventory_tree.enable_sorting({
+            "id": "id", "name": "name", "quantity": "quantity", "price": "price",
+            "value": "quantity * price", "min_level": "IFNULL(min_stock_level, 0)",
+        })
+
+        # Configure tag colors
+        self.inventory_tree.tag_configure("نفذت", foreground="red")
+        self.inventory_tree.tag_configure("منخفض", foreground="orange")
+        self.inventory_tree.tag_configure("جيد", foreground="green")
+
+        # Filter based on report type
+        where = ""
+        if report_type == "low_stock":
+            where = "quantity <= min_stock_level AND quantity > 0"
+        elif report_type == "out_of_stock":
+            where = "quantity = 0"
+
+        def load(cursor, job):
+            # Totals are aggregated in SQL; only the visible rows are loaded
+            cursor.execute(f"""
+                SELECT COUNT(*),
+                       COALESCE(SUM(quantity * price), 0),
+                       COALESCE(SUM(CASE WHEN quantity <= min_stock_level AND quantity > 0 THEN 1 ELSE 0 END), 0)
                 FROM medicines
-                WHERE 1=1
-            """
+                {"WHERE " + where if where else ""}
+            """)
+            return cursor.fetchone()
 
-            if report_type == "low_stock":
-                query += " AND quantity <= min_stock_level AND quantity > 0"
-            elif report_type == "out_of_stock":
-                query += " AND quantity = 0"
-
-            query += " ORDER BY name"
-
-            cursor.execute(query)
-            medicines = cursor.fetchall()
-
-            # Add medicines to treeview
-            total_items = 0
-            total_value = 0
-            low_stock_count = 0
-
-            for med in medicines:
-                med_id, name, quantity, price, min_level = med
-
-                # Calculate value
-                value = quantity * price
-
-                # Determine status
-                if quantity == 0:
-                    status = "نفذت"
-                    status_color = "red"
-                elif quantity <= min_level:
-                    status = "منخفض"
-                    status_color = "orange"
-                else:
-                    status = "جيد"
-                    status_color = "green"
-
-                # Insert into treeview
-                item_id = self.inventory_tree.insert("", tk.END, values=(
-                    med_id,
-                    name,
-                    quantity,
-                    f"{price:.2f}",
-                    f"{value:.2f}",
-                    min_level,
-                    status
-                ))
-
-                # Set item color based on status
-                self.inventory_tree.item(item_id, tags=(status,))
-
-                # Update totals
-                total_items += 1
-                total_value += value
-                if quantity <= min_level and quantity > 0:
-                    low_stock_count += 1
-
-            # Configure tag colors
-            self.inventory_tree.tag_configure("نفذت", foreground="red")
-            self.inventory_tree.tag_configure("منخفض", foreground="orange")
-            self.inventory_tree.tag_configure("جيد", foreground="green")
+        def show(summary):
+            total_items, total_value, low_stock_count = summary
+            self.inventory_tree.show(PagedQuery("id, name, quantity, price, min_stock_level",
+                                                "medicines", where), total_items)
 
             # Update summary
-            from utils.helpers import format_currency_with_name
             self.total_items_count_var.set(str(total_items))
             self.total_value_var.set(format_currency_with_name(total_value))
             self.low_stock_count_var.set(str(low_stock_count))
 
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ أثناء تحميل بيانات المخزون: {str(e)}")
-        finally:
-            db.close()
+        self.run_report("inventory", "تقرير المخزون", load, show, "حدث خطأ أثناء تحميل بيانات المخزون")
+
+    def format_inventory_row(self, med):
+        """Treeview values and status tag for an inventory report row"""
+        med_id, name, quantity, price, min_level = med
+
+        # Calculate value
+        value = quantity * price
+
+        # Determine status
+        if quantity == 0:
+            status = "نفذت"
+        elif quantity <= min_level:
+            status = "منخفض"
+        else:
+            status = "جيد"
+
+        values = (med_id, name, quantity, f"{price:.2f}", f"{value:.2f}", min_level, status)
+        return values, (status,)
 
     def export_inventory_report(self):
         """Export inventory report to CSV file"""
@@ -732,74 +656,29 @@ class ReportsWindow:
         if not filepath:
             return
 
-        # Get data from database
-        db = DatabaseConnection()
-        conn = db.connect()
-        cursor = conn.cursor()
-
-        try:
-            with open(filepath, 'w', newline='', encoding='utf-8-sig') as csvfile:
-                writer = csv.writer(csvfile)
-
-                # Write headers
-                writer.writerow(['الرقم', 'اسم الدواء', 'الكمية', 'السعر', 'القيمة', 'الحد الأدنى', 'الحالة'])
-
-                # Build query based on report type
-                query = """
-                    SELECT id, name, quantity, price, min_stock_level
-                    FROM medicines
-                    WHERE 1=1
-                """
-
-                if report_type == "low_stock":
-                    query += " AND quantity <= min_stock_level AND quantity > 0"
-                elif report_type == "out_of_stock":
-                    query += " AND quantity = 0"
-
-                query += " ORDER BY name"
-
-                cursor.execute(query)
-                medicines = cursor.fetchall()
-
-                # Write data
-                total_value = 0
-                for med in medicines:
-                    med_id, name, quantity, price, min_level = med
-
-                    # Calculate value
-                    value = quantity * price
-
-                    # Determine status
-                    if quantity == 0:
-                        status = "نفذت"
-                    elif quantity <= min_level:
-                        status = "منخفض"
-                    else:
-                        status = "جيد"
-
-                    # Write row
-                    writer.writerow([
-                        med_id,
-                        name,
-                        quantity,
-                        f"{price:.2f}",
-                        f"{value:.2f}",
-                        min_level,
-                        status
-                    ])
-
-                    total_value += value
-
-                # Write summary
-                writer.writerow([])
-                writer.writerow(['الإجمالي', '', '', '', f"{total_value:.2f}", '', ''])
-
-            messagebox.showinfo("تصدير التقرير", f"تم تصدير تقرير المخزون بنجاح إلى:\n{filepath}")
-
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ أثناء تصدير التقرير: {str(e)}")
-        finally:
-            db.close()
+        # Build query based on report type
+        condition = ""
+        if report_type == "low_stock":
+            condition = " WHERE quantity <= min_stock_level AND quantity > 0"
+        elif report_type == "out_of_stock":
+            condition = " WHERE quantity = 0"
+
+        query = f"SELECT id, name, quantity, price, min_stock_level FROM medicines{condition} ORDER BY name"
+        totals = {'value': 0}
+
+        def format_row(med):
+            values, _ = self.format_inventory_row(med)
+            totals['value'] += med[2] * med[3]
+            return values
+
+        def footer():
+            return [[], ['الإجمالي', '', '', '', f"{totals['value']:.2f}", '', '']]
+
+        ExportDialog(self.window, filepath,
+                     ['الرقم', 'اسم الدواء', 'الكمية', 'السعر', 'القيمة', 'الحد الأدنى', 'الحالة'],
+                     query, (), format_row, footer,
+                     count_query=f"SELECT COUNT(*) FROM medicines{condition}",
+                     done_message="تم تصدير تقرير المخزون بنجاح")
 
     def display_expiry_report(self):
         """Display expiry report based on selected options"""
@@ -817,14 +696,11 @@ class ReportsWindow:
         else:
             days = int(self.expiry_period.get())
 
-        # Calculate expiry date threshold
-        today = datetime.now().date()
-        threshold_date = today + timedelta(days=days)
-
         # Configure treeview columns
-        self.expiry_tree["columns"] = ("id", "name", "expiry_date", "days_remaining", "quantity", "price", "value")
+        self.expiry_tree["columns"] = ("id", "name", "lot", "expiry_date", "days_remaining", "quantity", "price", "value")
         self.expiry_tree.heading("id", text="الرقم")
         self.expiry_tree.heading("name", text="اسم الدواء")
+        self.expiry_tree.heading("lot", text="التشغيلة")
         self.expiry_tree.heading("expiry_date", text="تاريخ انتهاء الصلاحية")
         self.expiry_tree.heading("days_remaining", text="الأيام المتبقية")
         self.expiry_tree.heading("quantity", text="الكمية")
@@ -833,27 +709,19 @@ class ReportsWindow:
 
         self.expiry_tree.column("id", width=50)
         self.expiry_tree.column("name", width=180)
+        self.expiry_tree.column("lot", width=90)
         self.expiry_tree.column("expiry_date", width=120)
         self.expiry_tree.column("days_remaining", width=100)
         self.expiry_tree.column("quantity", width=80)
         self.expiry_tree.column("price", width=80)
         self.expiry_tree.column("value", width=100)
 
-        # Get data from database
-        db = DatabaseConnection()
-        conn = db.connect()
-        cursor = conn.cursor()
+        def load(cursor, job):
+            # Lots that will expire within the period, from the in-memory expiry index
+            return get_expiry_tracker().expiring(days)
 
-        try:
-            # Get medicines that will expire within the period
-            cursor.execute("""
-                SELECT id, name, expiry_date, quantity, price
-                FROM medicines
-                WHERE quantity > 0 AND date(expiry_date) <= date(?)
-                ORDER BY expiry_date
-            """, (threshold_date.isoformat(),))
-
-            medicines = cursor.fetchall()
+        def show(medicines):
+            self.expiry_tree.delete(*self.expiry_tree.get_children())
 
             # Add medicines to treeview
             total_items = 0
@@ -861,46 +729,29 @@ class ReportsWindow:
             expired_count = 0
 
             for med in medicines:
-                med_id, name, expiry_date_str, quantity, price = med
-
-                try:
-                    # Parse expiry date
-                    expiry_date = datetime.strptime(expiry_date_str, "%Y-%m-%d").date()
-
-                    # Calculate days remaining
-                    days_remaining = (expiry_date - today).days
-
-                    # Calculate value
-                    value = quantity * price
-
-                    # Insert into treeview with appropriate tag
-                    if days_remaining < 0:
-                        tag = "expired"
-                        status_text = f"منتهي ({abs(days_remaining)} يوم)"
-                        expired_count += 1
-                    else:
-                        tag = "expiring"
-                        status_text = f"{days_remaining} يوم"
-
-                    item_id = self.expiry_tree.insert("", tk.END, values=(
-                        med_id,
-                        name,
-                        expiry_date_str,
-                        status_text,
-                        quantity,
-                        f"{price:.2f}",
-                        f"{value:.2f}"
-                    ))
-
-                    # Set item color based on status
-                    self.expiry_tree.item(item_id, tags=(tag,))
-
-                    # Update totals
-                    total_items += 1
-                    total_value += value
+                # Insert into treeview with appropriate tag
+                if med.days_remaining < 0:
+                    tag = "expired"
+                    status_text = f"منتهي ({abs(med.days_remaining)} يوم)"
+                    expired_count += 1
+                else:
+                    tag = "expiring"
+                    status_text = f"{med.days_remaining} يوم"
+
+                self.expiry_tree.insert("", tk.END, tags=(tag,), values=(
+                    med.id,
+                    med.name,
+                    med.lot_number or med.lot_id,
+                    med.expiry_date,
+                    status_text,
+                    med.quantity,
+                    f"{med.price:.2f}",
+                    f"{med.value:.2f}"
+                ))
 
-                except Exception as e:
-                    print(f"Error processing medicine {med_id}: {e}")
+                # Update totals
+                total_items += 1
+                total_value += med.value
 
             # Configure tag colors
             self.expiry_tree.tag_configure("expired", foreground="red")
@@ -910,10 +761,8 @@ class ReportsWindow:
             if total_items == 0:
                 messagebox.showinfo("معلومات", f"لا توجد أدوية ستنتهي صلاحيتها خلال {days} يوم")
 
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ أثناء تحميل بيانات الصلاحية: {str(e)}")
-        finally:
-            db.close()
+        self.run_report("expiry", f"تقرير الصلاحية {days} يوم", load, show,
+                        "حدث خطأ أثناء تحميل بيانات الصلاحية")
 
     def export_expiry_report(self):
         """Export expiry report to CSV file"""
@@ -944,77 +793,45 @@ class ReportsWindow:
         if not filepath:
             return
 
-        # Get data from database
-        db = DatabaseConnection()
-        conn = db.connect()
-        cursor = conn.cursor()
-
-        try:
-            with open(filepath, 'w', newline='', encoding='utf-8-sig') as csvfile:
-                writer = csv.writer(csvfile)
-
-                # Write headers
-                writer.writerow(['الرقم', 'اسم الدواء', 'تاريخ انتهاء الصلاحية', 'الأيام المتبقية',
-                                'الكمية', 'السعر', 'القيمة'])
+        totals = {'value': 0, 'expired': 0}
 
-                # Get medicines that will expire within the period
-                cursor.execute("""
-                    SELECT id, name, expiry_date, quantity, price
-                    FROM medicines
-                    WHERE quantity > 0 AND date(expiry_date) <= date(?)
-                    ORDER BY expiry_date
-                """, (threshold_date.isoformat(),))
+        def format_row(med):
+            med_id, name, lot, expiry_date_str, quantity, price = med
+            expiry_day = expiry_ordinal(expiry_date_str)
+            if expiry_day is None:
+                print(f"Error processing medicine {med_id}: invalid expiry date {expiry_date_str!r}")
+                return None
 
-                medicines = cursor.fetchall()
+            days_remaining = expiry_day - today.toordinal()
+            value = quantity * price
 
-                # Write data
-                total_value = 0
-                expired_count = 0
-
-                for med in medicines:
-                    med_id, name, expiry_date_str, quantity, price = med
-
-                    try:
-                        # Parse expiry date
-                        expiry_date = datetime.strptime(expiry_date_str, "%Y-%m-%d").date()
-
-                        # Calculate days remaining
-                        days_remaining = (expiry_date - today).days
-
-                        # Calculate value
-                        value = quantity * price
-
-                        # Status text
-                        if days_remaining < 0:
-                            status_text = f"منتهي ({abs(days_remaining)} يوم)"
-                            expired_count += 1
-                        else:
-                            status_text = f"{days_remaining} يوم"
-
-                        # Write row
-                        writer.writerow([
-                            med_id,
-                            name,
-                            expiry_date_str,
-                            status_text,
-                            quantity,
-                            f"{price:.2f}",
-                            f"{value:.2f}"
-                        ])
-
-                        total_value += value
-
-                    except Exception as e:
-                        print(f"Error processing medicine {med_id}: {e}")
-
-                # Write summary
-                writer.writerow([])
-                writer.writerow(['الإجمالي', '', '', '', '', '', f"{total_value:.2f}"])
-                writer.writerow(['أدوية منتهية الصلاحية', expired_count, '', '', '', '', ''])
-
-            messagebox.showinfo("تصدير التقرير", f"تم تصدير تقرير الصلاحية بنجاح إلى:\n{filepath}")
-
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ أثناء تصدير التقرير: {str(e)}")
-        finally:
-            db.close()
\ No newline at end of file
+            # Status text
+            if days_remaining < 0:
+                status_text = f"منتهي ({abs(days_remaining)} يوم)"
+                totals['expired'] += 1
+            else:
+                status_text = f"{days_remaining} يوم"
+
+            totals['value'] += value
+            return [med_id, name, lot, expiry_date_str, status_text, quantity, f"{price:.2f}", f"{value:.2f}"]
+
+        def footer():
+            return [[],
+                    ['الإجمالي', '', '', '', '', '', '', f"{totals['value']:.2f}"],
+                    ['تشغيلات منتهية الصلاحية', totals['expired'], '', '', '', '', '', '']]
+
+        # Lots that will expire within the period
+        source = """
+            FROM medicine_lots l
+            JOIN medicines m ON m.id = l.medicine_id
+            WHERE l.quantity > 0 AND m.is_active = 1 AND l.expiry_date <= ?
+        """
+        params = (threshold_date.isoformat(),)
+        ExportDialog(self.window, filepath,
+                     ['الرقم', 'اسم الدواء', 'التشغيلة', 'تاريخ انتهاء الصلاحية', 'الأيام المتبقية',
+                      'الكمية', 'السعر', 'القيمة'],
+                     f"SELECT m.id, m.name, COALESCE(l.lot_number, l.id), l.expiry_date, l.quantity, m.price {source} "
+                     "ORDER BY l.expiry_date",
+                     params, format_row, footer,
+                     count_query=f"SELECT COUNT(*) {source}", count_params=params,
+                     done_message="تم تصدير تقرير الصلاحية بنجاح")
\ No newline at end of file
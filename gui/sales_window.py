@@ -1,7 +1,15 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from database.db_connection import DatabaseConnection
+from database.queries import SALES_IN_RANGE_SQL, DAILY_TOTALS_SQL
+from database.search import search_medicines as find_medicines
+from gui.async_search import AsyncSearch
+from gui.export_dialog import ExportDialog
 from logic.billing import BillingSystem
+from logic.catalog import get_catalog
+from logic.sales_queue import get_sales_queue, SALE_COMMITTED, SALE_FAILED
+from gui.catalog_events import watch_catalog
+from utils.helpers import sale_date_range, month_date_range
 from datetime import datetime
 
 class SalesWindow:
@@ -87,6 +95,16 @@ class SalesWindow:
         # تحميل البيانات الأولية
         self.refresh_sales()
 
+        # الفواتير المحفوظة في قائمة الانتظار تظهر عند تسجيلها في قاعدة البيانات
+        watch_catalog(self.window, self.on_queue_change, get_sales_queue())
+
+    def on_queue_change(self, kinds, keys):
+        if SALE_COMMITTED in kinds:
+            self.refresh_sales()
+        if SALE_FAILED in kinds:
+            errors = [error for key, _, error in get_sales_queue().failed() if key in keys]
+            messagebox.showerror("خطأ", "تعذر تسجيل فاتورة محفوظة في قاعدة البيانات:\n" + "\n".join(errors))
+
     def refresh_sales(self):
         # مسح العناصر الموجودة
         for item in self.sales_tree.get_children():
@@ -101,15 +119,7 @@ class SalesWindow:
 
         try:
             # الحصول على المبيعات
-            cursor.execute("""
-                SELECT s.id, s.sale_date, s.subtotal, s.discount_amount,
-                       s.vat_amount, s.total, COUNT(si.id) as item_count
-                FROM sales s
-                LEFT JOIN sale_items si ON s.id = si.sale_id
-                WHERE date(s.sale_date) = ?
-                GROUP BY s.id
-                ORDER BY s.sale_date DESC
-            """, (date,))
+            cursor.execute(SALES_IN_RANGE_SQL, sale_date_range(date))
 
             sales = cursor.fetchall()
 
@@ -305,6 +315,16 @@ class SalesWindow:
         # زر إضافة الدواء
         ttk.Button(search_inner_frame, text="إضافة للفاتورة", command=lambda: add_to_cart()).grid(row=2, column=3, padx=5, pady=5, sticky=tk.E)
 
+        # قارئ الباركود: المسح يضيف الدواء مباشرة من الكتالوج في الذاكرة دون الرجوع لقاعدة البيانات
+        ttk.Label(search_inner_frame, text="باركود:").grid(row=3, column=0, padx=5, pady=5, sticky=tk.E)
+        barcode_var = tk.StringVar()
+        barcode_entry = ttk.Entry(search_inner_frame, textvariable=barcode_var, width=30)
+        barcode_entry.grid(row=3, column=1, padx=5, pady=5, sticky=tk.W)
+        barcode_entry.bind('<Return>', lambda e: scan_barcode())
+        scan_status = ttk.Label(search_inner_frame, text="")
+        scan_status.grid(row=3, column=2, columnspan=2, padx=5, pady=5, sticky=tk.W)
+        barcode_entry.focus_set()
+
         # إنشاء إطار عناصر الفاتورة
         cart_frame = ttk.LabelFrame(main_frame, text="عناصر الفاتورة")
         cart_frame.pack(fill=tk.BOTH, expand=True, pady=5)
@@ -367,43 +387,31 @@ class SalesWindow:
         # قائمة لتخزين العناصر المضافة
         cart_items = []
 
-        # دالة البحث عن الأدوية
-        def search_medicines(*args):
-            search_term = search_var.get().strip()
-
+        # دالة البحث عن الأدوية (تعمل في الخلفية)
+        def search_medicines(cursor, search_term):
+            # أسماء الأدوية من الكتالوج في الذاكرة، وقاعدة البيانات للبحث بالشركة أو الفئة
+            catalog = get_catalog()
+            if catalog.loaded:
+                found = catalog.search(search_term, limit=10, in_stock_only=True)
+                if found:
+                    return [(m.id, m.name, m.price, m.quantity) for m in found]
+            return find_medicines(cursor, search_term, columns="m.id, m.name, m.price, m.quantity",
+                                  in_stock_only=True, limit=10)
+
+        # دالة عرض نتائج البحث
+        def show_medicines(search_term, results):
             # مسح القائمة الحالية
             for item in medicine_list.get_children():
                 medicine_list.delete(item)
 
-            if not search_term:
-                return
-
-            # البحث في قاعدة البيانات
-            db = DatabaseConnection()
-            conn = db.connect()
-            cursor = conn.cursor()
-
-            try:
-                cursor.execute("""
-                    SELECT id, name, price, quantity
-                    FROM medicines
-                    WHERE name LIKE ? AND quantity > 0
-                    ORDER BY name
-                    LIMIT 10
-                """, ("%" + search_term + "%",))
-
-                for medicine in cursor.fetchall():
-                    # تنسيق السعر لعرضه بشكل صحيح
-                    formatted_medicine = list(medicine)
-                    formatted_medicine[2] = float(medicine[2])  # تأكد من أن السعر رقم عشري
-                    medicine_list.insert("", tk.END, values=formatted_medicine)
-            except Exception as e:
-                messagebox.showerror("خطأ", "حدث خطأ أثناء البحث: " + str(e))
-            finally:
-                db.close()
+            for medicine in results:
+                # تنسيق السعر لعرضه بشكل صحيح
+                formatted_medicine = list(medicine)
+                formatted_medicine[2] = float(medicine[2])  # تأكد من أن السعر رقم عشري
+                medicine_list.insert("", tk.END, values=formatted_medicine)
 
-        # ربط دالة البحث بتغيير النص
-        search_var.trace('w', search_medicines)
+        # ربط البحث بتغيير النص
+        AsyncSearch(sale_window, search_var, search_medicines, show_medicines)
 
         # دالة إضافة دواء للفاتورة
         def add_to_cart():
@@ -414,20 +422,39 @@ class SalesWindow:
 
             # الحصول على بيانات الدواء المحدد
             medicine_data = medicine_list.item(selected[0])['values']
-            medicine_id = medicine_data[0]
-            medicine_name = medicine_data[1]
-            medicine_price = float(medicine_data[2])  # تحويل السعر إلى رقم عشري
-            medicine_stock = medicine_data[3]
+            add_line(medicine_data[0], medicine_data[1], float(medicine_data[2]), medicine_data[3],
+                     quantity_var.get())
+
+        # دالة إضافة دواء عن طريق مسح الباركود
+        def scan_barcode():
+            barcode = barcode_var.get().strip()
+            barcode_var.set("")
+            if not barcode:
+                return
+
+            medicine = get_catalog().by_barcode(barcode)
+            if medicine is None:
+                scan_status.config(text="باركود غير معروف: {}".format(barcode), foreground="red")
+                return
+
+            def warn(message):
+                scan_status.config(text=message, foreground="red")
 
+            if add_line(medicine.id, medicine.name, float(medicine.price), medicine.quantity,
+                        quantity_var.get(), warn):
+                scan_status.config(text="تمت إضافة {}".format(medicine.name), foreground="green")
+
+        def add_line(medicine_id, medicine_name, medicine_price, medicine_stock, quantity,
+                     warn=lambda message: messagebox.showwarning("تنبيه", message)):
+            """إضافة سطر للفاتورة؛ يعيد True عند النجاح"""
             # التحقق من الكمية
-            quantity = quantity_var.get()
             if quantity <= 0:
-                messagebox.showwarning("تنبيه", "الرجاء إدخال كمية صحيحة")
-                return
+                warn("الرجاء إدخال كمية صحيحة")
+                return False
 
             if quantity > medicine_stock:
-                messagebox.showwarning("تنبيه", "الكمية المتوفرة ({}) أقل من الكمية المطلوبة ({})".format(medicine_stock, quantity))
-                return
+                warn("الكمية المتوفرة ({}) أقل من الكمية المطلوبة ({})".format(medicine_stock, quantity))
+                return False
 
             # التحقق مما إذا كان الدواء موجودًا بالفعل في الفاتورة
             for i, item in enumerate(cart_items):
@@ -435,8 +462,8 @@ class SalesWindow:
                     # تحديث الكمية إذا كان الدواء موجودًا بالفعل
                     new_quantity = item['quantity'] + quantity
                     if new_quantity > medicine_stock:
-                        messagebox.showwarning("تنبيه", "الكمية المتوفرة ({}) أقل من الكمية المطلوبة ({})".format(medicine_stock, new_quantity))
-                        return
+                        warn("الكمية المتوفرة ({}) أقل من الكمية المطلوبة ({})".format(medicine_stock, new_quantity))
+                        return False
 
                     cart_items[i]['quantity'] = new_quantity
                     cart_items[i]['total'] = new_quantity * medicine_price
@@ -444,7 +471,7 @@ class SalesWindow:
                     # تحديث العرض
                     refresh_cart()
                     calculate_totals()
-                    return
+                    return True
 
             # إضافة الدواء إلى الفاتورة
             item = {
@@ -460,6 +487,7 @@ class SalesWindow:
             # تحديث العرض
             refresh_cart()
             calculate_totals()
+            return True
 
         # دالة تحديث عرض عناصر الفاتورة
         def refresh_cart():
@@ -522,8 +550,8 @@ class SalesWindow:
 
             discount_percentage = discount_var.get()
 
-            # استخدام نظام الفواتير لإنشاء الفاتورة
-            success, total = self.billing_system.create_sale(cart_items, discount_percentage)
+            # تحفظ الفاتورة في قائمة الانتظار المحلية وتسجل في قاعدة البيانات في الخلفية
+            success, total = get_sales_queue().submit(cart_items, discount_percentage)
 
             if success:
                 from utils.helpers import format_currency_with_name
@@ -663,9 +691,6 @@ class SalesWindow:
 
     def export_sales_report(self):
         """تصدير تقرير المبيعات"""
-        from datetime import datetime
-        import csv
-        import os
 
         # الحصول على التاريخ
         date = self.date_var.get().strip()
@@ -684,57 +709,27 @@ class SalesWindow:
         if not filepath:
             return
 
-        # الحصول على بيانات المبيعات
-        db = DatabaseConnection()
-        conn = db.connect()
-        cursor = conn.cursor()
-
-        try:
-            # الحصول على المبيعات
-            cursor.execute("""
-                SELECT s.id, s.sale_date, s.subtotal, s.discount_amount,
-                       s.vat_amount, s.total, COUNT(si.id) as item_count
-                FROM sales s
-                LEFT JOIN sale_items si ON s.id = si.sale_id
-                WHERE date(s.sale_date) = ?
-                GROUP BY s.id
-                ORDER BY s.sale_date DESC
-            """, (date,))
-
-            sales = cursor.fetchall()
-
-            # كتابة البيانات إلى ملف CSV
-            with open(filepath, 'w', newline='', encoding='utf-8-sig') as csvfile:
-                writer = csv.writer(csvfile)
+        totals = {'sales': 0}
 
-                # كتابة العناوين
-                writer.writerow(['رقم الفاتورة', 'التاريخ', 'عدد الأصناف', 'المجموع الفرعي', 'الخصم', 'الضريبة', 'الإجمالي'])
+        def format_row(sale):
+            sale_id, sale_date, subtotal, discount, vat, total, item_count = sale
+            totals['sales'] += total
+            return [sale_id, sale_date, item_count, f"{subtotal:.2f}",
+                    f"{discount:.2f}", f"{vat:.2f}", f"{total:.2f}"]
 
-                # كتابة البيانات
-                total_sales = 0
-                for sale in sales:
-                    sale_id, sale_date, subtotal, discount, vat, total, item_count = sale
-                    writer.writerow([
-                        sale_id,
-                        sale_date,
-                        item_count,
-                        f"{subtotal:.2f}",
-                        f"{discount:.2f}",
-                        f"{vat:.2f}",
-                        f"{total:.2f}"
-                    ])
-                    total_sales += total
-
-                # كتابة الإجمالي
-                writer.writerow([])
-                writer.writerow(['الإجمالي', '', '', '', '', '', f"{total_sales:.2f}"])
-
-            messagebox.showinfo("تصدير التقرير", f"تم تصدير تقرير المبيعات بنجاح إلى:\n{filepath}")
+        def footer():
+            # كتابة الإجمالي
+            return [[], ['الإجمالي', '', '', '', '', '', f"{totals['sales']:.2f}"]]
 
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ أثناء تصدير تقرير المبيعات: {str(e)}")
-        finally:
-            db.close()
+        # تصدير المبيعات في الخلفية دون تحميلها كلها في الذاكرة
+        params = sale_date_range(date)
+        ExportDialog(self.window,
+                     filepath,
+                     ['رقم الفاتورة', 'التاريخ', 'عدد الأصناف', 'المجموع الفرعي', 'الخصم', 'الضريبة', 'الإجمالي'],
+                     SALES_IN_RANGE_SQL, params, format_row, footer,
+                     count_query="SELECT COUNT(*) FROM sales WHERE sale_date >= ? AND sale_date < ?",
+                     count_params=params,
+                     done_message="تم تصدير تقرير المبيعات بنجاح")
 
     def generate_monthly_report(self):
         """إنشاء تقرير شهري للمبيعات"""
@@ -818,13 +813,7 @@ class SalesWindow:
 
             try:
                 # الحصول على المبيعات اليومية للشهر
-                cursor.execute("""
-                    SELECT date(s.sale_date) as day, SUM(s.total) as daily_total, COUNT(s.id) as invoice_count
-                    FROM sales s
-                    WHERE strftime('%m', s.sale_date) = ? AND strftime('%Y', s.sale_date) = ?
-                    GROUP BY date(s.sale_date)
-                    ORDER BY day
-                """, (f"{month:02d}", f"{year}"))
+                cursor.execute(DAILY_TOTALS_SQL, month_date_range(year, month))
 
                 daily_sales = cursor.fetchall()
 
@@ -832,7 +821,7 @@ class SalesWindow:
                 total_sales = 0
                 total_invoices = 0
 
-                for day, daily_total, invoice_count in daily_sales:
+                for day, invoice_count, daily_total in daily_sales:
                     total_sales += daily_total
                     total_invoices += invoice_count
 
@@ -873,7 +862,7 @@ class SalesWindow:
                     daily_tree.configure(yscrollcommand=scrollbar.set)
 
                     # إضافة البيانات
-                    for day, daily_total, invoice_count in daily_sales:
+                    for day, invoice_count, daily_total in daily_sales:
                         daily_tree.insert("", tk.END, values=(
                             day,
                             f"{daily_total:.2f}",
@@ -911,59 +900,26 @@ class SalesWindow:
             if not filepath:
                 return
 
-            # الحصول على بيانات المبيعات
-            db = DatabaseConnection()
-            conn = db.connect()
-            cursor = conn.cursor()
-
-            try:
-                # الحصول على المبيعات اليومية للشهر
-                cursor.execute("""
-                    SELECT date(s.sale_date) as day, SUM(s.total) as daily_total, COUNT(s.id) as invoice_count
-                    FROM sales s
-                    WHERE strftime('%m', s.sale_date) = ? AND strftime('%Y', s.sale_date) = ?
-                    GROUP BY date(s.sale_date)
-                    ORDER BY day
-                """, (f"{month:02d}", f"{year}"))
-
-                daily_sales = cursor.fetchall()
-
-                # كتابة البيانات إلى ملف CSV
-                import csv
-                with open(filepath, 'w', newline='', encoding='utf-8-sig') as csvfile:
-                    writer = csv.writer(csvfile)
-
-                    # كتابة العناوين
-                    writer.writerow(['اليوم', 'إجمالي المبيعات', 'عدد الفواتير'])
-
-                    # كتابة البيانات
-                    total_sales = 0
-                    total_invoices = 0
-
-                    for day, daily_total, invoice_count in daily_sales:
-                        writer.writerow([
-                            day,
-                            f"{daily_total:.2f}",
-                            invoice_count
-                        ])
-                        total_sales += daily_total
-                        total_invoices += invoice_count
-
-                    # كتابة الإجمالي
-                    writer.writerow([])
-                    writer.writerow(['الإجمالي', f"{total_sales:.2f}", total_invoices])
-
-                    # كتابة المتوسط
-                    if len(daily_sales) > 0:
-                        avg_sales = total_sales / len(daily_sales)
-                        writer.writerow(['المتوسط اليومي', f"{avg_sales:.2f}", f"{total_invoices/len(daily_sales):.2f}"])
-
-                messagebox.showinfo("تصدير التقرير", f"تم تصدير تقرير المبيعات الشهري بنجاح إلى:\n{filepath}")
-
-            except Exception as e:
-                messagebox.showerror("خطأ", f"حدث خطأ أثناء تصدير تقرير المبيعات الشهري: {str(e)}")
-            finally:
-                db.close()
+            totals = {'sales': 0, 'invoices': 0, 'days': 0}
+
+            def format_row(daily):
+                day, invoice_count, daily_total = daily
+                totals['sales'] += daily_total
+                totals['invoices'] += invoice_count
+                totals['days'] += 1
+                return [day, f"{daily_total:.2f}", invoice_count]
+
+            def footer():
+                # كتابة الإجمالي والمتوسط
+                rows = [[], ['الإجمالي', f"{totals['sales']:.2f}", totals['invoices']]]
+                if totals['days'] > 0:
+                    rows.append(['المتوسط اليومي', f"{totals['sales'] / totals['days']:.2f}",
+                                 f"{totals['invoices'] / totals['days']:.2f}"])
+                return rows
+
+            ExportDialog(report_window, filepath, ['اليوم', 'إجمالي المبيعات', 'عدد الفواتير'],
+                         DAILY_TOTALS_SQL, month_date_range(year, month), format_row, footer,
+                         done_message="تم تصدير تقرير المبيعات الشهري بنجاح")
 
         # تحميل البيانات الأولية
         load_monthly_report()
\ No newline at end of file
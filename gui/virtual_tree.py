@@ -0,0 +1,312 @@
+import tkinter as tk
+import tkinter.font as tkfont
+from collections import OrderedDict
+from tkinter import ttk
+from database.db_connection import DatabaseConnection
+
+# Rows fetched per query and the number of pages kept in memory
+PAGE_SIZE = 200
+CACHED_PAGES = 4
+# Rows scrolled per mouse wheel notch
+WHEEL_ROWS = 3
+
+
+class PagedQuery:
+    """
+    A table listing that can be read one page at a time with keyset pagination.
+
+    Rows are ordered by (order_by, key). Each page continues from the last
+    (sort value, key) of the previous one, so reading page N costs the same
+    as reading page 1. Only a jump with the scrollbar to a page no neighbour
+    is known for falls back to OFFSET.
+
+    order_by must never be NULL; wrap nullable columns in IFNULL().
+    """
+    def __init__(self, columns, from_clause, where='', params=(), order_by='name',
+                 key='id', descending=False):
+        self.columns = columns
+        self.from_clause = from_clause
+        self.where = where
+        self.params = tuple(params)
+        self.order_by = order_by
+        self.key = key
+        self.descending = descending
+
+    def with_order(self, order_by, descending=False):
+        """Return the same listing sorted by another expression."""
+        return PagedQuery(self.columns, self.from_clause, self.where, self.params,
+                          order_by, self.key, descending)
+
+    def _select(self, condition=None, reverse=False):
+        conditions = [c for c in (self.where, condition) if c]
+        where = f"WHERE {' AND '.join(f'({c})' for c in conditions)}" if conditions else ''
+        direction = 'DESC' if self.descending != reverse else 'ASC'
+        # The sort value and key ride along at the end of each row as anchors
+        return f'''
+            SELECT {self.columns}, {self.order_by}, {self.key}
+            FROM {self.from_clause}
+            {where}
+            ORDER BY {self.order_by} {direction}, {self.key} {direction}
+            LIMIT ?
+        '''
+
+    def count(self, cursor):
+        where = f"WHERE {self.where}" if self.where else ''
+        cursor.execute(f"SELECT COUNT(*) FROM {self.from_clause} {where}", self.params)
+        return cursor.fetchone()[0]
+
+    def fetch_after(self, cursor, anchor, limit):
+        """Rows following anchor, or the first rows when anchor is None."""
+        if anchor is None:
+            cursor.execute(self._select(), self.params + (limit,))
+        else:
+            op = '<' if self.descending else '>'
+            condition = f"({self.order_by}, {self.key}) {op} (?, ?)"
+            cursor.execute(self._select(condition), self.params + tuple(anchor) + (limit,))
+        return cursor.fetchall()
+
+    def fetch_before(self, cursor, anchor, limit):
+        """Rows preceding anchor, in listing order."""
+        op = '>' if self.descending else '<'
+        condition = f"({self.order_by}, {self.key}) {op} (?, ?)"
+        cursor.execute(self._select(condition, reverse=True), self.params + tuple(anchor) + (limit,))
+        return cursor.fetchall()[::-1]
+
+    def fetch_at(self, cursor, offset, limit):
+        """Rows at an absolute position, for jumps to an unvisited page."""
+        sql = self._select() + " OFFSET ?"
+        cursor.execute(sql, self.params + (limit, offset))
+        return cursor.fetchall()
+
+    @staticmethod
+    def anchor(row):
+        return row[-2], row[-1]
+
+
+class VirtualTreeview(ttk.Treeview):
+    """
+    A Treeview that shows a PagedQuery without loading it.
+
+    Only the rows that fit in the widget are inserted as items; scrolling
+    re-renders them from a small cache of pages fetched on demand. Item ids
+    are the row keys, so selection() and item() work as on a plain
+    Treeview. format_row(row) returns (values, tags) for a fetched row.
+    """
+    def __init__(self, parent, format_row=None, page_size=PAGE_SIZE, cached_pages=CACHED_PAGES,
+                 db_name='pharmacy.db', **kwargs):
+        super().__init__(parent, **kwargs)
+        self.format_row = format_row or (lambda row: (row, ()))
+        self.page_size = page_size
+        self.cached_pages = cached_pages
+        self.db_name = db_name
+
+        self.query = None
+        self.total = 0
+        self.offset = 0
+        self.visible_rows = 20
+        self._pages = OrderedDict()
+        self._anchors = {}  # page number -> anchor of its last row
+        self._scrollbar = None
+        self._sortable = {}
+        self._headings = {}
+
+        self.bind('<Configure>', self._on_configure, add='+')
+        self.bind('<MouseWheel>', self._on_mousewheel)
+        self.bind('<Button-4>', lambda e: self._scroll_and_break(-WHEEL_ROWS))
+        self.bind('<Button-5>', lambda e: self._scroll_and_break(WHEEL_ROWS))
+        for key in ('<Up>', '<Down>', '<Prior>', '<Next>', '<Home>', '<End>'):
+            self.bind(key, self._on_key)
+
+    def set_scrollbar(self, scrollbar):
+        """Drive a scrollbar whose command is this widget's yview."""
+        self._scrollbar = scrollbar
+        self._update_scrollbar()
+
+    def enable_sorting(self, sortable):
+        """Sort on the server when a heading is clicked; sortable maps column -> SQL expression."""
+        self._sortable = dict(sortable)
+        for column in self._sortable:
+            self._headings[column] = self.heading(column, 'text')
+            self.heading(column, command=lambda c=column: self.sort_by(c))
+
+    def show(self, query, total=None, first_rows=None):
+        """Display a new listing from the top; total and first_rows may be prefetched."""
+        self.query = query
+        self._reset_cache()
+        self.offset = 0
+        if first_rows is not None:
+            self._store_page(0, first_rows)
+        if total is None:
+            with DatabaseConnection(self.db_name).checkout() as conn:
+                total = query.count(conn.cursor())
+        self.total = total
+        self._render()
+
+    def reload(self):
+        """Re-read the current listing, keeping the scroll position."""
+        if self.query is None:
+            return
+        offset = self.offset
+        self.show(self.query)
+        self.scroll_to(offset)
+
+    def update_rows(self, rows):
+        """
+        Replace cached rows in place from {key: row} without querying.
+
+        Rows keep their position until the next reload, even if a changed
+        value would sort them elsewhere.
+        """
+        changed = False
+        for page in self._pages.values():
+            for index, row in enumerate(page):
+                key = row[-1]
+                if key in rows:
+                    page[index] = tuple(rows[key]) + row[-2:]
+                    changed = True
+        if changed:
+            self._render()
+        return changed
+
+    def sort_by(self, column):
+        if self.query is None or column not in self._sortable:
+            return
+        expression = self._sortable[column]
+        descending = self.query.order_by == expression and not self.query.descending
+        for name, text in self._headings.items():
+            marker = (' ▼' if descending else ' ▲') if name == column else ''
+            self.heading(name, text=text + marker)
+        self.show(self.query.with_order(expression, descending), self.total)
+
+    def scroll_to(self, offset):
+        last_offset = max(0, self.total - self.visible_rows)
+        offset = max(0, min(int(offset), last_offset))
+        if offset != self.offset:
+            self.offset = offset
+            self._render()
+
+    def scroll_rows(self, count):
+        self.scroll_to(self.offset + count)
+
+    def yview(self, *args):
+        """Scrollbar protocol: moveto FRACTION or scroll N units|pages."""
+        if not args:
+            return self._fractions()
+        if args[0] == 'moveto':
+            self.scroll_to(float(args[1]) * self.total)
+        elif args[0] == 'scroll':
+            step = self.visible_rows if args[2] == 'pages' else 1
+            self.scroll_rows(int(args[1]) * step)
+
+    def _fractions(self):
+        if not self.total:
+            return 0.0, 1.0
+        first = self.offset / self.total
+        last = min(1.0, (self.offset + self.visible_rows) / self.total)
+        return first, last
+
+    def _update_scrollbar(self):
+        if self._scrollbar is not None:
+            self._scrollbar.set(*self._fractions())
+
+    def _reset_cache(self):
+        self._pages.clear()
+        self._anchors.clear()
+
+    def _store_page(self, page_no, rows):
+        self._pages[page_no] = rows
+        self._pages.move_to_end(page_no)
+        while len(self._pages) > self.cached_pages:
+            self._pages.popitem(last=False)
+        if len(rows) == self.page_size:
+            self._anchors[page_no] = PagedQuery.anchor(rows[-1])
+
+    def _fetch_page(self, cursor, page_no):
+        if page_no == 0:
+            return self.query.fetch_after(cursor, None, self.page_size)
+        if page_no - 1 in self._anchors:
+            return self.query.fetch_after(cursor, self._anchors[page_no - 1], self.page_size)
+        following = self._pages.get(page_no + 1)
+        if following:
+            return self.query.fetch_before(cursor, PagedQuery.anchor(following[0]), self.page_size)
+        return self.query.fetch_at(cursor, page_no * self.page_size, self.page_size)
+
+    def _rows(self, start, count):
+        """Return rows start..start+count, fetching missing pages."""
+        first_page = start // self.page_size
+        last_page = (start + count - 1) // self.page_size
+        missing = [n for n in range(first_page, last_page + 1) if n not in self._pages]
+        if missing:
+            with DatabaseConnection(self.db_name).checkout() as conn:
+                cursor = conn.cursor()
+                for page_no in missing:
+                    self._store_page(page_no, self._fetch_page(cursor, page_no))
+
+        rows = []
+        for page_no in range(first_page, last_page + 1):
+            self._pages.move_to_end(page_no)
+            rows.extend(self._pages[page_no])
+        skip = start - first_page * self.page_size
+        return rows[skip:skip + count]
+
+    def _render(self):
+        selected = set(self.selection())
+        focus = self.focus()
+        self.delete(*self.get_children())
+
+        if self.query is not None and self.total:
+            for row in self._rows(self.offset, self.visible_rows):
+                iid = str(PagedQuery.anchor(row)[1])
+                values, tags = self.format_row(row[:-2])
+                self.insert('', tk.END, iid=iid, values=values, tags=tags)
+
+        self.selection_set([iid for iid in selected if self.exists(iid)])
+        if focus and self.exists(focus):
+            self.focus(focus)
+        self._update_scrollbar()
+
+    def _on_configure(self, event):
+        style = ttk.Style(self)
+        try:
+            row_height = int(style.lookup(self.cget('style') or 'Treeview', 'rowheight'))
+        except (TypeError, ValueError):
+            row_height = tkfont.nametofont('TkDefaultFont').metrics('linespace') + 4
+        header = row_height + 6 if 'headings' in str(self.cget('show')) else 0
+        visible = max(1, (event.height - header) // row_height)
+        if visible != self.visible_rows:
+            self.visible_rows = visible
+            self.offset = max(0, min(self.offset, self.total - visible))
+            self._render()
+
+    def _scroll_and_break(self, count):
+        self.scroll_rows(count)
+        return 'break'
+
+    def _on_mousewheel(self, event):
+        notches = event.delta // 120 if abs(event.delta) >= 120 else (1 if event.delta > 0 else -1)
+        return self._scroll_and_break(-notches * WHEEL_ROWS)
+
+    def _on_key(self, event):
+        """Move the selection past the rendered rows by scrolling the window."""
+        children = self.get_children()
+        if not children:
+            return None
+        focus = self.focus()
+        index = children.index(focus) if focus in children else 0
+        moves = {'Up': -1, 'Down': 1, 'Prior': -self.visible_rows, 'Next': self.visible_rows,
+                 'Home': -self.total, 'End': self.total}
+        target = self.offset + index + moves[event.keysym]
+        target = max(0, min(target, self.total - 1))
+        if self.offset <= target < self.offset + len(children):
+            if event.keysym in ('Up', 'Down'):
+                return None  # Treeview's own binding moves within the window
+        elif target < self.offset:
+            self.scroll_to(target)
+        else:
+            self.scroll_to(target - self.visible_rows + 1)
+
+        children = self.get_children()
+        item = children[target - self.offset]
+        self.focus(item)
+        self.selection_set(item)
+        return 'break'
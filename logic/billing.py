@@ -1,115 +1,26 @@
+import sqlite3
+import time
 from database.db_connection import DatabaseConnection
+from database.migrations import migrate
+from database.queries import SALE_LINES_SQL, SALES_TOTAL_SQL
+from database.rollups import add_sale_to_rollups
+from database.lots import allocate_sale
+from logic.dashboard_stats import invalidate_dashboard_stats
+from logic.catalog import catalog_for
+from utils.helpers import sale_date_range
 from datetime import datetime
 
+# How often a checkout retries BEGIN IMMEDIATE when another lane holds the write lock
+SALE_BUSY_RETRIES = 5
+SALE_BUSY_BACKOFF = 0.02  # seconds, doubled on each retry
+
 class BillingSystem:
-    def __init__(self, parent_frame):
+    def __init__(self, parent_frame, db_name='pharmacy.db'):
         self.parent_frame = parent_frame
-        self.db = DatabaseConnection()
+        self.db = DatabaseConnection(db_name)
+        self.catalog = catalog_for(db_name)
         self.VAT_RATE = 0.15  # 15% VAT
         
-        # Try to verify and fix the sales table structure
-        self._verify_database_structure()
-        
-    def _verify_database_structure(self):
-        """Verify that the database tables exist and have the right structure."""
-        conn = self.db.connect()
-        cursor = conn.cursor()
-        
-        try:
-            # Check if the sales table exists
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='sales'")
-            if cursor.fetchone() is None:
-                # Create sales table
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS sales (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        sale_date DATETIME NOT NULL,
-                        subtotal REAL NOT NULL DEFAULT 0,
-                        discount_percentage REAL DEFAULT 0,
-                        discount_amount REAL DEFAULT 0,
-                        vat_rate REAL DEFAULT 0.15,
-                        vat_amount REAL DEFAULT 0,
-                        total REAL NOT NULL DEFAULT 0,
-                        status TEXT NOT NULL DEFAULT 'completed'
-                    )
-                """)
-                print("Sales table created")
-                
-            # Check if sale_items table exists
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='sale_items'")
-            if cursor.fetchone() is None:
-                # Create sale_items table
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS sale_items (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        sale_id INTEGER NOT NULL,
-                        medicine_id INTEGER NOT NULL,
-                        quantity INTEGER NOT NULL,
-                        unit_price REAL NOT NULL,
-                        total_price REAL NOT NULL,
-                        FOREIGN KEY (sale_id) REFERENCES sales (id),
-                        FOREIGN KEY (medicine_id) REFERENCES medicines (id)
-                    )
-                """)
-                print("Sale_items table created")
-                
-            # Check if the sales table has all required columns
-            try:
-                cursor.execute("PRAGMA table_info(sales)")
-                columns = [column[1] for column in cursor.fetchall()]
-                
-                required_columns = ['subtotal', 'discount_percentage', 'discount_amount', 
-                                  'vat_rate', 'vat_amount', 'status']
-                missing_columns = [col for col in required_columns if col not in columns]
-                
-                if missing_columns:
-                    print(f"Sales table is missing columns: {missing_columns}")
-                    # We need to rebuild the table
-                    
-                    try:
-                        # Get existing data if possible
-                        cursor.execute("SELECT id, sale_date, total FROM sales")
-                        existing_sales = cursor.fetchall()
-                    except:
-                        existing_sales = []
-                    
-                    # Recreate the sales table
-                    cursor.execute("DROP TABLE IF EXISTS sales_old")
-                    cursor.execute("ALTER TABLE sales RENAME TO sales_old")
-                    cursor.execute("""
-                        CREATE TABLE sales (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            sale_date DATETIME NOT NULL,
-                            subtotal REAL NOT NULL DEFAULT 0,
-                            discount_percentage REAL DEFAULT 0,
-                            discount_amount REAL DEFAULT 0,
-                            vat_rate REAL DEFAULT 0.15,
-                            vat_amount REAL DEFAULT 0,
-                            total REAL NOT NULL DEFAULT 0,
-                            status TEXT NOT NULL DEFAULT 'completed'
-                        )
-                    """)
-                    
-                    # Restore existing data
-                    for sale in existing_sales:
-                        sale_id, sale_date, total = sale
-                        subtotal = total / 1.15  # Estimate the original subtotal
-                        vat_amount = total - subtotal
-                        cursor.execute("""
-                            INSERT INTO sales (id, sale_date, subtotal, vat_amount, total)
-                            VALUES (?, ?, ?, ?, ?)
-                        """, (sale_id, sale_date, subtotal, vat_amount, total))
-                    
-                    print("Sales table recreated with proper structure")
-            except Exception as e:
-                print(f"Error checking sales table structure: {e}")
-            
-            conn.commit()
-        except Exception as e:
-            print(f"Error verifying database structure: {e}")
-        finally:
-            conn.close()
-        
     def calculate_total_with_tax_and_discount(self, subtotal, discount_percentage=0):
         """Calculate final total with VAT and discount."""
         # Apply discount first
@@ -129,142 +40,186 @@ class BillingSystem:
             'total': total
         }
         
-    def create_sale(self, items, discount_percentage=0):
+    def create_sale(self, items, discount_percentage=0, idempotency_key=None):
         """Create a sale with multiple items and apply discount if any."""
+        try:
+            return True, self.record_sale(items, discount_percentage, idempotency_key)
+        except Exception as e:
+            print(f"Error creating sale: {e}")
+            return False, 0
+            
+    def record_sale(self, items, discount_percentage=0, idempotency_key=None, sale_date=None):
+        """
+        Commit a sale and return its total; raises if it could not be recorded.
+        
+        A sale whose idempotency_key is already in the sales table is not
+        recorded again; the total of the existing sale is returned.
+        sale_date ('YYYY-MM-DD HH:MM:SS', UTC like datetime('now')) books a
+        sale made earlier, such as one that waited in the sales queue.
+        """
         conn = self.db.connect()
         cursor = conn.cursor()
         
         try:
-            # Calculate subtotal and verify stock for all items first
-            subtotal = 0
-            for item in items:
-                medicine_id = item['medicine_id']
-                quantity = item['quantity']
-                
-                # Get medicine details
-                cursor.execute('SELECT price, quantity FROM medicines WHERE id = ?', (medicine_id,))
-                medicine = cursor.fetchone()
-                
-                if not medicine:
-                    raise Exception(f"الدواء غير موجود: {medicine_id}")
-                    
-                price, current_stock = medicine
-                
-                if current_stock < quantity:
-                    raise Exception(f"الكمية غير كافية للدواء: {medicine_id}")
-                    
-                item_total = price * quantity
-                subtotal += item_total
-            
-            # Calculate final totals with tax and discount
-            totals = self.calculate_total_with_tax_and_discount(subtotal, discount_percentage)
-            
-            # Create sale - use minimal columns for maximum compatibility
             try:
-                # First try to create table if it doesn't exist
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS sales (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        sale_date DATETIME NOT NULL,
-                        subtotal REAL DEFAULT 0,
-                        discount_percentage REAL DEFAULT 0,
-                        discount_amount REAL DEFAULT 0,
-                        vat_rate REAL DEFAULT 0.15,
-                        vat_amount REAL DEFAULT 0,
-                        total REAL DEFAULT 0,
-                        status TEXT DEFAULT 'completed'
-                    )
-                """)
-                
-                # Create sale_items table if it doesn't exist
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS sale_items (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        sale_id INTEGER NOT NULL,
-                        medicine_id INTEGER NOT NULL,
-                        quantity INTEGER NOT NULL,
-                        unit_price REAL DEFAULT 0,
-                        total_price REAL DEFAULT 0
-                    )
-                """)
-                
-                # Insert sale with minimal required columns
-                cursor.execute('''
-                    INSERT INTO sales (sale_date, total) 
-                    VALUES (datetime('now'), ?)
-                ''', (totals['total'],))
-                
-                sale_id = cursor.lastrowid
-            except Exception as insert_error:
-                print(f"Error inserting sale: {insert_error}")
-                # Last resort fallback - create a minimal sales table from scratch
-                try:
-                    cursor.execute("DROP TABLE IF EXISTS sales")
-                    cursor.execute("""
-                        CREATE TABLE sales (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            sale_date DATETIME NOT NULL,
-                            total REAL NOT NULL
-                        )
-                    """)
-                    
-                    cursor.execute("INSERT INTO sales (sale_date, total) VALUES (datetime('now'), ?)",
-                                  (totals['total'],))
-                    
-                    sale_id = cursor.lastrowid
-                except Exception as last_error:
-                    raise Exception(f"فشل في إنشاء الفاتورة: {last_error}")
+                total, allocation = self._run_sale_transaction(conn, cursor, items, discount_percentage,
+                                                               idempotency_key, sale_date)
+            except sqlite3.OperationalError as schema_error:
+                if 'no such' not in str(schema_error):
+                    raise
+                # The schema is behind; let the migration layer repair it and retry once
+                conn.rollback()
+                print(f"Sales schema out of date ({schema_error}), running migrations")
+                success, message = migrate(DatabaseConnection(self.db.db_path))
+                if not success:
+                    raise Exception(message)
+                total, allocation = self._run_sale_transaction(conn, cursor, items, discount_percentage,
+                                                               idempotency_key, sale_date)
             
-            # Create sale items and update stock
-            for item in items:
-                medicine_id = item['medicine_id']
-                quantity = item['quantity']
-                
-                # Get current price
-                cursor.execute('SELECT price FROM medicines WHERE id = ?', (medicine_id,))
-                price = cursor.fetchone()[0]
-                
-                # Try to add sale item with required fields only
-                try:
-                    cursor.execute('''
-                        INSERT INTO sale_items (sale_id, medicine_id, quantity)
-                        VALUES (?, ?, ?)
-                    ''', (sale_id, medicine_id, quantity))
-                except Exception as item_error:
-                    print(f"Error inserting sale item: {item_error}")
-                    # Last resort - create minimal table
-                    cursor.execute("DROP TABLE IF EXISTS sale_items")
-                    cursor.execute("""
-                        CREATE TABLE sale_items (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            sale_id INTEGER NOT NULL,
-                            medicine_id INTEGER NOT NULL,
-                            quantity INTEGER NOT NULL
-                        )
-                    """)
-                    
-                    cursor.execute('''
-                        INSERT INTO sale_items (sale_id, medicine_id, quantity)
-                        VALUES (?, ?, ?)
-                    ''', (sale_id, medicine_id, quantity))
-                
-                # Update stock
-                cursor.execute('''
-                    UPDATE medicines
-                    SET quantity = quantity - ?
-                    WHERE id = ?
-                ''', (quantity, medicine_id))
-            
-            conn.commit()
-            return True, totals['total']
-            
-        except Exception as e:
-            conn.rollback()
-            print(f"Error creating sale: {e}")
-            return False, 0
+            # None: the sale was recorded before and stock was already taken
+            if allocation is not None:
+                expiry_dates, lots = allocation
+                invalidate_dashboard_stats()
+                self.catalog.adjust_stock(self._cart_lines(items), expiry_dates, lots)
+            return total
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
         finally:
             self.db.close()
             
+    def _run_sale_transaction(self, conn, cursor, items, discount_percentage, idempotency_key=None,
+                              sale_date=None):
+        """Run the sale inside BEGIN IMMEDIATE, retrying while another lane holds the lock."""
+        if conn.in_transaction:
+            conn.commit()
+        
+        for attempt in range(SALE_BUSY_RETRIES + 1):
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                break
+            except sqlite3.OperationalError as e:
+                busy = 'locked' in str(e) or 'busy' in str(e)
+                if not busy or attempt == SALE_BUSY_RETRIES:
+                    raise
+                time.sleep(SALE_BUSY_BACKOFF * (2 ** attempt))
+        
+        if idempotency_key is not None:
+            cursor.execute("SELECT total FROM sales WHERE idempotency_key = ?", (idempotency_key,))
+            existing = cursor.fetchone()
+            if existing is not None:
+                conn.commit()
+                return existing[0], None
+        
+        result = self._insert_sale(cursor, items, discount_percentage, idempotency_key, sale_date)
+        conn.commit()
+        return result
+        
+    def _cart_lines(self, items):
+        """Merge cart items into {medicine_id: quantity}, keeping cart order."""
+        lines = {}
+        for item in items:
+            medicine_id = int(item['medicine_id'])
+            lines[medicine_id] = lines.get(medicine_id, 0) + int(item['quantity'])
+        return lines
+        
+    def _cart_cte(self, lines):
+        """Build a `WITH cart(medicine_id, quantity)` clause and its parameters."""
+        values = ', '.join(['(?, ?)'] * len(lines))
+        params = [value for line in lines.items() for value in line]
+        return f"WITH cart(medicine_id, quantity) AS (VALUES {values})", params
+        
+    def _reserve_stock(self, cursor, lines, cart_cte, cart_params):
+        """
+        Atomically decrement stock for every cart line.
+        
+        Each row is only updated while quantity >= the requested amount, so two
+        lanes selling the last box cannot both succeed. Raises if any line
+        could not be reserved; the caller rolls the transaction back.
+        """
+        cursor.execute(cart_cte + '''
+            UPDATE medicines
+            SET quantity = quantity - (
+                SELECT cart.quantity FROM cart WHERE cart.medicine_id = medicines.id
+            )
+            WHERE id IN (SELECT medicine_id FROM cart)
+            AND quantity >= (
+                SELECT cart.quantity FROM cart WHERE cart.medicine_id = medicines.id
+            )
+        ''', cart_params)
+        # cursor.rowcount is not reported for statements that start with WITH
+        cursor.execute("SELECT changes()")
+        if cursor.fetchone()[0] == len(lines):
+            return
+        
+        # Work out which line failed for the error message
+        cursor.execute(cart_cte + '''
+            SELECT cart.medicine_id, m.id
+            FROM cart
+            LEFT JOIN medicines m ON m.id = cart.medicine_id
+        ''', cart_params)
+        for medicine_id, found in cursor.fetchall():
+            if found is None:
+                raise Exception(f"الدواء غير موجود: {medicine_id}")
+        raise Exception("الكمية غير كافية لأحد الأدوية في الفاتورة")
+        
+    def _insert_sale(self, cursor, items, discount_percentage, idempotency_key=None, sale_date=None):
+        """
+        Checkout fast path: assumes the migrated schema and issues no DDL.
+        
+        Lines are priced from medicines.price unless they carry a unit_price,
+        which a queued sale priced at the counter does. Returns the sale total
+        and allocate_sale()'s ({medicine_id: earliest expiry left},
+        {lot_id: quantity taken}).
+        """
+        lines = self._cart_lines(items)
+        if not lines:
+            raise Exception("لا توجد أصناف في الفاتورة")
+        cart_cte, cart_params = self._cart_cte(lines)
+        
+        self._reserve_stock(cursor, lines, cart_cte, cart_params)
+        
+        # Price the whole cart in one query
+        cursor.execute(cart_cte + '''
+            SELECT cart.medicine_id, cart.quantity, m.price
+            FROM cart
+            JOIN medicines m ON m.id = cart.medicine_id
+        ''', cart_params)
+        
+        counter_prices = {int(item['medicine_id']): item['unit_price'] for item in items if 'unit_price' in item}
+        subtotal = 0
+        sale_items = []
+        for medicine_id, quantity, price in cursor.fetchall():
+            price = counter_prices.get(medicine_id, price)
+            sale_items.append((medicine_id, quantity, price, price * quantity))
+            subtotal += price * quantity
+        
+        # Calculate final totals with tax and discount
+        totals = self.calculate_total_with_tax_and_discount(subtotal, discount_percentage)
+        
+        cursor.execute('''
+            INSERT INTO sales (
+                sale_date, subtotal, discount_percentage, discount_amount,
+                vat_rate, vat_amount, total, status, idempotency_key
+            ) VALUES (COALESCE(?, datetime('now')), ?, ?, ?, ?, ?, ?, 'completed', ?)
+        ''', (sale_date, totals['subtotal'], totals['discount_percentage'], totals['discount_amount'],
+              totals['vat_rate'], totals['vat_amount'], totals['total'], idempotency_key))
+        sale_id = cursor.lastrowid
+        
+        cursor.executemany('''
+            INSERT INTO sale_items (sale_id, medicine_id, quantity, unit_price, total_price)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(sale_id,) + line for line in sale_items])
+        
+        # Keep the daily report rollups current in the same transaction
+        add_sale_to_rollups(cursor, sale_id)
+        
+        # Take the units from the earliest-expiring lots
+        allocation = allocate_sale(cursor, sale_id, lines)
+        
+        return totals['total'], allocation
+            
     def get_daily_sales(self, date=None):
         if not date:
             date = datetime.now().strftime('%Y-%m-%d')
@@ -273,62 +228,8 @@ class BillingSystem:
         cursor = conn.cursor()
         
         try:
-            # Make sure the tables exist
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS sales (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    sale_date DATETIME NOT NULL,
-                    total REAL DEFAULT 0
-                )
-            """)
-            
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS sale_items (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    sale_id INTEGER NOT NULL,
-                    medicine_id INTEGER NOT NULL,
-                    quantity INTEGER NOT NULL
-                )
-            """)
-            
-            # Use a very basic query that should work with any schema
-            try:
-                cursor.execute('''
-                    SELECT s.id, s.sale_date, s.total, 
-                           si.medicine_id, si.quantity,
-                           m.name as medicine_name
-                    FROM sales s
-                    JOIN sale_items si ON s.id = si.sale_id
-                    JOIN medicines m ON si.medicine_id = m.id
-                    WHERE date(s.sale_date) = ?
-                    ORDER BY s.sale_date DESC
-                ''', (date,))
-                
-                # Process the result to add zero values for missing columns
-                result = []
-                for row in cursor.fetchall():
-                    sale_id, sale_date, total, medicine_id, quantity, medicine_name = row
-                    
-                    # Calculate estimated values for missing columns
-                    subtotal = total / 1.15 if total else 0
-                    vat_amount = total - subtotal if total else 0
-                    unit_price = subtotal / quantity if quantity else 0
-                    total_price = unit_price * quantity if quantity else 0
-                    
-                    # Create a processed row with all needed fields
-                    processed_row = (
-                        sale_id, sale_date, subtotal, 0, # discount_amount
-                        vat_amount, total, 'completed', # status
-                        medicine_id, quantity, unit_price, total_price,
-                        medicine_name
-                    )
-                    result.append(processed_row)
-                
-                return result
-            except Exception as e:
-                print(f"Error in daily sales query: {e}")
-                return []
-                
+            cursor.execute(SALE_LINES_SQL, sale_date_range(date))
+            return cursor.fetchall()
         except Exception as e:
             print(f"Error getting daily sales: {e}")
             return []
@@ -340,21 +241,7 @@ class BillingSystem:
         cursor = conn.cursor()
         
         try:
-            # Make sure the sales table exists
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS sales (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    sale_date DATETIME NOT NULL,
-                    total REAL DEFAULT 0
-                )
-            """)
-            
-            # Use a very simple query without any filters
-            cursor.execute('''
-                SELECT SUM(total)
-                FROM sales
-                WHERE date(sale_date) BETWEEN ? AND ?
-            ''', (start_date, end_date))
+            cursor.execute(SALES_TOTAL_SQL, sale_date_range(start_date, end_date))
             
             result = cursor.fetchone()
             return result[0] or 0
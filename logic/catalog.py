@@ -0,0 +1,340 @@
+"""
+Process-wide, write-through cache of the medicines table.
+
+The catalog is loaded once at startup into CatalogMedicine objects (one
+per row, with __slots__ so a large catalog stays small) and indexed by
+id, by barcode and by the words of each name, so lookups, barcode scans
+and name-prefix searches never touch the database.
+
+Writers update the database first and then the catalog: InventoryManager
+and checkout apply their changes directly, code that writes with raw SQL
+calls refresh() for the rows it touched. Every change is published to
+subscribers as (kind, medicine_ids) so open windows can update what they
+show instead of re-querying. Subscribers are called on the writer's
+thread; Tk code should use gui.catalog_events.watch_catalog.
+"""
+import heapq
+import re
+import threading
+from bisect import bisect_left, insort
+from datetime import date
+from database.db_connection import DatabaseConnection
+
+# Change kinds published to subscribers
+CATALOG_LOADED = 'loaded'
+MEDICINE_ADDED = 'added'
+MEDICINE_UPDATED = 'updated'
+MEDICINE_REMOVED = 'removed'
+STOCK_CHANGED = 'stock'
+
+
+class SoldStock(tuple):
+    """
+    The medicine ids of a STOCK_CHANGED published for a sale, carrying the
+    quantities taken from each lot as .lots ({lot_id: quantity}), so lot
+    trackers can apply the sale without reading the lots back.
+    """
+    lots = {}
+
+# Columns in table order, so as_row() matches SELECT * FROM medicines
+CATALOG_COLUMNS = ('id', 'name', 'description', 'price', 'quantity', 'expiry_date', 'manufacturer',
+                   'barcode', 'category', 'min_stock_level', 'location', 'is_active')
+
+CATALOG_SQL = f"SELECT {', '.join(CATALOG_COLUMNS)} FROM medicines"
+
+# Words as the search box splits them: runs of letters and digits
+_WORD = re.compile(r'[^\W_]+')
+
+
+def _name_words(name):
+    return set(_WORD.findall((name or '').casefold()))
+
+
+def _stored(value):
+    """A value as SQLite hands it back: dates are stored as ISO text."""
+    return str(value) if isinstance(value, date) else value
+
+
+def normalize_barcode(barcode):
+    return str(barcode).strip() if barcode is not None else ''
+
+
+class CatalogMedicine:
+    """One medicines row. Treat as read-only; changes go through MedicineCatalog."""
+    __slots__ = CATALOG_COLUMNS
+
+    def __init__(self, *values):
+        for column, value in zip(CATALOG_COLUMNS, values):
+            setattr(self, column, value)
+
+    @property
+    def low_stock(self):
+        return self.quantity <= (self.min_stock_level or 0)
+
+    def as_row(self):
+        return tuple(getattr(self, column) for column in CATALOG_COLUMNS)
+
+    def __repr__(self):
+        return f"CatalogMedicine(id={self.id}, name={self.name!r}, quantity={self.quantity})"
+
+
+class MedicineCatalog:
+    def __init__(self, db_name='pharmacy.db'):
+        self.db_name = db_name
+        self._lock = threading.RLock()
+        self._by_id = {}
+        self._by_barcode = {}        # active medicines only
+        self._words = []             # sorted (word, id) over active names, for prefix search
+        self._subscribers = []
+        self._loaded = False
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def __len__(self):
+        return len(self._by_id)
+
+    # Loading
+
+    def load(self):
+        """(Re)read the whole table. Returns the number of medicines."""
+        with DatabaseConnection(self.db_name).checkout() as conn:
+            medicines = [CatalogMedicine(*row) for row in conn.execute(CATALOG_SQL)]
+
+        by_id, by_barcode, words = {}, {}, []
+        for medicine in medicines:
+            by_id[medicine.id] = medicine
+            if medicine.is_active:
+                barcode = normalize_barcode(medicine.barcode)
+                if barcode:
+                    by_barcode[barcode] = medicine
+                words.extend((word, medicine.id) for word in _name_words(medicine.name))
+        words.sort()
+
+        with self._lock:
+            self._by_id, self._by_barcode, self._words = by_id, by_barcode, words
+            self._loaded = True
+        self._publish(CATALOG_LOADED, ())
+        return len(by_id)
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    # Reads
+
+    def get(self, medicine_id):
+        """The medicine with this id (active or not), or None."""
+        self._ensure_loaded()
+        return self._by_id.get(medicine_id)
+
+    def by_barcode(self, barcode):
+        """The active medicine with this barcode, or None."""
+        self._ensure_loaded()
+        return self._by_barcode.get(normalize_barcode(barcode))
+
+    def medicines(self, active_only=True):
+        self._ensure_loaded()
+        with self._lock:
+            values = list(self._by_id.values())
+        return [m for m in values if m.is_active] if active_only else values
+
+    def search(self, term, limit=None, in_stock_only=False):
+        """
+        Active medicines whose name has a word starting with each word of term.
+
+        Names starting with the first word come first, then by name.
+        """
+        terms = _WORD.findall((term or '').casefold())
+        if not terms:
+            return []
+        self._ensure_loaded()
+        with self._lock:
+            matches = None
+            for prefix in terms:
+                ids = set()
+                index = bisect_left(self._words, (prefix,))
+                while index < len(self._words) and self._words[index][0].startswith(prefix):
+                    ids.add(self._words[index][1])
+                    index += 1
+                matches = ids if matches is None else matches & ids
+                if not matches:
+                    return []
+            found = [self._by_id[medicine_id] for medicine_id in matches]
+
+        if in_stock_only:
+            found = [m for m in found if m.quantity > 0]
+        first = terms[0]
+        order = lambda m: (not m.name.casefold().startswith(first), m.name.casefold(), m.id)
+        return heapq.nsmallest(limit, found, key=order) if limit is not None else sorted(found, key=order)
+
+    # Write-through; call after the database write has committed
+
+    def add(self, medicine_id, **fields):
+        """Record a medicine just inserted with the given column values."""
+        values = {'is_active': 1, 'min_stock_level': 10}
+        values.update(fields)
+        medicine = CatalogMedicine(*(medicine_id if column == 'id' else _stored(values.get(column))
+                                     for column in CATALOG_COLUMNS))
+        if self._loaded:
+            with self._lock:
+                self._store(medicine)
+        self._publish(MEDICINE_ADDED, (medicine_id,))
+
+    def update(self, medicine_id, **fields):
+        """Apply committed column changes to one medicine."""
+        kind = STOCK_CHANGED if set(fields) <= {'quantity', 'expiry_date'} else MEDICINE_UPDATED
+        if 'is_active' in fields and not fields['is_active']:
+            kind = MEDICINE_REMOVED
+        if self._loaded:
+            with self._lock:
+                current = self._by_id.get(medicine_id)
+                if current is None:
+                    # Not seen yet (written by another process); fall back to the database
+                    kind = None
+                else:
+                    medicine = CatalogMedicine(*current.as_row())
+                    for column, value in fields.items():
+                        if column in CATALOG_COLUMNS and column != 'id':
+                            setattr(medicine, column, _stored(value))
+                    self._store(medicine)
+            if kind is None:
+                self.refresh(medicine_id)
+                return
+        self._publish(kind, (medicine_id,))
+
+    def adjust_stock(self, lines, expiry_dates=None, lots=None):
+        """
+        Subtract sold quantities, given as {medicine_id: quantity}.
+
+        expiry_dates ({medicine_id: expiry_date}) carries the earliest expiry
+        left once the sold lots were taken, lots ({lot_id: quantity}) what
+        was taken from each; subscribers get the latter as SoldStock.lots.
+        """
+        expiry_dates = expiry_dates or {}
+        if self._loaded:
+            with self._lock:
+                for medicine_id, quantity in lines.items():
+                    medicine = self._by_id.get(medicine_id)
+                    if medicine is not None:
+                        # Neither column is indexed, so they can change in place
+                        medicine.quantity -= quantity
+                        if medicine_id in expiry_dates:
+                            medicine.expiry_date = _stored(expiry_dates[medicine_id])
+        sold = SoldStock(lines)
+        if lots is not None:
+            sold.lots = lots
+        self._publish(STOCK_CHANGED, sold)
+
+    def refresh(self, *medicine_ids):
+        """Re-read medicines that were written with raw SQL."""
+        if not medicine_ids:
+            return
+        if not self._loaded:
+            self._publish(MEDICINE_UPDATED, medicine_ids)
+            return
+        placeholders = ', '.join('?' * len(medicine_ids))
+        with DatabaseConnection(self.db_name).checkout() as conn:
+            rows = conn.execute(f"{CATALOG_SQL} WHERE id IN ({placeholders})", medicine_ids).fetchall()
+
+        changes = {}
+        with self._lock:
+            fresh = {row[0]: CatalogMedicine(*row) for row in rows}
+            for medicine_id in medicine_ids:
+                old = self._by_id.get(medicine_id)
+                new = fresh.get(medicine_id)
+                if new is not None:
+                    self._store(new)
+                elif old is not None:
+                    self._unindex(old)
+                    del self._by_id[medicine_id]
+
+                was_active = old is not None and old.is_active
+                is_active = new is not None and new.is_active
+                if is_active and not was_active:
+                    kind = MEDICINE_ADDED
+                elif was_active and not is_active:
+                    kind = MEDICINE_REMOVED
+                else:
+                    kind = MEDICINE_UPDATED
+                changes.setdefault(kind, []).append(medicine_id)
+        for kind, ids in changes.items():
+            self._publish(kind, tuple(ids))
+
+    def _store(self, medicine):
+        """Replace a medicine and its index entries; caller holds the lock."""
+        old = self._by_id.get(medicine.id)
+        if old is not None:
+            self._unindex(old)
+        self._by_id[medicine.id] = medicine
+        if medicine.is_active:
+            barcode = normalize_barcode(medicine.barcode)
+            if barcode:
+                self._by_barcode[barcode] = medicine
+            for word in _name_words(medicine.name):
+                insort(self._words, (word, medicine.id))
+
+    def _unindex(self, medicine):
+        barcode = normalize_barcode(medicine.barcode)
+        if barcode and self._by_barcode.get(barcode) is medicine:
+            del self._by_barcode[barcode]
+        for word in _name_words(medicine.name):
+            index = bisect_left(self._words, (word, medicine.id))
+            if index < len(self._words) and self._words[index] == (word, medicine.id):
+                del self._words[index]
+
+    # Change notifications
+
+    def subscribe(self, callback):
+        """Call callback(kind, medicine_ids) after every change. Returns an unsubscribe function."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def _publish(self, kind, medicine_ids):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(kind, medicine_ids)
+            except Exception as e:
+                print(f"Error in catalog subscriber: {e}")
+
+
+_catalog = MedicineCatalog()
+
+
+def get_catalog():
+    """The shared catalog."""
+    return _catalog
+
+
+_other_catalogs = {}
+_other_catalogs_lock = threading.Lock()
+
+
+def catalog_for(db_name):
+    """The catalog of a database: the shared one for its file, otherwise one kept per file."""
+    db_path = DatabaseConnection(db_name).db_path
+    if DatabaseConnection(_catalog.db_name).db_path == db_path:
+        return _catalog
+    with _other_catalogs_lock:
+        catalog = _other_catalogs.get(db_path)
+        if catalog is None:
+            catalog = _other_catalogs[db_path] = MedicineCatalog(str(db_path))
+        return catalog
+
+
+def refresh_catalog(*medicine_ids):
+    """Bring the shared catalog in step after a raw SQL write to medicines."""
+    try:
+        _catalog.refresh(*medicine_ids)
+    except Exception as e:
+        # A stale entry is corrected by the next load(); never fail the write for it
+        print(f"Error refreshing medicine catalog: {e}")
@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+from database.db_connection import DatabaseConnection
+from database.queries import TODAY_SALES_SQL, RECENT_SALES_SQL
+from logic.catalog import get_catalog
+from logic.stock_alerts import get_low_stock_tracker
+
+try:
+    from config import DASHBOARD_CACHE_TTL
+except ImportError:
+    # Fallback if config is not available
+    DASHBOARD_CACHE_TTL = 30
+
+RECENT_SALES_COUNT = 5
+
+# Every dashboard tile and the recent sales list in a single statement
+DASHBOARD_STATS_SQL = f'''
+    SELECT
+        (SELECT COUNT(*) FROM customers),
+        (SELECT COUNT(*) FROM medicines),
+        today.sales_count,
+        today.sales_total,
+        (SELECT json_group_array(json_array(id, total, sale_date)) FROM ({RECENT_SALES_SQL}))
+    FROM ({TODAY_SALES_SQL}) AS today
+'''
+
+# Only for databases other than the one the shared catalog tracks
+LOW_STOCK_COUNT_SQL = "SELECT COUNT(*) FROM medicines WHERE quantity <= min_stock_level AND is_active = 1"
+
+
+class DashboardStats:
+    """
+    Dashboard statistics with a short-lived in-memory cache.
+
+    Writes that change a tile call invalidate_dashboard_stats(), so the
+    next read goes back to the database; the TTL covers changes made by
+    other processes.
+    """
+    def __init__(self, ttl=DASHBOARD_CACHE_TTL, db_name='pharmacy.db'):
+        self.ttl = ttl
+        self.db_name = db_name
+        self._lock = threading.Lock()
+        self._stats = None
+        self._loaded_at = 0.0
+        self._version = 0
+
+    def get(self, force=False):
+        """Return the statistics dict, from the cache while it is fresh."""
+        with self._lock:
+            if not force and self._stats is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return self._stats
+            version = self._version
+
+        stats = self._load()
+        with self._lock:
+            # Don't cache a result that a write invalidated while it was loading
+            if version == self._version:
+                self._stats = stats
+                self._loaded_at = time.monotonic()
+        return stats
+
+    def invalidate(self):
+        with self._lock:
+            self._stats = None
+            self._version += 1
+
+    def _load(self):
+        db = DatabaseConnection(self.db_name)
+        conn = db.connect()
+        try:
+            row = conn.execute(DASHBOARD_STATS_SQL, (RECENT_SALES_COUNT,)).fetchone()
+            if self.db_name == get_catalog().db_name:
+                # Maintained incrementally as stock changes
+                low_stock = get_low_stock_tracker().count()
+            else:
+                low_stock = conn.execute(LOW_STOCK_COUNT_SQL).fetchone()[0]
+        finally:
+            db.close()
+
+        customers, medicines, sales_count, sales_total, recent = row
+        recent_sales = sorted((tuple(sale) for sale in json.loads(recent)),
+                              key=lambda sale: (sale[2], sale[0]), reverse=True)
+        return {
+            'total_customers': customers,
+            'total_medicines': medicines,
+            'low_stock': low_stock,
+            'today_sales_count': sales_count,
+            'today_sales_total': sales_total,
+            'recent_sales': recent_sales,  # (id, total, sale_date), newest first
+        }
+
+
+_dashboard_stats = DashboardStats()
+
+
+def get_dashboard_stats(force=False):
+    """Statistics from the shared dashboard cache."""
+    return _dashboard_stats.get(force)
+
+
+def invalidate_dashboard_stats():
+    """Drop cached statistics after a sale or stock change."""
+    _dashboard_stats.invalidate()
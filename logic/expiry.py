@@ -0,0 +1,208 @@
+"""
+Expiry tracking over medicine lots.
+
+ExpiryTracker keeps every lot with stock of an active medicine in a list
+sorted by expiry day (as a date ordinal, so no dates are parsed at query
+time) and the count and value of stock in each expiry bucket: already
+expired, within 30, 60 and 90 days. It subscribes to the catalog: a sale
+arrives with the quantities it took from each lot (SoldStock.lots) and is
+applied in memory, so checkout never waits on a lot query; for any other
+write the lots of the medicines it touched are re-read (one index seek
+each). Either way lots move between buckets as it happens.
+
+"What expires in N days" is two bisects and a slice, and its value at
+risk is a sum over that slice: the cost follows the size of the answer,
+not of the table. Bucket totals are read in constant time and rebuilt
+once when the date changes.
+"""
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+from datetime import date
+from database.db_connection import DatabaseConnection
+from logic.catalog import CATALOG_LOADED, STOCK_CHANGED, SoldStock, get_catalog
+
+# Upper bound in days of each bucket after 'expired', which is everything before today
+EXPIRY_BUCKETS = (30, 60, 90)
+EXPIRED = 'expired'
+
+LOTS_SQL = "SELECT id, medicine_id, lot_number, expiry_date, quantity FROM medicine_lots WHERE quantity > 0"
+
+ExpiringMedicine = namedtuple('ExpiringMedicine',
+                              'id name lot_id lot_number expiry_date days_remaining quantity price value')
+LotEntry = namedtuple('LotEntry', 'ordinal quantity price medicine_id lot_number expiry_date')
+
+
+def expiry_ordinal(value):
+    """Day number of a date or YYYY-MM-DD string, or None if it can't be read."""
+    if isinstance(value, date):
+        return value.toordinal()
+    try:
+        return date.fromisoformat(str(value)[:10]).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+class ExpiryTracker:
+    def __init__(self, catalog=None):
+        self.catalog = catalog if catalog is not None else get_catalog()
+        self._lock = threading.RLock()
+        self._entries = {}      # lot id -> LotEntry
+        self._lots_of = {}      # medicine id -> set of lot ids
+        self._order = []        # sorted (ordinal, lot id)
+        self._buckets = {}      # bucket name -> [count, value] as of self._today
+        self._today = None
+        self._built = False
+        self.catalog.subscribe(self._on_catalog_change)
+
+    def _read_lots(self, medicine_ids=None):
+        sql, params = LOTS_SQL, ()
+        if medicine_ids is not None:
+            sql += f" AND medicine_id IN ({', '.join('?' * len(medicine_ids))})"
+            params = tuple(medicine_ids)
+        with DatabaseConnection(self.catalog.db_name).checkout() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def _entries_for(self, lots):
+        entries = {}
+        for lot_id, medicine_id, lot_number, expiry_date, quantity in lots:
+            medicine = self.catalog.get(medicine_id)
+            if medicine is None or not medicine.is_active:
+                continue
+            ordinal = expiry_ordinal(expiry_date)
+            if ordinal is None:
+                print(f"Error reading expiry date of lot {lot_id}: {expiry_date!r}")
+                continue
+            entries[lot_id] = LotEntry(ordinal, quantity, medicine.price or 0, medicine_id, lot_number, expiry_date)
+        return entries
+
+    def _build(self):
+        self.catalog.medicines()  # load the catalog first; lots are priced from it
+        entries = self._entries_for(self._read_lots())
+        lots_of = {}
+        for lot_id, entry in entries.items():
+            lots_of.setdefault(entry.medicine_id, set()).add(lot_id)
+        order = sorted((entry.ordinal, lot_id) for lot_id, entry in entries.items())
+        with self._lock:
+            self._entries, self._lots_of, self._order = entries, lots_of, order
+            self._built = True
+            self._rebucket(date.today().toordinal())
+
+    def _ensure_current(self):
+        """Build on first use and re-bucket when the day has changed."""
+        if not self._built:
+            self._build()
+        today = date.today().toordinal()
+        if today != self._today:
+            with self._lock:
+                self._rebucket(today)
+        return today
+
+    def _bucket(self, ordinal):
+        days = ordinal - self._today
+        if days < 0:
+            return EXPIRED
+        for limit in EXPIRY_BUCKETS:
+            if days <= limit:
+                return limit
+        return None
+
+    def _rebucket(self, today):
+        self._today = today
+        self._buckets = {name: [0, 0.0] for name in (EXPIRED,) + EXPIRY_BUCKETS}
+        end = bisect_right(self._order, (today + EXPIRY_BUCKETS[-1], float('inf')))
+        for ordinal, lot_id in self._order[:end]:
+            self._count(self._entries[lot_id], 1)
+
+    def _count(self, entry, sign):
+        bucket = self._bucket(entry.ordinal)
+        if bucket is not None:
+            totals = self._buckets[bucket]
+            totals[0] += sign
+            totals[1] += sign * entry.quantity * entry.price
+
+    def _on_catalog_change(self, kind, medicine_ids):
+        if not self._built:
+            return
+        if kind == CATALOG_LOADED:
+            self._build()
+            return
+        if not medicine_ids:
+            return
+        if kind == STOCK_CHANGED and isinstance(medicine_ids, SoldStock):
+            self._apply_sale(medicine_ids.lots)
+            return
+        entries = self._entries_for(self._read_lots(medicine_ids))
+        with self._lock:
+            for medicine_id in medicine_ids:
+                for lot_id in self._lots_of.pop(medicine_id, ()):
+                    old = self._entries.pop(lot_id)
+                    self._order.pop(bisect_left(self._order, (old.ordinal, lot_id)))
+                    self._count(old, -1)
+            for lot_id, entry in entries.items():
+                self._entries[lot_id] = entry
+                self._lots_of.setdefault(entry.medicine_id, set()).add(lot_id)
+                insort(self._order, (entry.ordinal, lot_id))
+                self._count(entry, 1)
+
+    def _apply_sale(self, lots):
+        """Take sold quantities ({lot_id: quantity}) off the tracked lots."""
+        with self._lock:
+            for lot_id, taken in lots.items():
+                old = self._entries.get(lot_id)
+                if old is None:
+                    continue
+                self._count(old, -1)
+                if old.quantity > taken:
+                    entry = self._entries[lot_id] = old._replace(quantity=old.quantity - taken)
+                    self._count(entry, 1)
+                    continue
+                # Sold out: only lots with stock are tracked
+                del self._entries[lot_id]
+                self._order.pop(bisect_left(self._order, (old.ordinal, lot_id)))
+                lot_ids = self._lots_of[old.medicine_id]
+                lot_ids.discard(lot_id)
+                if not lot_ids:
+                    del self._lots_of[old.medicine_id]
+
+    def _slice(self, days, include_expired):
+        today = self._ensure_current()
+        with self._lock:
+            start = 0 if include_expired else bisect_left(self._order, (today,))
+            end = bisect_right(self._order, (today + days, float('inf')))
+            return today, [(lot_id, self._entries[lot_id]) for _, lot_id in self._order[start:end]]
+
+    def expiring(self, days, include_expired=True):
+        """Lots in stock expiring within days (and already expired ones), soonest first."""
+        today, found = self._slice(days, include_expired)
+        result = []
+        for lot_id, entry in found:
+            medicine = self.catalog.get(entry.medicine_id)
+            result.append(ExpiringMedicine(entry.medicine_id, medicine.name, lot_id, entry.lot_number,
+                                           entry.expiry_date, entry.ordinal - today, entry.quantity,
+                                           entry.price, entry.quantity * entry.price))
+        return result
+
+    def value_at_risk(self, days, include_expired=True):
+        """(count, stock value) of what expires within days."""
+        _, found = self._slice(days, include_expired)
+        return len(found), sum(entry.quantity * entry.price for _, entry in found)
+
+    def buckets(self):
+        """{'expired': (count, value), 30: (...), 60: (...), 90: (...)}; 60 means 31-60 days."""
+        self._ensure_current()
+        with self._lock:
+            return {name: tuple(totals) for name, totals in self._buckets.items()}
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_expiry_tracker():
+    """The shared tracker over the shared catalog."""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = ExpiryTracker()
+        return _tracker
@@ -1,4 +1,12 @@
 from database.db_connection import DatabaseConnection
+from database.search import search_medicines
+from database.lots import (receive_lot, set_stock, sync_medicines, correct_expiry,
+                           medicine_lots, write_off_expired)
+from database.ledger import stock_movements, checkpoint_ledger, verify_stock
+from logic.dashboard_stats import invalidate_dashboard_stats
+from logic.catalog import get_catalog
+from logic.expiry import get_expiry_tracker
+from logic.stock_alerts import get_low_stock_tracker
 from datetime import datetime
 
 class InventoryManager:
@@ -19,9 +27,18 @@ class InventoryManager:
                 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (name, description, price, quantity, expiry_date, manufacturer,
                  barcode, category, min_stock_level))
+            medicine_id = cursor.lastrowid
+            if quantity:
+                # The opening stock is the medicine's first lot
+                receive_lot(cursor, medicine_id, quantity, expiry_date, sync=False)
             conn.commit()
-            return True, cursor.lastrowid
+            invalidate_dashboard_stats()
+            get_catalog().add(medicine_id, name=name, description=description, price=price,
+                              quantity=quantity, expiry_date=expiry_date, manufacturer=manufacturer,
+                              barcode=barcode, category=category, min_stock_level=min_stock_level)
+            return True, medicine_id
         except Exception as e:
+            conn.rollback()
             print(f"Error adding medicine: {e}")
             return False
         finally:
@@ -32,19 +49,107 @@ class InventoryManager:
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                UPDATE medicines
-                SET quantity = ?
-                WHERE id = ?
-            ''', (new_quantity, medicine_id))
+            # A stock count: the difference is written off or added across the lots
+            quantity, expiry_date = set_stock(cursor, medicine_id, new_quantity)
             conn.commit()
+            invalidate_dashboard_stats()
+            get_catalog().update(medicine_id, quantity=quantity, expiry_date=expiry_date)
             return True
         except Exception as e:
+            conn.rollback()
             print(f"Error updating stock: {e}")
             return False
         finally:
             self.db.close()
             
+    def receive_stock(self, medicine_id, quantity, expiry_date, lot_number=None):
+        """Receive a shipment as a new lot with its own expiry. Returns (success, lot id or message)."""
+        if quantity <= 0:
+            return False, "الرجاء إدخال كمية صحيحة"
+        conn = self.db.connect()
+        cursor = conn.cursor()
+        
+        try:
+            lot_id = receive_lot(cursor, medicine_id, quantity, expiry_date, lot_number)
+            cursor.execute("SELECT quantity, expiry_date FROM medicines WHERE id = ?", (medicine_id,))
+            total, earliest = cursor.fetchone()
+            conn.commit()
+            invalidate_dashboard_stats()
+            get_catalog().update(medicine_id, quantity=total, expiry_date=earliest)
+            return True, lot_id
+        except Exception as e:
+            conn.rollback()
+            print(f"Error receiving stock: {e}")
+            return False, str(e)
+        finally:
+            self.db.close()
+            
+    def get_lots(self, medicine_id, in_stock_only=True):
+        """A medicine's lots, earliest expiry first."""
+        conn = self.db.connect()
+        cursor = conn.cursor()
+        
+        try:
+            return medicine_lots(cursor, medicine_id, in_stock_only)
+        except Exception as e:
+            print(f"Error getting medicine lots: {e}")
+            return []
+        finally:
+            self.db.close()
+            
+    def write_off_expired(self):
+        """Write off the stock of every expired lot. Returns (success, message)."""
+        conn = self.db.connect()
+        cursor = conn.cursor()
+        
+        try:
+            written_off = write_off_expired(cursor)
+            conn.commit()
+            if not written_off:
+                return True, "لا توجد تشغيلات منتهية الصلاحية في المخزون"
+            invalidate_dashboard_stats()
+            catalog = get_catalog()
+            for medicine_id, (quantity, expiry_date) in written_off.items():
+                catalog.update(medicine_id, quantity=quantity, expiry_date=expiry_date)
+            return True, f"تم إعدام المخزون منتهي الصلاحية لـ {len(written_off)} دواء"
+        except Exception as e:
+            conn.rollback()
+            print(f"Error writing off expired stock: {e}")
+            return False, str(e)
+        finally:
+            self.db.close()
+            
+    def get_stock_movements(self, medicine_id, limit=100):
+        """A medicine's latest stock movements from the ledger, newest first."""
+        conn = self.db.connect()
+        cursor = conn.cursor()
+        
+        try:
+            return stock_movements(cursor, medicine_id, limit)
+        except Exception as e:
+            print(f"Error getting stock movements: {e}")
+            return []
+        finally:
+            self.db.close()
+            
+    def verify_stock(self):
+        """Medicines whose stock disagrees with the ledger, as (id, quantity, ledger quantity); None if the check failed."""
+        conn = self.db.connect()
+        cursor = conn.cursor()
+        
+        try:
+            # Fold the recent movements first so the next check starts from here
+            checkpoint_ledger(cursor)
+            mismatched = verify_stock(cursor)
+            conn.commit()
+            return mismatched
+        except Exception as e:
+            conn.rollback()
+            print(f"Error verifying stock ledger: {e}")
+            return None
+        finally:
+            self.db.close()
+            
     def get_low_stock_items(self, threshold=10):
         conn = self.db.connect()
         cursor = conn.cursor()
@@ -62,33 +167,27 @@ class InventoryManager:
             self.db.close()
             
     def get_expiring_items(self, days=30):
-        conn = self.db.connect()
-        cursor = conn.cursor()
+        """
+        Medicines with a lot expiring within days, including expired lots, soonest first.
         
+        Read from the lots, not medicines.expiry_date: only lots with stock
+        of active medicines count, so a sold-out batch or a deactivated
+        medicine is not listed. Each medicine appears once, as a full
+        medicines row, at the position of its earliest such lot.
+        """
         try:
-            cursor.execute('''
-                SELECT * FROM medicines
-                WHERE date(expiry_date) <= date('now', '+' || ? || ' days')
-            ''', (days,))
-            return cursor.fetchall()
+            return self._catalog_rows(get_expiry_tracker().expiring(days))
         except Exception as e:
             print(f"Error getting expiring items: {e}")
             return []
-        finally:
-            self.db.close()
             
     def search_medicine(self, keyword):
-        """Search for medicines by name, barcode, or category."""
+        """Search active medicines by name, manufacturer, category or barcode prefix."""
         conn = self.db.connect()
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                SELECT * FROM medicines
-                WHERE name LIKE ? OR barcode LIKE ? OR category LIKE ?
-                AND is_active = 1
-            ''', (f'%{keyword}%', f'%{keyword}%', f'%{keyword}%'))
-            return cursor.fetchall()
+            return search_medicines(cursor, keyword)
         except Exception as e:
             print(f"Error searching medicines: {e}")
             return []
@@ -111,27 +210,44 @@ class InventoryManager:
             update_fields = []
             update_values = []
             
+            # Quantity and expiry are kept by the lots; edits are applied to them below
+            if 'expiry_date' in update_data:
+                correct_expiry(cursor, medicine_id, update_data['expiry_date'])
+            
             for field in valid_fields:
+                if field == 'quantity':
+                    continue
                 if field in update_data:
                     update_fields.append(f"{field} = ?")
                     update_values.append(update_data[field])
             
-            if not update_fields:
+            if not update_fields and 'quantity' not in update_data:
                 return False, "لم يتم تحديد أي حقول للتحديث"
                 
-            update_values.append(medicine_id)  # For WHERE clause
-            
-            query = f'''
-                UPDATE medicines
-                SET {', '.join(update_fields)}
-                WHERE id = ?
-            '''
+            if update_fields:
+                update_values.append(medicine_id)  # For WHERE clause
+                
+                query = f'''
+                    UPDATE medicines
+                    SET {', '.join(update_fields)}
+                    WHERE id = ?
+                '''
+                
+                cursor.execute(query, update_values)
             
-            cursor.execute(query, update_values)
+            if 'quantity' in update_data:
+                quantity, expiry_date = set_stock(cursor, medicine_id, update_data['quantity'])
+            else:
+                quantity, expiry_date = sync_medicines(cursor, [medicine_id], quantity=False)[medicine_id]
             conn.commit()
+            invalidate_dashboard_stats()
+            changes = {field: update_data[field] for field in valid_fields if field in update_data}
+            changes.update(quantity=quantity, expiry_date=expiry_date)
+            get_catalog().update(medicine_id, **changes)
             
             return True, "تم تحديث بيانات الدواء بنجاح"
         except Exception as e:
+            conn.rollback()
             print(f"Error updating medicine: {e}")
             return False, str(e)
         finally:
@@ -149,6 +265,8 @@ class InventoryManager:
                 WHERE id = ?
             ''', (medicine_id,))
             conn.commit()
+            invalidate_dashboard_stats()
+            get_catalog().update(medicine_id, is_active=0)
             return True, "تم حذف الدواء بنجاح"
         except Exception as e:
             print(f"Error deleting medicine: {e}")
@@ -158,6 +276,11 @@ class InventoryManager:
             
     def get_medicine_details(self, medicine_id):
         """Get detailed information about a specific medicine."""
+        catalog = get_catalog()
+        if catalog.loaded:
+            medicine = catalog.get(medicine_id)
+            return medicine.as_row() if medicine is not None else None
+
         conn = self.db.connect()
         cursor = conn.cursor()
         
@@ -171,42 +294,27 @@ class InventoryManager:
             self.db.close()
             
     def check_expiry_alerts(self, days_threshold=90):
-        """Get medicines that will expire within the specified number of days."""
-        conn = self.db.connect()
-        cursor = conn.cursor()
+        """
+        Medicines with a lot expiring within days_threshold but not yet expired.
         
+        Like get_expiring_items(), only lots with stock of active medicines
+        count; expired lots are left to get_expiring_items() and write-offs.
+        """
         try:
-            cursor.execute('''
-                SELECT *
-                FROM medicines
-                WHERE date(expiry_date) <= date('now', '+' || ? || ' days')
-                AND date(expiry_date) >= date('now')
-                AND is_active = 1
-                ORDER BY expiry_date
-            ''', (days_threshold,))
-            return cursor.fetchall()
+            return self._catalog_rows(get_expiry_tracker().expiring(days_threshold, include_expired=False))
         except Exception as e:
             print(f"Error checking expiry alerts: {e}")
             return []
-        finally:
-            self.db.close()
+            
+    def _catalog_rows(self, medicines):
+        """Full medicines rows, as SELECT * returns them, for tracker results."""
+        catalog = get_catalog()
+        return [catalog.get(medicine_id).as_row() for medicine_id in dict.fromkeys(m.id for m in medicines)]
             
     def check_stock_alerts(self):
         """Get medicines that are below their minimum stock level."""
-        conn = self.db.connect()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('''
-                SELECT *
-                FROM medicines
-                WHERE quantity <= min_stock_level
-                AND is_active = 1
-                ORDER BY quantity ASC
-            ''')
-            return cursor.fetchall()
+            return self._catalog_rows(get_low_stock_tracker().items())
         except Exception as e:
             print(f"Error checking stock alerts: {e}")
             return []
-        finally:
-            self.db.close()
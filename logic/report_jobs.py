@@ -0,0 +1,194 @@
+import itertools
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from database.db_connection import DatabaseConnection
+from utils.csv_export import ExportCancelled
+
+try:
+    from config import REPORT_WORKERS, REPORT_HISTORY_SIZE
+except ImportError:
+    # Fallback if config is not available
+    REPORT_WORKERS = 2
+    REPORT_HISTORY_SIZE = 50
+
+# Lower numbers run first
+PRIORITY_INTERACTIVE = 0  # a report the user is looking at
+PRIORITY_EXPORT = 10  # a file being written in the background
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+STATUS_NAMES = {
+    QUEUED: 'في الانتظار',
+    RUNNING: 'قيد التنفيذ',
+    DONE: 'اكتمل',
+    FAILED: 'فشل',
+    CANCELLED: 'ألغي',
+}
+
+
+class ReportJob:
+    """
+    One report query or export submitted to a ReportJobRunner.
+
+    func(cursor, job) runs on a worker thread and returns the result. It
+    reports progress with job.report_progress(done, total) and should stop
+    early with ExportCancelled when job.cancelled is set.
+    """
+    def __init__(self, job_id, name, func, priority):
+        self.id = job_id
+        self.name = name
+        self.func = func
+        self.priority = priority
+        self.status = QUEUED
+        self.done = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def report_progress(self, done, total=None):
+        self.done = done
+        if total is not None:
+            self.total = total
+        if self.cancel_event.is_set():
+            raise ExportCancelled()
+
+    def cancel(self):
+        """Ask the job to stop; a running query is interrupted."""
+        self.cancel_event.set()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.interrupt()
+
+    def duration(self):
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class ReportJobRunner:
+    """
+    A small pool of worker threads that runs report jobs by priority.
+
+    Each job reads through its own pooled connection with query_only set,
+    so under WAL a long report never holds a lock the sales counter needs,
+    and with at most `workers` jobs running the pool always has
+    connections left for checkout. Finished jobs are kept for the history
+    panel.
+    """
+    def __init__(self, workers=REPORT_WORKERS, history_size=REPORT_HISTORY_SIZE, db_name='pharmacy.db'):
+        self.workers = workers
+        self.db_name = db_name
+        self._queue = queue.PriorityQueue()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._active = {}
+        self._history = deque(maxlen=history_size)
+        self._threads = []
+
+    def submit(self, name, func, priority=PRIORITY_INTERACTIVE):
+        """Queue func(cursor, job) and return its ReportJob."""
+        job = ReportJob(next(self._ids), name, func, priority)
+        with self._lock:
+            self._active[job.id] = job
+            self._start_workers()
+        self._queue.put((priority, job.id, job))
+        return job
+
+    def jobs(self):
+        """Running and queued jobs, then finished ones, newest first."""
+        with self._lock:
+            active = sorted(self._active.values(), key=lambda job: job.id, reverse=True)
+            return active + list(reversed(self._history))
+
+    def clear_history(self):
+        with self._lock:
+            self._history.clear()
+
+    def cancel_all(self):
+        with self._lock:
+            active = list(self._active.values())
+        for job in active:
+            job.cancel()
+
+    def _start_workers(self):
+        # Called with the lock held; threads are started on first use
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"report-worker-{len(self._threads) + 1}",
+                                      daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _work(self):
+        db = DatabaseConnection(self.db_name)
+        while True:
+            _, _, job = self._queue.get()
+            if job.cancelled:
+                self._finish(job, CANCELLED)
+                continue
+            try:
+                conn = db.connect()
+                conn.execute("PRAGMA query_only = ON")
+                with job._lock:
+                    job._conn = conn
+                job.status = RUNNING
+                job.started_at = time.time()
+                if job.cancelled:
+                    raise ExportCancelled()
+                job.result = job.func(conn.cursor(), job)
+                self._finish(job, DONE)
+            except ExportCancelled:
+                self._finish(job, CANCELLED)
+            except Exception as e:
+                if job.cancelled and isinstance(e, sqlite3.OperationalError) and 'interrupted' in str(e):
+                    self._finish(job, CANCELLED)
+                else:
+                    print(f"Error running report job {job.name}: {e}")
+                    job.error = e
+                    self._finish(job, FAILED)
+            finally:
+                with job._lock:
+                    job._conn = None
+                if db.connection is not None:
+                    db.connection.execute("PRAGMA query_only = OFF")
+                    db.close()
+
+    def _finish(self, job, status):
+        job.finished_at = time.time()
+        job.status = status
+        with self._lock:
+            self._active.pop(job.id, None)
+            self._history.append(job)
+
+
+_report_runner = None
+_report_runner_lock = threading.Lock()
+
+
+def get_report_runner():
+    """The shared runner used by every report window."""
+    global _report_runner
+    with _report_runner_lock:
+        if _report_runner is None:
+            _report_runner = ReportJobRunner()
+        return _report_runner
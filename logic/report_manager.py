@@ -1,30 +1,78 @@
-from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
-from sqlalchemy import func
-from database.db_connection import get_db
-from database.models import Medicine, Sale, SaleItem, Purchase, PurchaseItem
-from utils.helpers import format_currency, format_date
+import threading
+import weakref
+from datetime import date, datetime
+from typing import Dict, List, Any, Union
+from database.db_connection import DatabaseConnection
+from logic.catalog import MedicineCatalog, get_catalog
+from logic.expiry import EXPIRED, ExpiryTracker, get_expiry_tracker
+from logic.stock_alerts import LowStockTracker, get_low_stock_tracker
+from logic.sales_analytics import SalesAnalytics
+from utils.helpers import format_currency, format_date, sale_date_range
 import logging
 
 logger = logging.getLogger(__name__)
 
+DateLike = Union[date, datetime, str]
+
+
+def _date_str(value: DateLike) -> str:
+    """YYYY-MM-DD for a date, datetime or date string."""
+    if isinstance(value, (date, datetime)):
+        return value.strftime('%Y-%m-%d')
+    return str(value)[:10]
+
+
+# One tracker pair per catalog other than the shared one. The catalog's
+# subscriber list keeps its trackers alive, so only weak references are
+# held here and the entry goes away with the catalog.
+_catalog_trackers = weakref.WeakKeyDictionary()
+_catalog_trackers_lock = threading.Lock()
+
+
+def _trackers_for(catalog):
+    """(ExpiryTracker, LowStockTracker) over catalog, created once per catalog."""
+    with _catalog_trackers_lock:
+        refs = _catalog_trackers.get(catalog)
+        trackers = tuple(ref() for ref in refs) if refs is not None else (None, None)
+        if None in trackers:
+            trackers = ExpiryTracker(catalog), LowStockTracker(catalog)
+            _catalog_trackers[catalog] = tuple(weakref.ref(tracker) for tracker in trackers)
+        return trackers
+
+
 class ReportManager:
-    def __init__(self):
-        self.db = next(get_db())
-    
+    def __init__(self, db: DatabaseConnection = None, catalog: MedicineCatalog = None):
+        self.db = db or DatabaseConnection()
+        # Inventory figures come from the in-memory catalog of the application database
+        self.catalog = catalog if catalog is not None else (get_catalog() if db is None else None)
+        if self.catalog is None:
+            self.expiry = self.low_stock = None
+        elif self.catalog is get_catalog():
+            self.expiry, self.low_stock = get_expiry_tracker(), get_low_stock_tracker()
+        else:
+            self.expiry, self.low_stock = _trackers_for(self.catalog)
+
     def get_low_stock_items(self) -> List[Dict[str, Any]]:
-        """Get items that are below reorder level."""
+        """Get items that are at or below their minimum stock level."""
         try:
-            low_stock = self.db.query(Medicine).filter(
-                Medicine.quantity <= Medicine.reorder_level
-            ).all()
-            
+            if self.low_stock is not None:
+                low_stock = [(m.name, m.quantity, m.min_stock_level, m.manufacturer)
+                             for m in self.low_stock.items()]
+            else:
+                with self.db.checkout() as conn:
+                    low_stock = conn.execute('''
+                        SELECT name, quantity, min_stock_level, manufacturer
+                        FROM medicines
+                        WHERE quantity <= min_stock_level AND is_active = 1
+                        ORDER BY quantity
+                    ''').fetchall()
+
             return [{
-                'name': med.name,
-                'current_stock': med.quantity,
-                'reorder_level': med.reorder_level,
-                'manufacturer': med.manufacturer
-            } for med in low_stock]
+                'name': name,
+                'current_stock': quantity,
+                'reorder_level': min_level,
+                'manufacturer': manufacturer
+            } for name, quantity, min_level, manufacturer in low_stock]
         except Exception as e:
             logger.error(f"Error getting low stock items: {str(e)}")
             return []
@@ -32,17 +80,27 @@ class ReportManager:
     def get_expiring_items(self, days: int = 30) -> List[Dict[str, Any]]:
         """Get items that will expire within specified days."""
         try:
-            expiry_date = datetime.now() + timedelta(days=days)
-            expiring = self.db.query(Medicine).filter(
-                Medicine.expiry_date <= expiry_date
-            ).all()
-            
+            if self.expiry is not None:
+                expiring = [(m.name, m.lot_number, m.expiry_date, m.quantity, self.catalog.get(m.id).barcode)
+                            for m in self.expiry.expiring(days)]
+            else:
+                with self.db.checkout() as conn:
+                    expiring = conn.execute('''
+                        SELECT m.name, l.lot_number, l.expiry_date, l.quantity, m.barcode
+                        FROM medicine_lots l
+                        JOIN medicines m ON m.id = l.medicine_id
+                        WHERE l.expiry_date <= date('now', '+' || ? || ' days')
+                        AND l.quantity > 0 AND m.is_active = 1
+                        ORDER BY l.expiry_date
+                    ''', (days,)).fetchall()
+
             return [{
-                'name': med.name,
-                'expiry_date': format_date(med.expiry_date),
-                'current_stock': med.quantity,
-                'batch_number': med.batch_number
-            } for med in expiring]
+                'name': name,
+                'lot_number': lot_number,
+                'expiry_date': format_date(expiry_date),
+                'current_stock': quantity,
+                'barcode': barcode
+            } for name, lot_number, expiry_date, quantity, barcode in expiring]
         except Exception as e:
             logger.error(f"Error getting expiring items: {str(e)}")
             return []
@@ -50,14 +108,19 @@ class ReportManager:
     def generate_inventory_report(self) -> Dict[str, Any]:
         """Generate comprehensive inventory report."""
         try:
-            total_items = self.db.query(func.count(Medicine.id)).scalar()
-            total_value = self.db.query(
-                func.sum(Medicine.quantity * Medicine.unit_price)
-            ).scalar() or 0
-            
+            if self.catalog is not None:
+                medicines = self.catalog.medicines()
+                total_items = len(medicines)
+                total_value = sum(m.quantity * m.price for m in medicines)
+            else:
+                with self.db.checkout() as conn:
+                    total_items, total_value = conn.execute('''
+                        SELECT COUNT(*), COALESCE(SUM(quantity * price), 0) FROM medicines WHERE is_active = 1
+                    ''').fetchone()
+
             low_stock = self.get_low_stock_items()
             expiring_soon = self.get_expiring_items()
-            
+
             return {
                 'summary': {
                     'total_items': total_items,
@@ -72,91 +135,106 @@ class ReportManager:
             logger.error(f"Error generating inventory report: {str(e)}")
             return {}
 
-    def generate_sales_report(self, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
-        """Generate sales report for given date range."""
+    def generate_sales_report(self, start_date: DateLike, end_date: DateLike, top_k: int = 5) -> Dict[str, Any]:
+        """Generate sales report for the days start_date..end_date inclusive."""
         try:
-            sales = self.db.query(Sale).filter(
-                Sale.date.between(start_date, end_date)
-            ).all()
-            
-            total_sales = sum(sale.total_amount for sale in sales)
-            avg_sale = total_sales / len(sales) if sales else 0
-            
-            top_products = self.db.query(
-                Medicine.name,
-                func.sum(SaleItem.quantity).label('total_quantity'),
-                func.sum(SaleItem.quantity * SaleItem.unit_price).label('total_value')
-            ).join(SaleItem).join(Sale).filter(
-                Sale.date.between(start_date, end_date)
-            ).group_by(Medicine.name).order_by(
-                func.sum(SaleItem.quantity).desc()
-            ).limit(5).all()
-            
+            start, end = _date_str(start_date), _date_str(end_date)
+            analytics = SalesAnalytics.from_database(start, end, self.db)
+            summary = analytics.summary()
+            top_products = analytics.top_products(top_k)
+            daily = analytics.daily_totals()
+            hourly = analytics.hourly_totals()
+            moving_average = analytics.moving_average()
+
             return {
                 'summary': {
-                    'total_sales': format_currency(total_sales),
-                    'number_of_sales': len(sales),
-                    'average_sale': format_currency(avg_sale)
+                    'total_sales': format_currency(summary['total_sales']),
+                    'number_of_sales': summary['number_of_sales'],
+                    'average_sale': format_currency(summary['average_sale']),
+                    'items_sold': summary['items_sold']
                 },
                 'top_products': [{
                     'name': name,
-                    'quantity': quantity,
+                    'quantity': int(quantity),
                     'value': format_currency(value)
-                } for name, quantity, value in top_products],
+                } for name, quantity, value in top_products.itertuples(index=False)],
+                'daily': [{
+                    'date': day.strftime('%Y-%m-%d'),
+                    'sales_count': int(sales_count),
+                    'total': float(total),
+                    'moving_average': float(average)
+                } for (day, sales_count, total), average in zip(daily.itertuples(), moving_average)],
+                'hourly': [{
+                    'hour': hour,
+                    'sales_count': int(sales_count),
+                    'total': float(total)
+                } for hour, sales_count, total in hourly.itertuples() if sales_count],
+                'categories': self._totals(analytics.category_totals()),
+                'manufacturers': self._totals(analytics.manufacturer_totals()),
+                'percentiles': {f"p{round(p * 100)}": format_currency(value)
+                                for p, value in analytics.sale_percentiles().items()},
                 'date_range': {
-                    'start': format_date(start_date),
-                    'end': format_date(end_date)
+                    'start': format_date(start),
+                    'end': format_date(end)
                 }
             }
         except Exception as e:
             logger.error(f"Error generating sales report: {str(e)}")
             return {}
 
-    def generate_profit_loss_report(self, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
-        """Generate profit/loss report for given date range."""
+    def generate_profit_loss_report(self, start_date: DateLike, end_date: DateLike) -> Dict[str, Any]:
+        """Generate profit/loss report for the days start_date..end_date inclusive."""
         try:
-            # Calculate total sales
-            sales_total = self.db.query(
-                func.sum(Sale.total_amount)
-            ).filter(
-                Sale.date.between(start_date, end_date)
-            ).scalar() or 0
-            
-            # Calculate total purchases
-            purchases_total = self.db.query(
-                func.sum(Purchase.total_amount)
-            ).filter(
-                Purchase.date.between(start_date, end_date)
-            ).scalar() or 0
-            
+            start, end = _date_str(start_date), _date_str(end_date)
+            summary = SalesAnalytics.from_database(start, end, self.db).summary()
+            sales_total = summary['total_sales']
+
+            with self.db.checkout() as conn:
+                # Calculate total purchases
+                purchases_total = conn.execute('''
+                    SELECT COALESCE(SUM(total_amount), 0)
+                    FROM purchase_orders
+                    WHERE order_date >= ? AND order_date < ?
+                ''', sale_date_range(start, end)).fetchone()[0]
+
             # Calculate expired/damaged stock value
-            expired_value = self.db.query(
-                func.sum(Medicine.quantity * Medicine.unit_price)
-            ).filter(
-                Medicine.expiry_date <= datetime.now()
-            ).scalar() or 0
-            
+            if self.expiry is not None:
+                expired_value = self.expiry.buckets()[EXPIRED][1]
+            else:
+                with self.db.checkout() as conn:
+                    expired_value = conn.execute('''
+                        SELECT COALESCE(SUM(l.quantity * m.price), 0)
+                        FROM medicine_lots l
+                        JOIN medicines m ON m.id = l.medicine_id
+                        WHERE l.expiry_date < date('now') AND l.quantity > 0 AND m.is_active = 1
+                    ''').fetchone()[0]
+
             gross_profit = sales_total - purchases_total
             net_profit = gross_profit - expired_value
-            
+
             return {
                 'summary': {
                     'total_sales': format_currency(sales_total),
+                    'vat_collected': format_currency(summary['vat_total']),
+                    'discounts_given': format_currency(summary['discount_total']),
                     'total_purchases': format_currency(purchases_total),
                     'expired_stock_value': format_currency(expired_value),
                     'gross_profit': format_currency(gross_profit),
                     'net_profit': format_currency(net_profit)
                 },
                 'date_range': {
-                    'start': format_date(start_date),
-                    'end': format_date(end_date)
+                    'start': format_date(start),
+                    'end': format_date(end)
                 }
             }
         except Exception as e:
             logger.error(f"Error generating profit/loss report: {str(e)}")
             return {}
 
-    def __del__(self):
-        """Cleanup database connection."""
-        if hasattr(self, 'db'):
-            self.db.close()
+    @staticmethod
+    def _totals(frame) -> List[Dict[str, Any]]:
+        return [{
+            'name': name,
+            'quantity': int(quantity),
+            'value': format_currency(total)
+        } for name, quantity, total in frame.itertuples()]
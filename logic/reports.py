@@ -1,51 +1,64 @@
 from database.db_connection import DatabaseConnection
-import csv
-from datetime import datetime, timedelta
+from utils.helpers import sale_date_range
+from utils.csv_export import stream_csv, ExportCancelled
+from utils.columnar_export import export_columnar
+from datetime import date, datetime, timedelta
 
 class ReportGenerator:
+    """
+    Sales, inventory and expiry reports.
+
+    Without export_path a report returns its rows. With export_path the rows
+    are streamed to a CSV file instead and the number of rows written is
+    returned; progress and cancel_event are passed on to stream_csv, and a
+    cancelled export raises ExportCancelled.
+    """
     def __init__(self, parent_frame):
         self.parent_frame = parent_frame
         self.db = DatabaseConnection()
-        
-    def generate_sales_report(self, start_date, end_date, export_path=None):
+
+    def _run_report(self, name, header, query, params=(), export_path=None, progress=None, cancel_event=None):
         conn = self.db.connect()
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                SELECT 
-                    s.sale_date,
-                    m.name,
-                    s.quantity,
-                    s.total_price
-                FROM sales s
-                JOIN medicines m ON s.medicine_id = m.id
-                WHERE date(s.sale_date) BETWEEN ? AND ?
-                ORDER BY s.sale_date
-            ''', (start_date, end_date))
-            
-            results = cursor.fetchall()
-            
             if export_path:
-                with open(export_path, 'w', newline='', encoding='utf-8') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(['التاريخ', 'اسم الدواء', 'الكمية', 'السعر الإجمالي'])
-                    writer.writerows(results)
-                    
-            return results
+                return stream_csv(cursor, export_path, header, query, params,
+                                  progress=progress, cancel_event=cancel_event, encoding='utf-8')
+
+            cursor.execute(query, params)
+            return cursor.fetchall()
             
+        except ExportCancelled:
+            raise
         except Exception as e:
-            print(f"Error generating sales report: {e}")
-            return []
+            print(f"Error generating {name} report: {e}")
+            return 0 if export_path else []
         finally:
             self.db.close()
-            
-    def generate_inventory_report(self, export_path=None):
-        conn = self.db.connect()
-        cursor = conn.cursor()
         
-        try:
-            cursor.execute('''
+    def generate_sales_report(self, start_date, end_date, export_path=None, progress=None, cancel_event=None):
+        return self._run_report(
+            'sales',
+            ['التاريخ', 'اسم الدواء', 'الكمية', 'السعر الإجمالي'],
+            '''
+                SELECT 
+                    s.sale_date,
+                    m.name,
+                    si.quantity,
+                    si.total_price
+                FROM sales s
+                JOIN sale_items si ON s.id = si.sale_id
+                JOIN medicines m ON si.medicine_id = m.id
+                WHERE s.sale_date >= ? AND s.sale_date < ?
+                ORDER BY s.sale_date
+            ''', sale_date_range(start_date, end_date), export_path, progress, cancel_event)
+            
+    def generate_inventory_report(self, export_path=None, progress=None, cancel_event=None):
+        return self._run_report(
+            'inventory',
+            ['اسم الدواء', 'الكمية', 'السعر', 'تاريخ الانتهاء', 'الشركة المصنعة'],
+            '''
                 SELECT 
                     name,
                     quantity,
@@ -54,52 +67,48 @@ class ReportGenerator:
                     manufacturer
                 FROM medicines
                 ORDER BY name
-            ''')
-            
-            results = cursor.fetchall()
-            
-            if export_path:
-                with open(export_path, 'w', newline='', encoding='utf-8') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(['اسم الدواء', 'الكمية', 'السعر', 'تاريخ الانتهاء', 'الشركة المصنعة'])
-                    writer.writerows(results)
-                    
-            return results
-            
-        except Exception as e:
-            print(f"Error generating inventory report: {e}")
-            return []
-        finally:
-            self.db.close()
+            ''', (), export_path, progress, cancel_event)
             
-    def generate_expiry_alert_report(self, days=90, export_path=None):
-        conn = self.db.connect()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
+    def generate_expiry_alert_report(self, days=90, export_path=None, progress=None, cancel_event=None):
+        # One row per lot: stock received later keeps its own expiry
+        return self._run_report(
+            'expiry alert',
+            ['اسم الدواء', 'رقم التشغيلة', 'الكمية', 'تاريخ الانتهاء', 'الشركة المصنعة'],
+            '''
                 SELECT 
-                    name,
-                    quantity,
-                    expiry_date,
-                    manufacturer
-                FROM medicines
-                WHERE date(expiry_date) <= date('now', '+' || ? || ' days')
-                ORDER BY expiry_date
-            ''', (days,))
-            
-            results = cursor.fetchall()
-            
-            if export_path:
-                with open(export_path, 'w', newline='', encoding='utf-8') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(['اسم الدواء', 'الكمية', 'تاريخ الانتهاء', 'الشركة المصنعة'])
-                    writer.writerows(results)
-                    
-            return results
-            
-        except Exception as e:
-            print(f"Error generating expiry alert report: {e}")
-            return []
-        finally:
-            self.db.close()
+                    m.name,
+                    l.lot_number,
+                    l.quantity,
+                    l.expiry_date,
+                    m.manufacturer
+                FROM medicine_lots l
+                JOIN medicines m ON m.id = l.medicine_id
+                WHERE l.quantity > 0 AND l.expiry_date <= ?
+                ORDER BY l.expiry_date
+            ''', ((date.today() + timedelta(days=days)).isoformat(),), export_path, progress, cancel_event)
+
+    def generate_lot_stock_report(self, export_path=None, progress=None, cancel_event=None):
+        return self._run_report(
+            'lot stock',
+            ['اسم الدواء', 'رقم التشغيلة', 'الكمية', 'تاريخ الانتهاء', 'تاريخ الاستلام'],
+            '''
+                SELECT 
+                    m.name,
+                    l.lot_number,
+                    l.quantity,
+                    l.expiry_date,
+                    l.received_date
+                FROM medicine_lots l
+                JOIN medicines m ON m.id = l.medicine_id
+                WHERE l.quantity > 0 AND m.is_active = 1
+                ORDER BY m.name, l.expiry_date
+            ''', (), export_path, progress, cancel_event)
+
+    def export_columnar(self, export_dir, fmt='parquet', full=False, progress=print, cancel_event=None):
+        """
+        Extract sales, sale items and medicines as Parquet or Feather for BI tools.
+
+        Sales are partitioned by day and only new days are written unless
+        full is set. Returns (success, message).
+        """
+        return export_columnar(export_dir, fmt, full, db=self.db, progress=progress, cancel_event=cancel_event)
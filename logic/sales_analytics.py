@@ -0,0 +1,177 @@
+"""
+Vectorized sales analytics on pandas frames.
+
+A SalesAnalytics holds two frames for a date range: one row per invoice
+(sales) and one row per invoice line (items, with the medicine's name,
+category and manufacturer). Every aggregate is a groupby, resample or
+quantile over those frames; nothing loops over rows in Python.
+
+Frames are loaded from SQLite, or from a columnar extract written by
+utils.columnar_export, in which case only the partitions in the range
+are read.
+"""
+import os
+from database.db_connection import DatabaseConnection
+from utils.helpers import sale_date_range
+
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError:
+    np = pd = None
+
+PERCENTILES = (0.5, 0.9, 0.95, 0.99)
+
+# Dates come back as Unix seconds: integers are cheaper to fetch and need no parsing
+SALES_FRAME_SQL = '''
+    SELECT id, CAST(strftime('%s', sale_date) AS INTEGER) AS sale_date,
+           subtotal, discount_amount, vat_amount, total
+    FROM sales
+    WHERE sale_date >= ? AND sale_date < ?
+'''
+
+# Item rows stay numeric; names and categories are joined on in pandas
+ITEMS_FRAME_SQL = '''
+    SELECT sale_id, medicine_id, quantity, total_price
+    FROM sale_items
+    WHERE sale_id IN (SELECT id FROM sales WHERE sale_date >= ? AND sale_date < ?)
+'''
+
+MEDICINES_FRAME_SQL = "SELECT id, name, category, manufacturer FROM medicines"
+
+SALES_COLUMNS = ['id', 'sale_date', 'subtotal', 'discount_amount', 'vat_amount', 'total']
+ITEMS_COLUMNS = ['sale_id', 'medicine_id', 'quantity', 'total_price']
+MEDICINE_COLUMNS = ['id', 'name', 'category', 'manufacturer']
+UNKNOWN = 'غير محدد'
+
+
+def check_analytics_support():
+    """Raise ImportError if pandas is missing."""
+    if pd is None:
+        raise ImportError("Sales analytics needs pandas (pip install pandas)")
+
+
+def _prepare_sales(frame):
+    frame = frame[SALES_COLUMNS].copy()
+    if pd.api.types.is_numeric_dtype(frame['sale_date']):
+        frame['sale_date'] = pd.to_datetime(frame['sale_date'], unit='s')
+    else:
+        frame['sale_date'] = pd.to_datetime(frame['sale_date'], format='ISO8601', errors='coerce')
+    frame['id'] = frame['id'].astype('int64')
+    for column in ('subtotal', 'discount_amount', 'vat_amount', 'total'):
+        frame[column] = frame[column].fillna(0).astype('float64')
+    return frame
+
+
+def _prepare_items(items, medicines):
+    """Attach each line's medicine name, category and manufacturer as categoricals."""
+    items = items[ITEMS_COLUMNS].copy()
+    items['sale_id'] = items['sale_id'].astype('int64')
+    items['medicine_id'] = items['medicine_id'].astype('int32')
+    items['quantity'] = items['quantity'].fillna(0).astype('int32')
+    items['total_price'] = items['total_price'].fillna(0).astype('float64')
+
+    medicines = medicines[MEDICINE_COLUMNS].copy()
+    medicines['id'] = medicines['id'].astype('int32')
+    for column in ('name', 'category', 'manufacturer'):
+        values = medicines[column].astype('object').fillna(UNKNOWN)
+        categories = pd.unique(pd.concat([values, pd.Series([UNKNOWN], dtype='object')]))
+        medicines[column] = pd.Categorical(values, categories=categories)
+    items = items.merge(medicines, how='left', left_on='medicine_id', right_on='id').drop(columns='id')
+    for column in ('name', 'category', 'manufacturer'):
+        # Lines whose medicine has since been deleted
+        items[column] = items[column].fillna(UNKNOWN)
+    return items
+
+
+class SalesAnalytics:
+    """Aggregates over the sales between start_date and end_date (YYYY-MM-DD, inclusive)."""
+    def __init__(self, sales, items, start_date, end_date):
+        self.sales = sales
+        self.items = items
+        self.start_date = start_date
+        self.end_date = end_date
+
+    @classmethod
+    def from_database(cls, start_date, end_date, db=None):
+        check_analytics_support()
+        db = db or DatabaseConnection()
+        params = sale_date_range(start_date, end_date)
+        with db.checkout() as conn:
+            sales = pd.read_sql_query(SALES_FRAME_SQL, conn, params=params)
+            items = pd.read_sql_query(ITEMS_FRAME_SQL, conn, params=params)
+            medicines = pd.read_sql_query(MEDICINES_FRAME_SQL, conn)
+        return cls(_prepare_sales(sales), _prepare_items(items, medicines), start_date, end_date)
+
+    @classmethod
+    def from_extract(cls, export_dir, start_date, end_date):
+        """Load from a Parquet extract, reading only the day partitions in range."""
+        check_analytics_support()
+        _, end = sale_date_range(start_date, end_date)
+        filters = [('sale_day', '>=', start_date), ('sale_day', '<', end)]
+
+        def read_partitions(table, columns):
+            path = os.path.join(export_dir, table)
+            if not os.path.isdir(path):
+                return pd.DataFrame(columns=columns)
+            return pd.read_parquet(path, columns=columns, filters=filters)
+
+        sales = read_partitions('sales', SALES_COLUMNS)
+        items = read_partitions('sale_items', ITEMS_COLUMNS)
+        medicines = pd.read_parquet(os.path.join(export_dir, 'medicines', 'medicines.parquet'),
+                                    columns=MEDICINE_COLUMNS)
+        return cls(_prepare_sales(sales), _prepare_items(items, medicines), start_date, end_date)
+
+    def summary(self):
+        count = len(self.sales)
+        total = float(self.sales['total'].sum())
+        return {
+            'number_of_sales': count,
+            'total_sales': total,
+            'average_sale': total / count if count else 0.0,
+            'items_sold': int(self.items['quantity'].sum()),
+            'discount_total': float(self.sales['discount_amount'].sum()),
+            'vat_total': float(self.sales['vat_amount'].sum()),
+        }
+
+    def daily_totals(self):
+        """Invoice count and total for every day in the range, including days without sales."""
+        days = pd.date_range(self.start_date, self.end_date, freq='D')
+        daily = (self.sales.groupby(self.sales['sale_date'].dt.normalize())
+                 .agg(sales_count=('id', 'size'), total=('total', 'sum')))
+        return daily.reindex(days, fill_value=0).rename_axis('day')
+
+    def hourly_totals(self):
+        """Invoice count and total by hour of day, 0-23."""
+        hourly = (self.sales.groupby(self.sales['sale_date'].dt.hour)
+                  .agg(sales_count=('id', 'size'), total=('total', 'sum')))
+        return hourly.reindex(range(24), fill_value=0).rename_axis('hour')
+
+    def _totals_by(self, column):
+        grouped = (self.items.groupby(column, observed=True)
+                   .agg(quantity=('quantity', 'sum'), total=('total_price', 'sum')))
+        return grouped.sort_values('total', ascending=False)
+
+    def category_totals(self):
+        return self._totals_by('category')
+
+    def manufacturer_totals(self):
+        return self._totals_by('manufacturer')
+
+    def top_products(self, k=5, by='quantity'):
+        """The k best-selling medicines by 'quantity' or 'total'."""
+        products = (self.items.groupby('medicine_id')
+                    .agg(name=('name', 'first'), quantity=('quantity', 'sum'), total=('total_price', 'sum')))
+        return products.nlargest(k, by)
+
+    def moving_average(self, window=7):
+        """Trailing moving average of the daily totals."""
+        daily = self.daily_totals()['total']
+        return daily.rolling(window, min_periods=1).mean()
+
+    def sale_percentiles(self, percentiles=PERCENTILES):
+        """Invoice total at each percentile, e.g. {0.5: median, 0.9: ...}."""
+        if self.sales.empty:
+            return {p: 0.0 for p in percentiles}
+        values = np.quantile(self.sales['total'].to_numpy(), percentiles)
+        return dict(zip(percentiles, values.tolist()))
@@ -0,0 +1,366 @@
+"""
+Local write-ahead queue for completed sales.
+
+A finished sale is appended to a journal file next to the database
+(pharmacy.db-sales-queue) and acknowledged to the cashier as soon as the
+journal is on disk, so checkout never waits on a database lock held by a
+backup or a long report. A committer thread drains the journal into sales
+and sale_items through BillingSystem, in order, retrying while the
+database is busy.
+
+Journal appends are group-committed: sales finished while the previous
+write was being synced go out together with one write and one fsync.
+Every sale carries an idempotency key that is stored in
+sales.idempotency_key, so a sale whose database commit landed just before
+a crash, before its completion reached the journal, is recognised and
+not recorded twice when the journal is replayed at the next start.
+
+A sale is priced and checked against the catalog's stock (less what is
+already queued) when it is submitted, and the committer records those
+prices, so the receipt and the recorded sale agree even if a price is
+edited in between. A sale the database still refuses (stock corrected
+down while it sat in the queue, say) is journaled as failed and kept for the sales window to show.
+Subscribers get (SALE_COMMITTED, keys) and (SALE_FAILED, keys) in the
+same callback style as the catalog.
+
+A sale is booked at the time it was queued (sold_at, UTC in the same form
+as datetime('now')), not when the committer gets to it, so one that
+waited out a locked database or a restart lands on the right day.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from database.db_connection import DatabaseConnection, PoolTimeoutError
+from logic.billing import BillingSystem
+
+try:
+    from config import SALES_QUEUE_RETRY_MAX, SALES_QUEUE_COMPACT_BYTES
+except ImportError:
+    # Fallback if config is not available
+    SALES_QUEUE_RETRY_MAX = 5.0
+    SALES_QUEUE_COMPACT_BYTES = 1024 * 1024
+
+SALE_COMMITTED = 'committed'
+SALE_FAILED = 'failed'
+
+# First wait after the database refused a queued sale as busy; doubled up to SALES_QUEUE_RETRY_MAX
+SALES_QUEUE_RETRY_DELAY = 0.1
+
+
+class SalesQueue:
+    def __init__(self, db_name='pharmacy.db', path=None):
+        self.db_name = db_name
+        self.path = path or f"{DatabaseConnection(db_name).db_path}-sales-queue"
+        self.billing = BillingSystem(None, db_name)
+
+        self._lock = threading.Condition()
+        self._pending = OrderedDict()   # key -> sale record, oldest first
+        self._failed = OrderedDict()    # key -> (sale record, error)
+        self._subscribers = []
+
+        # Group commit state: lines waiting for the writer, and one ticket per
+        # append that the writer marks done (with any error) once it is synced
+        self._buffer = []
+        self._tickets = []
+        self._writing = False
+        self._file = None
+        self._started = False
+
+    # Journal
+
+    def _replay(self):
+        """
+        Read the journal left by the last run; a torn last line is dropped.
+
+        Returns False if the file ends in the middle of a line.
+        """
+        if not os.path.exists(self.path):
+            return True
+        line = '\n'
+        with open(self.path, 'r', encoding='utf-8') as journal:
+            for line_number, line in enumerate(journal, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    print(f"Skipping unreadable line {line_number} of {self.path}")
+                    continue
+                key = record.get('key')
+                if record.get('op') == 'sale':
+                    self._pending[key] = record
+                elif record.get('op') == SALE_COMMITTED:
+                    self._pending.pop(key, None)
+                elif record.get('op') == SALE_FAILED:
+                    sale = self._pending.pop(key, None)
+                    if sale is not None:
+                        self._failed[key] = (sale, record.get('error'))
+        return line.endswith('\n')
+
+    def _start(self):
+        # Called with the lock held
+        if self._started:
+            return
+        complete = self._replay()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if not complete:
+            # Start after the torn line rather than on the end of it
+            self._file.write('\n')
+        self._started = True
+        self._work = threading.Event()
+        if self._pending:
+            print(f"Recording {len(self._pending)} queued sales from the last session")
+            self._work.set()
+        threading.Thread(target=self._write, name="sales-queue-writer", daemon=True).start()
+        threading.Thread(target=self._commit, name="sales-queue-committer", daemon=True).start()
+
+    def _append(self, records, wait=True):
+        """
+        Hand records to the writer thread; with wait, return once they are synced.
+
+        Called with the lock held.
+        """
+        ticket = {'done': False, 'error': None}
+        self._buffer.extend(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        self._tickets.append(ticket)
+        self._lock.notify_all()
+        while wait and not ticket['done']:
+            self._lock.wait()
+        if ticket['error'] is not None:
+            raise ticket['error']
+
+    def _write(self):
+        while True:
+            with self._lock:
+                while not self._buffer:
+                    self._lock.wait()
+                lines, self._buffer = self._buffer, []
+                tickets, self._tickets = self._tickets, []
+                self._writing = True
+            try:
+                # One write and one fsync for every line queued since the last one
+                self._file.write(''.join(lines))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                error = None
+            except OSError as e:
+                print(f"Error writing sales queue {self.path}: {e}")
+                error = e
+            with self._lock:
+                for ticket in tickets:
+                    ticket['done'], ticket['error'] = True, error
+                self._writing = False
+                self._lock.notify_all()
+
+    def _compact(self):
+        """
+        Rewrite the journal with only the sales still pending or failed.
+
+        Called with the lock held, when the writer is idle.
+        """
+        records = list(self._pending.values())
+        for key, (sale, error) in self._failed.items():
+            records.append(sale)
+            records.append({'op': SALE_FAILED, 'key': key, 'error': error})
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as journal:
+            journal.writelines(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+            journal.flush()
+            os.fsync(journal.fileno())
+        self._file.close()
+        os.replace(temp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    # Queueing sales
+
+    def submit(self, items, discount_percentage=0):
+        """
+        Queue a sale for recording. Returns (success, total) like create_sale.
+
+        The sale is durable when this returns; it reaches the sales table
+        shortly after. If the journal can't be written the sale is recorded
+        directly instead.
+        """
+        quantities = {}
+        for item in items:
+            medicine_id = int(item['medicine_id'])
+            quantities[medicine_id] = quantities.get(medicine_id, 0) + int(item['quantity'])
+        if not quantities:
+            return False, 0
+        medicines = {medicine_id: self.billing.catalog.get(medicine_id) for medicine_id in quantities}
+        for medicine_id, medicine in medicines.items():
+            if medicine is None or not medicine.is_active:
+                print(f"Error queueing sale: medicine {medicine_id} not found")
+                return False, 0
+
+        # Priced now, so the total shown to the cashier is the one recorded
+        lines = [[medicine_id, quantity, medicines[medicine_id].price]
+                 for medicine_id, quantity in quantities.items()]
+        subtotal = sum(quantity * price for _, quantity, price in lines)
+        total = self.billing.calculate_total_with_tax_and_discount(subtotal, discount_percentage)['total']
+        record = {'op': 'sale', 'key': uuid.uuid4().hex, 'items': lines,
+                  'discount': discount_percentage, 'sold_at': _utc_now()}
+        try:
+            with self._lock:
+                self._start()
+                queued = self._queued_quantities()
+                for medicine_id, quantity, _ in lines:
+                    if medicines[medicine_id].quantity - queued.get(medicine_id, 0) < quantity:
+                        print(f"Error queueing sale: not enough stock of medicine {medicine_id}")
+                        return False, 0
+                # Counted as queued before _append releases the lock to wait for the sync
+                self._pending[record['key']] = record
+                try:
+                    self._append([record])
+                except OSError:
+                    self._pending.pop(record['key'], None)
+                    raise
+        except OSError as e:
+            print(f"Error queueing sale, recording it directly: {e}")
+            # Not self.billing: its connection belongs to the committer thread
+            return BillingSystem(None, self.db_name).create_sale(_sale_items(record), discount_percentage, record['key'])
+        self._work.set()
+        return True, total
+
+    def _queued_quantities(self):
+        """{medicine_id: quantity} still waiting in the queue. Called with the lock held."""
+        queued = {}
+        for record in self._pending.values():
+            for medicine_id, quantity, *_ in record['items']:
+                queued[medicine_id] = queued.get(medicine_id, 0) + quantity
+        return queued
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def failed(self):
+        """Sales the database refused, as (key, sale record, error), oldest first."""
+        with self._lock:
+            return [(key, sale, error) for key, (sale, error) in self._failed.items()]
+
+    def start(self):
+        """Replay the journal and start draining it without waiting for a new sale."""
+        with self._lock:
+            self._start()
+
+    # Committer
+
+    def _next(self):
+        with self._lock:
+            if not self._pending and os.path.getsize(self.path) > SALES_QUEUE_COMPACT_BYTES:
+                # Let the last completion markers reach the file first
+                while self._buffer or self._writing:
+                    self._lock.wait()
+                if not self._pending:
+                    self._compact()
+            if not self._pending:
+                self._work.clear()
+                return None
+            return next(iter(self._pending.values()))
+
+    def _commit(self):
+        delay = SALES_QUEUE_RETRY_DELAY
+        while True:
+            self._work.wait()
+            record = self._next()
+            if record is None:
+                continue
+            try:
+                self.billing.record_sale(_sale_items(record), record['discount'], record['key'], record['sold_at'])
+                outcome, error = SALE_COMMITTED, None
+            except sqlite3.OperationalError as e:
+                if _is_busy(e):
+                    # Locked or busy: the sale stays first in line
+                    print(f"Queued sale {record['key']} waiting for the database: {e}")
+                    time.sleep(delay)
+                    delay = min(delay * 2, SALES_QUEUE_RETRY_MAX)
+                    continue
+                # A missing column, read-only file or I/O error won't clear by waiting
+                print(f"Error recording queued sale {record['key']}: {e}")
+                outcome, error = SALE_FAILED, str(e)
+            except Exception as e:
+                print(f"Error recording queued sale {record['key']}: {e}")
+                outcome, error = SALE_FAILED, str(e)
+            delay = SALES_QUEUE_RETRY_DELAY
+
+            # Not waited for: after a crash the idempotency key stops a second recording
+            marker = {'op': outcome, 'key': record['key']}
+            if error is not None:
+                marker['error'] = error
+            with self._lock:
+                self._append([marker], wait=False)
+                self._pending.pop(record['key'], None)
+                if outcome == SALE_FAILED:
+                    self._failed[record['key']] = (record, error)
+            self._publish(outcome, (record['key'],))
+
+    def drain(self, timeout=None):
+        """Wait until every queued sale is recorded or failed. Returns True if the queue emptied."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending_count():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    # Change notifications
+
+    def subscribe(self, callback):
+        """Call callback(kind, keys) when queued sales are recorded or fail. Returns an unsubscribe function."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def _publish(self, kind, keys):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(kind, keys)
+            except Exception as e:
+                print(f"Error in sales queue subscriber: {e}")
+
+
+def _is_busy(error):
+    """Whether a database error is one that waiting out will clear."""
+    if isinstance(error, PoolTimeoutError):
+        return True
+    message = str(error)
+    return 'locked' in message or 'busy' in message
+
+
+def _sale_items(record):
+    """BillingSystem items for a journaled sale, with its counter prices where it has them."""
+    items = []
+    for medicine_id, quantity, *price in record['items']:
+        item = {'medicine_id': medicine_id, 'quantity': quantity}
+        if price:
+            item['unit_price'] = price[0]
+        items.append(item)
+    return items
+
+
+def _utc_now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_sales_queue():
+    """The shared queue in front of the shared database."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = SalesQueue()
+        return _queue
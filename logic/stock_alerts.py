@@ -0,0 +1,119 @@
+"""
+Low-stock tracking over the medicine catalog.
+
+LowStockTracker keeps the set of active medicines whose quantity is at or
+below their min_stock_level. It subscribes to the catalog, so a stock
+update, an edit of the minimum level or a sale re-checks only the
+medicines it touched. The dashboard count is the size of the set.
+
+Medicines that cross the threshold are published to subscribers as
+(STOCK_LOW, ids) when they drop to or below it and (STOCK_RESTORED, ids)
+when they climb back above it, in the same callback style as the catalog.
+"""
+import threading
+from logic.catalog import CATALOG_LOADED, get_catalog
+
+STOCK_LOW = 'low'
+STOCK_RESTORED = 'restored'
+
+
+def is_low_stock(medicine):
+    return bool(medicine.is_active) and medicine.low_stock
+
+
+class LowStockTracker:
+    def __init__(self, catalog=None):
+        self.catalog = catalog if catalog is not None else get_catalog()
+        self._lock = threading.RLock()
+        self._low = set()
+        self._subscribers = []
+        self._built = False
+        self.catalog.subscribe(self._on_catalog_change)
+
+    def _build(self):
+        low = {medicine.id for medicine in self.catalog.medicines() if medicine.low_stock}
+        with self._lock:
+            dropped, restored = low - self._low, self._low - low
+            was_built = self._built
+            self._low = low
+            self._built = True
+        # The first build reports the starting state, not crossings
+        if was_built:
+            self._announce(dropped, restored)
+
+    def _ensure_built(self):
+        if not self._built:
+            self._build()
+
+    def _on_catalog_change(self, kind, medicine_ids):
+        if not self._built:
+            return
+        if kind == CATALOG_LOADED:
+            self._build()
+            return
+        dropped, restored = set(), set()
+        with self._lock:
+            for medicine_id in medicine_ids:
+                medicine = self.catalog.get(medicine_id)
+                low = medicine is not None and is_low_stock(medicine)
+                if low and medicine_id not in self._low:
+                    self._low.add(medicine_id)
+                    dropped.add(medicine_id)
+                elif not low and medicine_id in self._low:
+                    self._low.discard(medicine_id)
+                    restored.add(medicine_id)
+        self._announce(dropped, restored)
+
+    def count(self):
+        """How many active medicines are at or below their minimum level."""
+        self._ensure_built()
+        return len(self._low)
+
+    def __contains__(self, medicine_id):
+        self._ensure_built()
+        return medicine_id in self._low
+
+    def items(self):
+        """The low-stock medicines, lowest quantity first."""
+        self._ensure_built()
+        with self._lock:
+            ids = list(self._low)
+        return sorted((self.catalog.get(medicine_id) for medicine_id in ids), key=lambda m: (m.quantity, m.id))
+
+    # Threshold-crossing notifications
+
+    def subscribe(self, callback):
+        """Call callback(kind, medicine_ids) when medicines cross the threshold. Returns an unsubscribe function."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def _announce(self, dropped, restored):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for kind, ids in ((STOCK_LOW, dropped), (STOCK_RESTORED, restored)):
+            if not ids:
+                continue
+            for callback in subscribers:
+                try:
+                    callback(kind, tuple(ids))
+                except Exception as e:
+                    print(f"Error in low-stock subscriber: {e}")
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_low_stock_tracker():
+    """The shared tracker over the shared catalog."""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = LowStockTracker()
+        return _tracker
@@ -7,10 +7,13 @@ from pathlib import Path
 # Database path
 db_path = Path('database/pharmacy.db')
 
-# Delete if exists
+# Delete if exists, along with the WAL side files
 if db_path.exists():
     try:
-        os.remove(db_path)
+        for suffix in ('', '-wal', '-shm'):
+            path = Path(str(db_path) + suffix)
+            if path.exists():
+                os.remove(path)
         print(f"Database file deleted: {db_path}")
     except Exception as e:
         print(f"Error deleting database: {e}")
@@ -8,53 +8,16 @@ if __name__ == "__main__":
     import os
     import tkinter as tk
     
-    # Set up the database tables
-    def create_sales_tables():
-        import sqlite3
-        from pathlib import Path
+    # Bring the schema up to date through the migrations, as main.py does
+    def initialize_database():
+        from database.migrations import migrate
         
-        db_path = Path('./database/pharmacy.db')
-        
-        try:
-            conn = sqlite3.connect(str(db_path))
-            cursor = conn.cursor()
-            
-            # Create sales table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS sales (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    sale_date DATETIME NOT NULL,
-                    subtotal REAL DEFAULT 0,
-                    discount_percentage REAL DEFAULT 0,
-                    discount_amount REAL DEFAULT 0,
-                    vat_rate REAL DEFAULT 0.15,
-                    vat_amount REAL DEFAULT 0,
-                    total REAL DEFAULT 0,
-                    status TEXT DEFAULT 'completed'
-                )
-            """)
-            
-            # Create sale_items table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS sale_items (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    sale_id INTEGER NOT NULL,
-                    medicine_id INTEGER NOT NULL,
-                    quantity INTEGER NOT NULL,
-                    unit_price REAL DEFAULT 0,
-                    total_price REAL DEFAULT 0
-                )
-            """)
-            
-            conn.commit()
-            print("Sales tables created successfully")
-        except Exception as e:
-            print(f"Error creating sales tables: {e}")
-        finally:
-            conn.close()
+        update_result, update_message = migrate()
+        if not update_result:
+            print(f"تحذير: {update_message}")
     
-    # Create database tables
-    create_sales_tables()
+    # Create or upgrade the database tables
+    initialize_database()
     
     # Create the main window
     root = tk.Tk()
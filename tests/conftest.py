@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.db_connection import DatabaseConnection
+from database.migrations import migrate
+from database.lots import receive_lot
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A database migrated to the current schema, as an absolute path."""
+    path = str(tmp_path / 'pharmacy.db')
+    success, message = migrate(DatabaseConnection(path), progress=lambda *args: None)
+    assert success, message
+    return path
+
+
+@pytest.fixture
+def add_medicine(db_path):
+    """add_medicine(lots, price=10) -> medicine id; lots are (expiry_date, quantity) pairs received in order."""
+    def add(lots, price=10):
+        with DatabaseConnection(db_path).checkout() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO medicines (name, price, quantity, expiry_date) VALUES (?, ?, 0, ?)",
+                           (f"Medicine {len(lots)}", price, lots[0][0]))
+            medicine_id = cursor.lastrowid
+            for expiry_date, quantity in lots:
+                receive_lot(cursor, medicine_id, quantity, expiry_date)
+            conn.commit()
+        return medicine_id
+    return add
@@ -0,0 +1,51 @@
+"""Stock reservation at checkout: concurrent lanes cannot oversell a medicine."""
+import threading
+
+from database.db_connection import DatabaseConnection
+from logic.billing import BillingSystem
+
+LANES = 8
+SALES_PER_LANE = 4
+
+
+def test_concurrent_lanes_cannot_oversell(db_path, add_medicine):
+    medicine_id = add_medicine([('2030-01-01', 10)])
+    results = []
+    results_lock = threading.Lock()
+    barrier = threading.Barrier(LANES)
+
+    def lane():
+        billing = BillingSystem(None, db_path)
+        barrier.wait()
+        for _ in range(SALES_PER_LANE):
+            success, _ = billing.create_sale([{'medicine_id': medicine_id, 'quantity': 1}])
+            with results_lock:
+                results.append(success)
+
+    threads = [threading.Thread(target=lane) for _ in range(LANES)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count(True) == 10
+    with DatabaseConnection(db_path).checkout() as conn:
+        assert conn.execute("SELECT quantity FROM medicines WHERE id = ?", (medicine_id,)).fetchone()[0] == 0
+        sold = conn.execute("SELECT SUM(quantity) FROM sale_items WHERE medicine_id = ?", (medicine_id,)).fetchone()[0]
+        assert sold == 10
+        assert conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0] == 10
+
+
+def test_short_line_rolls_back_the_whole_sale(db_path, add_medicine):
+    plenty = add_medicine([('2030-01-01', 50)])
+    scarce = add_medicine([('2030-01-01', 1)])
+    success, _ = BillingSystem(None, db_path).create_sale([
+        {'medicine_id': plenty, 'quantity': 5},
+        {'medicine_id': scarce, 'quantity': 2},
+    ])
+
+    assert not success
+    with DatabaseConnection(db_path).checkout() as conn:
+        quantities = dict(conn.execute("SELECT id, quantity FROM medicines"))
+        assert quantities == {plenty: 50, scarce: 1}
+        assert conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0] == 0
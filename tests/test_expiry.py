@@ -0,0 +1,56 @@
+"""Lot-level expiry alerts: what InventoryManager reports, and how sales reach the tracker."""
+from datetime import date, timedelta
+
+import pytest
+
+import logic.catalog
+import logic.expiry
+import logic.stock_alerts
+from database.db_connection import DatabaseConnection
+from logic.billing import BillingSystem
+from logic.catalog import MedicineCatalog
+from logic.expiry import get_expiry_tracker
+from logic.inventory import InventoryManager
+
+
+def in_days(days):
+    return (date.today() + timedelta(days=days)).isoformat()
+
+
+@pytest.fixture
+def inventory(db_path, monkeypatch):
+    """An InventoryManager whose shared catalog and trackers read the test database."""
+    monkeypatch.setattr(logic.catalog, '_catalog', MedicineCatalog(db_path))
+    monkeypatch.setattr(logic.expiry, '_tracker', None)
+    monkeypatch.setattr(logic.stock_alerts, '_tracker', None)
+    manager = InventoryManager(None)
+    manager.db = DatabaseConnection(db_path)
+    return manager
+
+
+def test_expiry_alerts_count_in_stock_lots_of_active_medicines(db_path, add_medicine, inventory):
+    soon = add_medicine([(in_days(10), 5), (in_days(200), 5)])
+    sold_out = add_medicine([(in_days(10), 2), (in_days(300), 5)])
+    inactive = add_medicine([(in_days(10), 5)])
+    expired = add_medicine([(in_days(-5), 3)])
+    with DatabaseConnection(db_path).checkout() as conn:
+        conn.execute("UPDATE medicines SET is_active = 0 WHERE id = ?", (inactive,))
+        conn.commit()
+    assert BillingSystem(None, db_path).create_sale([{'medicine_id': sold_out, 'quantity': 2}])[0]
+
+    assert [row[0] for row in inventory.get_expiring_items(30)] == [expired, soon]
+    assert [row[0] for row in inventory.check_expiry_alerts(30)] == [soon]
+
+
+def test_sales_are_applied_to_the_tracker_without_reading_lots(db_path, add_medicine, inventory, monkeypatch):
+    medicine_id = add_medicine([(in_days(10), 3), (in_days(20), 4)])
+    tracker = get_expiry_tracker()
+    assert [lot.quantity for lot in tracker.expiring(30)] == [3, 4]
+
+    def no_reads(*args):
+        raise AssertionError("lots re-read on the checkout path")
+    monkeypatch.setattr(tracker, '_read_lots', no_reads)
+    assert BillingSystem(None, db_path).create_sale([{'medicine_id': medicine_id, 'quantity': 5}])[0]
+
+    assert [(lot.expiry_date, lot.quantity) for lot in tracker.expiring(30)] == [(in_days(20), 2)]
+    assert tracker.buckets()[30] == (1, 2 * 10)
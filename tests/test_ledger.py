@@ -0,0 +1,53 @@
+"""Stock ledger round trip: every stock change is a movement, and stock can be rebuilt from them."""
+from database.db_connection import DatabaseConnection
+from database.ledger import verify_stock, rebuild_stock, checkpoint_ledger, LedgerWriter
+from database.lots import set_stock, write_off_expired
+from logic.billing import BillingSystem
+
+
+def stock(conn):
+    medicines = dict(conn.execute("SELECT id, quantity FROM medicines"))
+    lots = dict(conn.execute("SELECT id, quantity FROM medicine_lots"))
+    return medicines, lots
+
+
+def test_ledger_matches_stock_after_sale_count_and_write_off(db_path, add_medicine):
+    counted = add_medicine([('2030-01-01', 20)])
+    expiring = add_medicine([('2020-01-01', 4), ('2030-01-01', 6)])
+    assert BillingSystem(None, db_path).create_sale([{'medicine_id': counted, 'quantity': 3},
+                                                     {'medicine_id': expiring, 'quantity': 2}])[0]
+
+    with DatabaseConnection(db_path).checkout() as conn:
+        cursor = conn.cursor()
+        with LedgerWriter(cursor, 'tester', 'جرد') as ledger:
+            set_stock(cursor, counted, 12, ledger)
+            write_off_expired(cursor, [expiring], ledger, today='2025-01-01')
+        conn.commit()
+
+        assert verify_stock(cursor) == []
+        checkpoint_ledger(cursor)
+        conn.commit()
+        assert verify_stock(cursor) == []
+        medicines, _ = stock(conn)
+        # Sold 2 from the expired lot first, then the other 2 in it written off
+        assert medicines == {counted: 12, expiring: 6}
+
+
+def test_rebuild_stock_reproduces_the_balances(db_path, add_medicine):
+    first = add_medicine([('2030-01-01', 8), ('2031-01-01', 5)])
+    second = add_medicine([('2030-03-01', 7)])
+    assert BillingSystem(None, db_path).create_sale([{'medicine_id': first, 'quantity': 10}])[0]
+
+    with DatabaseConnection(db_path).checkout() as conn:
+        cursor = conn.cursor()
+        expected = stock(conn)
+        # Stock written behind the ledger's back
+        cursor.execute("UPDATE medicines SET quantity = 999 WHERE id = ?", (second,))
+        cursor.execute("UPDATE medicine_lots SET quantity = 0 WHERE medicine_id = ?", (first,))
+        conn.commit()
+        assert [row[0] for row in verify_stock(cursor)] == [second]
+
+        assert rebuild_stock(cursor, progress=lambda *args: None) == [second]
+        conn.commit()
+        assert stock(conn) == expected
+        assert verify_stock(cursor) == []
@@ -0,0 +1,29 @@
+"""First-expiry-first-out allocation of sales to medicine lots."""
+from database.db_connection import DatabaseConnection
+from logic.billing import BillingSystem
+
+
+def test_sale_larger_than_earliest_lot_splits_fefo(db_path, add_medicine):
+    # Received out of expiry order, so allocation can't follow insertion order
+    medicine_id = add_medicine([('2030-06-01', 5), ('2030-01-01', 3), ('2031-01-01', 10)])
+
+    success, _ = BillingSystem(None, db_path).create_sale([{'medicine_id': medicine_id, 'quantity': 6}])
+
+    assert success
+    with DatabaseConnection(db_path).checkout() as conn:
+        lots = dict(conn.execute("SELECT expiry_date, quantity FROM medicine_lots WHERE medicine_id = ?",
+                                 (medicine_id,)))
+        assert lots == {'2030-01-01': 0, '2030-06-01': 2, '2031-01-01': 10}
+
+        allocated = conn.execute('''
+            SELECT l.expiry_date, sil.quantity
+            FROM sale_item_lots sil
+            JOIN medicine_lots l ON l.id = sil.lot_id
+            WHERE sil.medicine_id = ?
+            ORDER BY l.expiry_date
+        ''', (medicine_id,)).fetchall()
+        assert allocated == [('2030-01-01', 3), ('2030-06-01', 3)]
+
+        quantity, expiry_date = conn.execute("SELECT quantity, expiry_date FROM medicines WHERE id = ?",
+                                             (medicine_id,)).fetchone()
+        assert (quantity, expiry_date) == (12, '2030-06-01')
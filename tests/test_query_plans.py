@@ -0,0 +1,39 @@
+"""
+EXPLAIN QUERY PLAN regression test for the shared sales queries.
+
+Fails when a migration drops an index, or a query in database.queries is
+changed so that it no longer uses one, and the query falls back to
+scanning a whole table.
+"""
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.db_connection import DatabaseConnection
+from database.migrations import migrate
+from database.queries import find_full_scans
+from benchmarks.data_generator import generate
+
+
+def plan_problems(db_path):
+    db = DatabaseConnection(db_path)
+    conn = db.connect()
+    try:
+        return find_full_scans(conn)
+    finally:
+        db.close()
+
+
+def test_migrated_schema_has_no_full_scans(tmp_path):
+    db_path = str(tmp_path / 'plans.db')
+    success, message = migrate(DatabaseConnection(db_path), progress=lambda *args: None)
+    assert success, message
+    assert plan_problems(db_path) == {}
+
+
+def test_analyzed_data_has_no_full_scans(tmp_path):
+    # With sqlite_stat1 filled in the planner weighs the indexes against real row counts
+    db_path = str(tmp_path / 'plans.db')
+    generate(db_path, medicines=200, customers=50, years=1, sales_per_day=20, progress=lambda *args: None)
+    assert plan_problems(db_path) == {}
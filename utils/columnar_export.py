@@ -0,0 +1,283 @@
+"""
+Columnar (Parquet or Feather) extracts of sales, sale items and medicines.
+
+Sales and sale items are written as one file per sale day under
+<export_dir>/<table>/sale_day=YYYY-MM-DD/, so BI tools can read them as a
+partitioned dataset. An incremental run starts from the newest partition
+already on disk: that day is rewritten (it may have been exported while
+still open) and only later days are added. Medicines are a snapshot and
+are rewritten on every run.
+
+Rows are read in chunks with pandas, converted to fixed dtypes (datetime,
+category, int32) and written batch by batch through pyarrow, so memory
+stays bounded however much history there is. Every file is written under
+a temporary name and moved into place once complete.
+
+Run `python -m utils.columnar_export <export_dir> [--format feather] [--full]`
+for the nightly extract.
+"""
+import os
+import shutil
+from database.db_connection import DatabaseConnection
+from utils.csv_export import ExportCancelled
+
+try:
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.feather
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pd = pa = None
+
+COLUMNAR_FORMATS = {'parquet': '.parquet', 'feather': '.feather'}
+# Rows read from SQLite per chunk
+COLUMNAR_CHUNK_SIZE = 50000
+PARTITION_PREFIX = 'sale_day='
+
+SALE_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# table -> (query, partitioned by sale day, {column: dtype})
+# Partitioned queries select the sale day first and must be ordered by it.
+EXPORT_TABLES = {
+    'sales': ('''
+        SELECT date(sale_date) AS sale_day, id, sale_date, subtotal, discount_percentage,
+               discount_amount, vat_rate, vat_amount, total, status
+        FROM sales
+        WHERE sale_date >= ?
+        ORDER BY sale_date, id
+    ''', True, {
+        'id': 'int32',
+        'sale_date': 'datetime',
+        'subtotal': 'float64',
+        'discount_percentage': 'float64',
+        'discount_amount': 'float64',
+        'vat_rate': 'float64',
+        'vat_amount': 'float64',
+        'total': 'float64',
+        'status': 'category',
+    }),
+    'sale_items': ('''
+        SELECT date(s.sale_date) AS sale_day, si.id, si.sale_id, si.medicine_id, s.sale_date,
+               si.quantity, si.unit_price, si.total_price
+        FROM sales s
+        JOIN sale_items si ON si.sale_id = s.id
+        WHERE s.sale_date >= ?
+        ORDER BY s.sale_date, s.id, si.id
+    ''', True, {
+        'id': 'int32',
+        'sale_id': 'int32',
+        'medicine_id': 'int32',
+        'sale_date': 'datetime',
+        'quantity': 'int32',
+        'unit_price': 'float64',
+        'total_price': 'float64',
+    }),
+    'medicines': ('''
+        SELECT id, name, barcode, category, manufacturer, price, quantity,
+               min_stock_level, expiry_date, location, is_active
+        FROM medicines
+        ORDER BY id
+    ''', False, {
+        'id': 'int32',
+        'name': 'string',
+        'barcode': 'string',
+        'category': 'category',
+        'manufacturer': 'category',
+        'price': 'float64',
+        'quantity': 'int32',
+        'min_stock_level': 'int32',
+        'expiry_date': 'date',
+        'location': 'category',
+        'is_active': 'bool',
+    }),
+}
+
+_ARROW_TYPES = {
+    'int32': lambda: pa.int32(),
+    'float64': lambda: pa.float64(),
+    'string': lambda: pa.string(),
+    'bool': lambda: pa.bool_(),
+    'datetime': lambda: pa.timestamp('s'),
+    'date': lambda: pa.timestamp('s'),
+    # Categories are dictionary encoded; a fixed index type keeps every chunk on one schema
+    'category': lambda: pa.dictionary(pa.int32(), pa.string()),
+}
+
+
+def check_columnar_support():
+    """Raise ImportError if pandas or pyarrow is missing."""
+    if pd is None:
+        raise ImportError("Columnar export needs pandas and pyarrow (pip install pandas pyarrow)")
+
+
+def arrow_schema(dtypes):
+    return pa.schema([(column, _ARROW_TYPES[dtype]()) for column, dtype in dtypes.items()])
+
+
+def convert_chunk(frame, dtypes, schema):
+    """Apply the export dtypes to a chunk read from SQLite and return an Arrow table."""
+    frame = frame[list(dtypes)].copy()
+    for column, dtype in dtypes.items():
+        values = frame[column]
+        if dtype == 'datetime':
+            frame[column] = pd.to_datetime(values, format=SALE_DATE_FORMAT, errors='coerce')
+        elif dtype == 'date':
+            frame[column] = pd.to_datetime(values, format='%Y-%m-%d', errors='coerce')
+        elif dtype == 'int32':
+            # NULLs (e.g. a missing min_stock_level) become 0 rather than floats
+            frame[column] = values.fillna(0).astype('int32')
+        elif dtype == 'bool':
+            frame[column] = values.fillna(0).astype(bool)
+        elif dtype in ('string', 'category'):
+            frame[column] = values.astype('string').astype(dtype)
+        else:
+            frame[column] = values.astype(dtype)
+    return pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+
+
+class _TableFile:
+    """One output file written batch by batch under a temporary name."""
+    def __init__(self, path, schema, fmt):
+        self.path = path
+        self.temp_path = f"{path}.part"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if fmt == 'parquet':
+            self._writer = pa.parquet.ParquetWriter(self.temp_path, schema, compression='snappy')
+        else:
+            self._sink = pa.OSFile(self.temp_path, 'wb')
+            self._writer = pa.ipc.new_file(self._sink, schema, options=pa.ipc.IpcWriteOptions(compression='lz4'))
+        self.rows = 0
+
+    def write(self, table):
+        self._writer.write_table(table)
+        self.rows += table.num_rows
+
+    def commit(self):
+        self._close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        self._close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            sink = getattr(self, '_sink', None)
+            if sink is not None:
+                sink.close()
+
+
+def existing_partitions(table_dir):
+    """Sale days already exported for a table, oldest first."""
+    if not os.path.isdir(table_dir):
+        return []
+    return sorted(name[len(PARTITION_PREFIX):] for name in os.listdir(table_dir)
+                  if name.startswith(PARTITION_PREFIX))
+
+
+def export_table(conn, export_dir, table, fmt='parquet', since=None, progress=print,
+                 cancel_event=None, chunk_size=COLUMNAR_CHUNK_SIZE):
+    """
+    Write one table to export_dir. Returns the number of rows written.
+
+    For partitioned tables only sale days from since (YYYY-MM-DD) onwards
+    are written; since=None writes the whole history.
+    """
+    check_columnar_support()
+    query, partitioned, dtypes = EXPORT_TABLES[table]
+    schema = arrow_schema(dtypes)
+    extension = COLUMNAR_FORMATS[fmt]
+    table_dir = os.path.join(export_dir, table)
+    params = (since or '',) if partitioned else ()
+
+    written = 0
+    current_day = None
+    output = None
+    try:
+        for frame in pd.read_sql_query(query, conn, params=params, chunksize=chunk_size):
+            if cancel_event is not None and cancel_event.is_set():
+                raise ExportCancelled()
+            if not partitioned:
+                if output is None:
+                    output = _TableFile(os.path.join(table_dir, f"{table}{extension}"), schema, fmt)
+                output.write(convert_chunk(frame, dtypes, schema))
+            else:
+                # Rows arrive ordered by day, so each day's file is finished before the next opens
+                for day, rows in frame.groupby('sale_day', sort=False):
+                    if day != current_day:
+                        if output is not None:
+                            output.commit()
+                        current_day = day
+                        output = _TableFile(os.path.join(table_dir, f"{PARTITION_PREFIX}{day}",
+                                                         f"part-0{extension}"), schema, fmt)
+                    output.write(convert_chunk(rows, dtypes, schema))
+            written += len(frame)
+            progress(f"Exporting {table}", written, None)
+
+        if output is None and not partitioned:
+            # An empty snapshot is still a valid file
+            output = _TableFile(os.path.join(table_dir, f"{table}{extension}"), schema, fmt)
+        if output is not None:
+            output.commit()
+            output = None
+        return written
+    finally:
+        if output is not None:
+            output.abort()
+
+
+def export_columnar(export_dir, fmt='parquet', full=False, tables=tuple(EXPORT_TABLES),
+                    db=None, progress=print, cancel_event=None):
+    """
+    Export the tables in columnar format. Returns (success, message).
+
+    Unless full is set, partitioned tables continue from their newest
+    exported sale day. A full export removes the old partitions first.
+    """
+    if fmt not in COLUMNAR_FORMATS:
+        return False, f"صيغة التصدير غير مدعومة: {fmt}"
+    try:
+        check_columnar_support()
+    except ImportError as e:
+        return False, str(e)
+
+    db = db or DatabaseConnection()
+    try:
+        counts = []
+        with db.checkout() as conn:
+            for table in tables:
+                _, partitioned, _ = EXPORT_TABLES[table]
+                table_dir = os.path.join(export_dir, table)
+                since = None
+                if partitioned:
+                    if full:
+                        shutil.rmtree(table_dir, ignore_errors=True)
+                    else:
+                        days = existing_partitions(table_dir)
+                        since = days[-1] if days else None
+                rows = export_table(conn, export_dir, table, fmt, since, progress, cancel_event)
+                counts.append(f"{table}: {rows}")
+        return True, f"تم تصدير البيانات إلى {export_dir} ({', '.join(counts)})"
+    except ExportCancelled:
+        return False, "تم إلغاء التصدير"
+    except Exception as e:
+        print(f"Error exporting columnar data: {e}")
+        return False, f"حدث خطأ أثناء تصدير البيانات: {str(e)}"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export sales, sale items and medicines for BI tools")
+    parser.add_argument("export_dir")
+    parser.add_argument("--format", choices=sorted(COLUMNAR_FORMATS), default="parquet")
+    parser.add_argument("--full", action="store_true", help="rewrite the whole history")
+    args = parser.parse_args()
+
+    success, message = export_columnar(args.export_dir, args.format, args.full)
+    print(message)
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,65 @@
+"""
+Streaming CSV export for reports.
+
+Rows are read from the cursor with fetchmany() and written in batches
+through a buffered file, so memory stays flat however many rows a report
+has. The file is written under a temporary name and moved into place at
+the end; a cancelled or failed export leaves nothing behind.
+"""
+import csv
+import os
+
+# Rows fetched from SQLite per batch
+EXPORT_BATCH_SIZE = 2000
+# Write buffer for the output file
+EXPORT_BUFFER_SIZE = 1024 * 1024
+
+
+class ExportCancelled(Exception):
+    """Raised when an export is cancelled part way through."""
+
+
+def stream_csv(cursor, path, header, query, params=(), format_row=None, footer=None,
+               progress=None, cancel_event=None, total=None, batch_size=EXPORT_BATCH_SIZE,
+               encoding='utf-8-sig'):
+    """
+    Run query and write its rows to path as CSV. Returns the number of rows written.
+
+    format_row(row) returns the CSV row, or None to skip it; it can also
+    accumulate totals for footer(), which returns the rows written after
+    the data. progress(done, total) is called after every batch; total is
+    whatever the caller passed, since counting up front costs a query.
+    Setting cancel_event (a threading.Event) stops the export with
+    ExportCancelled.
+    """
+    temp_path = f"{path}.part"
+    written = 0
+    try:
+        with open(temp_path, 'w', newline='', encoding=encoding, buffering=EXPORT_BUFFER_SIZE) as f:
+            writer = csv.writer(f)
+            if header:
+                writer.writerow(header)
+
+            cursor.execute(query, params)
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise ExportCancelled()
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                if format_row is not None:
+                    rows = [line for line in map(format_row, rows) if line is not None]
+                writer.writerows(rows)
+                written += len(rows)
+                if progress is not None:
+                    progress(written, total)
+
+            if footer is not None:
+                writer.writerows(footer())
+
+        os.replace(temp_path, path)
+        return written
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
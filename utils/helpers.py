@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import locale
 
 def format_date(date_str):
@@ -75,37 +75,13 @@ def parse_date(date_str):
     # If no format matches
     return False, None
 
-def log_stock_update(db_connection, medicine_id, old_quantity, new_quantity, username, reason=None):
-    """Record a stock update in the database for audit purposes."""
-    conn = db_connection.connect()
-    cursor = conn.cursor()
+def sale_date_range(start_date, end_date=None):
+    """Return a half-open (start, end) pair of YYYY-MM-DD strings covering start_date..end_date."""
+    end_date = end_date or start_date
+    end_obj = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+    return start_date, end_obj.strftime('%Y-%m-%d')
 
-    try:
-        # First check if stock_updates table exists, if not create it
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS stock_updates (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                medicine_id INTEGER NOT NULL,
-                old_quantity INTEGER NOT NULL,
-                new_quantity INTEGER NOT NULL,
-                update_date DATETIME NOT NULL,
-                username TEXT NOT NULL,
-                reason TEXT,
-                FOREIGN KEY (medicine_id) REFERENCES medicines (id)
-            )
-        ''')
-
-        # Insert the log entry
-        cursor.execute('''
-            INSERT INTO stock_updates (
-                medicine_id, old_quantity, new_quantity, update_date, username, reason
-            ) VALUES (?, ?, ?, datetime('now'), ?, ?)
-        ''', (medicine_id, old_quantity, new_quantity, username, reason))
-
-        conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error logging stock update: {e}")
-        return False
-    finally:
-        db_connection.close()
+def month_date_range(year, month):
+    """Return a half-open (start, end) pair of YYYY-MM-DD strings for a whole month."""
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return f"{year:04d}-{month:02d}-01", f"{next_year:04d}-{next_month:02d}-01"